@@ -1,4 +1,6 @@
 import json
+import os
+import textwrap
 from typing import Dict, List, Any
 
 
@@ -13,6 +15,49 @@ class Writer:
             print(f"'{filename=}' not found...")
             return False
 
+    @staticmethod
+    def append_ndjson(data: Any, filename: str, fsync: bool = True) -> bool:
+        """Appends data as one json line, used to save every batch as soon as it is parsed"""
+        try:
+            with open(filename, "a", encoding="utf-8") as file:
+                file.write(json.dumps(data, ensure_ascii=False) + "\n")
+                file.flush()
+                if fsync:
+                    os.fsync(file.fileno())
+                return True
+        except FileNotFoundError:
+            print(f"'{filename=}' not found...")
+            return False
+
+    @staticmethod
+    def compact_ndjson(ndjson_filename: str, json_filename: str, remove: bool = True) -> bool:
+        """
+        Streams every line of ndjson file as one element of a json list
+        (same output as write_to_json) without loading all of them into memory
+        """
+        try:
+            written: int = 0
+            with open(ndjson_filename, "r", encoding="utf-8") as source, open(json_filename, "w", encoding="utf-8") as output:
+                output.write("[")
+                for line in source:
+                    try:
+                        data = json.loads(line)
+                    except json.JSONDecodeError:
+                        # last line can be cut in half by a crash
+                        print(f"Skipping broken line in '{ndjson_filename=}'...")
+                        continue
+                    output.write(",\n" if written else "\n")
+                    output.write(textwrap.indent(json.dumps(data, indent=4, ensure_ascii=False), "    "))
+                    written += 1
+                output.write("\n]" if written else "]")
+        except FileNotFoundError:
+            print(f"'{ndjson_filename=}' not found...")
+            return False
+
+        if remove:
+            os.remove(ndjson_filename)
+        return True
+
     @staticmethod
     def load_from_json(filename: str) -> Dict[str, Any] | None:
         try:
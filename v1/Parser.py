@@ -5,18 +5,36 @@ from datetime import datetime
 
 import asyncio
 
-import re
 import random
+import multiprocessing
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
 from bs4 import BeautifulSoup
 
 from FileWriter import Writer
+import SharedModules
+SharedModules.use_v2_modules()
+from PageCache import PageCache
+from BrochureParsing import parse_brochures
+from DateRange import parse_date_range
 from typing import List, Tuple, Dict, Any, Optional
 
 
 class Parser:
-    def __init__(self) -> None:
+    def __init__(self, page_cache: Optional[PageCache] = None, parse_mode: str = "thread", parse_workers: int = 2,
+                 parser_backend: str = "html.parser", parse_grid_only: bool = False) -> None:
         self.__final_json: str = "responses/parsed_page.json"
         self.__link: str = "https://www.prospektmaschine.de/hypermarkte/"
+        self.page_cache = page_cache
+
+        self.parser_backend: str = parser_backend
+        self.parse_grid_only: bool = parse_grid_only
+        self.parse_executor: Optional[Executor] = None
+        if parse_mode == "thread":
+            self.parse_executor = ThreadPoolExecutor(max_workers=parse_workers, thread_name_prefix="parse")
+        elif parse_mode == "process":
+            self.parse_executor = ProcessPoolExecutor(max_workers=parse_workers, mp_context=multiprocessing.get_context("spawn"))
+        elif parse_mode != "inline":
+            raise ValueError(f"Unknown parse mode: {parse_mode}")
 
     @property
     def final_json(self):
@@ -24,7 +42,8 @@ class Parser:
 
     def get_leftside_menu_shop_urls(self) -> List[Dict[str, str]]:
         """Returns the list of all the shops inside the side panel with info like url and shop's name"""
-        html: str = self.__send_request_selenium(self.__link, 1)
+        html: str = self.__get_cached(self.__link) or self.__send_request_selenium(self.__link, 1)
+        self.__store_cached(self.__link, html)
         
         soup: BeautifulSoup = BeautifulSoup(html, 'html.parser')
         
@@ -43,8 +62,22 @@ class Parser:
 
     async def send_request_async(self, link: str, load_time_s: int = 4):
         """Sends async request with random time interval to avoid oversaturation of the requests"""
+        # fresh pages from the cache don't need neither delay nor browser
+        cached: Optional[str] = self.__get_cached(link)
+        if cached:
+            return cached
+
         await asyncio.sleep(random.uniform(2, 5))
-        return await asyncio.to_thread(self.__send_request_selenium, link, load_time_s)
+        html: str = await asyncio.to_thread(self.__send_request_selenium, link, load_time_s)
+        self.__store_cached(link, html)
+        return html
+
+    def __get_cached(self, link: str) -> Optional[str]:
+        return self.page_cache.get_fresh(link) if self.page_cache else None
+
+    def __store_cached(self, link: str, html: str) -> None:
+        if self.page_cache and html:
+            self.page_cache.store(link, html, "browser")
 
     def __send_request_selenium(self, link: str, load_time_s: int) -> str:
         """Synchronous function to get html from dynamic websites using selenium"""
@@ -69,60 +102,19 @@ class Parser:
         finally:
             driver.quit()
 
-    async def parse_info(self, html: str, shop_name: str) -> List[Dict[str, str]]:  
-        soup: BeautifulSoup = BeautifulSoup(html, "html.parser")
-
-        brochures_grid = soup.find("div", attrs={"class": "page-body"}).find("div", attrs={"class": "letaky-grid"})
-        brochures = brochures_grid.find_all("div", attrs={"class": "brochure-thumb"})
-
-        brochures_parsed: List[Dict[str, str]] = []
-        for brochure in brochures:
-            try:
-                description_tag = brochure.find("div", attrs={"class": "letak-description"})
-                title_tag = description_tag.find("strong")
-                dates_tag = description_tag.find("small", attrs={"class": "hidden-sm"})
-                
-                image_tag = brochure.find("div", attrs={"class": "img-container"}).find("img")
-
-                if dates_tag:
-                    parsed_date: Tuple[datetime, datetime] = Parser.parse_date(dates_tag.text)
-                    valid_from: datetime = parsed_date[0]
-                    valid_to: datetime = parsed_date[1]
-
-                info = {
-                    "title": title_tag.text if title_tag else "Not found",
-                    "thumbnail": image_tag.get("src") or image_tag.get("data-src") if image_tag else "Not found",
-                    "shop_name": shop_name,
-                    "valid_from": valid_from.strftime('%m-%d-%Y') if valid_from else "Not found",
-                    "valid_to": valid_to.strftime('%m-%d-%Y') if valid_to else "Not specified",
-                    "parsed_time": datetime.now().strftime("%m-%d-%Y %H:%M:%S")
-                }
-                brochures_parsed.append(info)
-            except Exception as e:
-                print(e)
-
-        return brochures_parsed
+    async def parse_info(self, html: str, shop_name: str) -> List[Dict[str, str]]:
+        """Parsing is CPU bound, so it runs in the parse executor instead of the event loop"""
+        if self.parse_executor is None:
+            return parse_brochures(html, shop_name, self.parser_backend, self.parse_grid_only)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.parse_executor, parse_brochures, html, shop_name, self.parser_backend, self.parse_grid_only
+        )
 
     @staticmethod
     def parse_date(date: str) -> Tuple[Optional[datetime]]:
-        try:
-            # if date has smth like "von Montag 03.03.2025" inside
-            if date.find("-") == -1:
-                clean_date = re.sub(r"[^\d.]", "", date).replace(" ", "")
-                valid_from = datetime.strptime(clean_date, "%d.%m.%Y")
-                return (valid_from, None)
-            # for formats like this "03.03.2025 - 30.03.2025"
-            else:
-                date_splitted = date.replace(" ", "").split("-")
-                valid_from = datetime.strptime(date_splitted[0], "%d.%m.%Y")
-                valid_to = datetime.strptime(date_splitted[1], "%d.%m.%Y")
-                return (valid_from, valid_to)
-        except ValueError as ve:
-            print(f"Incorrect date format...: {ve}")
-            return (None, None)
-        except Exception as e:
-            print(f"Date parsing error occured...: {e}")
-            return (None, None)
+        return parse_date_range(date)
 
     @staticmethod
     def log(data: Any) -> None:
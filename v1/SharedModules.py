@@ -0,0 +1,12 @@
+import os
+import sys
+
+
+# modules used by both versions (PageCache, BrochureParsing, CrawlJournal, DateRange) exist only in v2
+V2_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "v2")
+
+
+def use_v2_modules() -> None:
+    """Puts v2 at the end of the import path, so v1 modules with the same name (main.py) still win"""
+    if V2_DIR not in sys.path:
+        sys.path.append(V2_DIR)
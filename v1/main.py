@@ -1,41 +1,119 @@
+import SharedModules
+SharedModules.use_v2_modules()
 from Parser import Parser
-from typing import Dict, List
+from typing import Dict, List, Any, Tuple, Union
 from FileWriter import Writer
+from PageCache import PageCache
+from CrawlJournal import CrawlJournal
 
+import argparse
 import asyncio
 
-BATCH_SIZE = 4
-DELAY_BETWEEN_BATCHES = 5
+FETCH_WORKERS = 4
+PARSE_WORKERS = 2
+# bounded queues between the stages, a slow stage makes the one before it wait instead of piling up pages
+QUEUE_SIZE = 8
+# shops per list of the output json (same shape as the old batches)
+WRITE_GROUP_SIZE = 4
+BATCHES_NDJSON = "responses/parsed_page.ndjson"
+JOURNAL = "responses/crawl_journal.json"
 
-async def main() -> None:
+
+async def fetch_worker(parser: Parser, fetch_queue: asyncio.Queue, parse_queue: asyncio.Queue, write_queue: asyncio.Queue) -> None:
+    while (shop := await fetch_queue.get()) is not None:
+        try:
+            html: str = await parser.send_request_async(shop["link"])
+        except Exception as e:
+            # e.g. the driver couldn't start, the shop goes to the writer as failed and the worker keeps going,
+            # otherwise the frontier and the stop signals would wait for dead fetchers forever
+            await write_queue.put((shop, e))
+            continue
+        await parse_queue.put((shop, html))
+
+
+async def parse_worker(parser: Parser, parse_queue: asyncio.Queue, write_queue: asyncio.Queue) -> None:
+    while (item := await parse_queue.get()) is not None:
+        shop, html = item
+        try:
+            parsed: Union[List[Dict[str, Any]], Exception] = await parser.parse_info(html, shop["shop_name"])
+        except Exception as e:
+            parsed = e
+        await write_queue.put((shop, parsed))
+
+
+async def writer(journal: CrawlJournal, write_queue: asyncio.Queue, shop_count: int, page_cache: PageCache) -> None:
+    group: List[List[Dict[str, Any]]] = []
+    written: int = 0
+
+    while (item := await write_queue.get()) is not None:
+        shop, parsed = item
+        if isinstance(parsed, Exception) or not parsed:
+            journal.mark_failed(shop["link"], shop["shop_name"], str(parsed) if parsed else "no brochures received")
+        else:
+            journal.mark_done(shop["link"], shop["shop_name"], parsed)
+
+        # every group is appended as soon as it is full, so a crash doesn't lose the whole run
+        group.append(journal.brochures(shop["link"]))
+        written += 1
+        if len(group) == WRITE_GROUP_SIZE:
+            Writer.append_ndjson(group, BATCHES_NDJSON)
+            group = []
+        print(f"\n------Shop {shop['shop_name']} completed ({written}/{shop_count})! Cache {page_cache.stats()}")
+
+    if group:
+        Writer.append_ndjson(group, BATCHES_NDJSON)
+
+
+async def main(resume: bool) -> None:
     """
     JSON output is that it has list for every shop (with info for every card)
-    and then list that contains BATCH_SIZE amount of these shops in it
-    (can be flatten with itertools.chain(...) method later if needed)
+    and then list that contains WRITE_GROUP_SIZE amount of these shops in it
+    (can be flatten with itertools.chain(...) method later if needed).
+    Shops flow through frontier -> fetch workers -> parse workers -> writer, so one slow shop
+    holds only its own fetch worker instead of the whole batch
     """
-    parser: Parser = Parser()
+    page_cache: PageCache = PageCache("responses/page_cache")
+    parser: Parser = Parser(page_cache, parse_workers=PARSE_WORKERS)
 
     shop_data: List[Dict[str, str]] = parser.get_leftside_menu_shop_urls()
-    shop_count: int = len(shop_data)
 
-    final_result = []
-    for i in range(0, shop_count, BATCH_SIZE):
-        batch = shop_data[i: i + BATCH_SIZE]
-        
-        tasks = [parser.send_request_async(shop["link"]) for shop in batch]
-        responses = await asyncio.gather(*tasks)
+    journal: CrawlJournal = CrawlJournal(JOURNAL, resume)
+    pending: List[Dict[str, str]] = journal.start(shop_data)
 
-        parse_tasks = [parser.parse_info(html, shop["shop_name"]) for html, shop in zip(responses, batch)]
-        parsed_results = await asyncio.gather(*parse_tasks)
+    open(BATCHES_NDJSON, "w").close()
+    # shops finished by the previous run are taken from the journal
+    done: List[Dict[str, str]] = [shop for shop in shop_data if journal.is_done(shop["link"])]
+    for i in range(0, len(done), WRITE_GROUP_SIZE):
+        Writer.append_ndjson([journal.brochures(shop["link"]) for shop in done[i: i + WRITE_GROUP_SIZE]], BATCHES_NDJSON)
 
-        final_result.append(parsed_results)
+    fetch_queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    parse_queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    write_queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
 
-        print(f"\n------Group {i // BATCH_SIZE + 1} from ~{shop_count // BATCH_SIZE} completed! Waiting {DELAY_BETWEEN_BATCHES}s to start another one...")
-        await asyncio.sleep(DELAY_BETWEEN_BATCHES)
+    fetchers = [asyncio.create_task(fetch_worker(parser, fetch_queue, parse_queue, write_queue)) for _ in range(FETCH_WORKERS)]
+    parsers = [asyncio.create_task(parse_worker(parser, parse_queue, write_queue)) for _ in range(PARSE_WORKERS)]
+    writer_task = asyncio.create_task(writer(journal, write_queue, len(pending), page_cache))
 
-    
-    Writer.write_to_json(final_result, parser.final_json)
+    # frontier, blocks while fetch workers are busy
+    for shop in pending:
+        await fetch_queue.put(shop)
+
+    # stages are stopped one after another, each one drains its queue first
+    stops: List[Tuple[asyncio.Queue, list]] = [(fetch_queue, fetchers), (parse_queue, parsers), (write_queue, [writer_task])]
+    for queue, tasks in stops:
+        for _ in tasks:
+            await queue.put(None)
+        await asyncio.gather(*tasks)
+
+    page_cache.save()
+    if parser.parse_executor:
+        parser.parse_executor.shutdown()
+    Writer.compact_ndjson(BATCHES_NDJSON, parser.final_json)
     print("\n\nParsed succesfully...\n\n")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--resume", action="store_true", help="skip shops finished by the previous (interrupted) run")
+    args = arg_parser.parse_args()
+
+    asyncio.run(main(args.resume))
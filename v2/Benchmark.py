@@ -0,0 +1,349 @@
+"""
+Offline benchmarks of the crawl pipeline against recorded fixtures.
+
+    python Benchmark.py record --corpus ./fixtures [--limit 20] [--static]
+    python Benchmark.py run --corpus ./fixtures [--latency-ms 50 200] [--error-rate 0.02] [--compare bench_results/<old>.json]
+    python Benchmark.py startup --corpus ./fixtures [--repeats 5]
+"""
+import logging
+
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import resource
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime
+
+from typing import List, Dict, Any, Optional, Tuple
+
+from bs4 import BeautifulSoup
+
+from FixtureServer import FixtureCorpus, FixtureServer, record_fixtures
+from BrochureParsing import BACKENDS, NoGridError, parse_brochures
+from RateLimiter import RateLimiter
+from LogConfig import configure_logging
+from ParserV2 import Parser
+from DateRange import _parse_date_range
+
+
+logger = logging.getLogger(__name__)
+
+MAIN: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+# modules a parse / export only start should not pay for
+HEAVY_MODULES: Tuple[str, ...] = ("selenium", "webdriver_manager", "requests", "bs4")
+
+
+def percentile(values: List[float], share: float) -> float:
+    ordered: List[float] = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))] if ordered else 0.0
+
+
+def timings_summary(timings_s: List[float]) -> Dict[str, float]:
+    return {
+        "runs": len(timings_s),
+        "p50_ms": round(statistics.median(timings_s) * 1000, 3) if timings_s else 0.0,
+        "p95_ms": round(percentile(timings_s, 0.95) * 1000, 3),
+        "max_ms": round(max(timings_s, default=0.0) * 1000, 3)
+    }
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KB on linux and in bytes on macOS
+    peak: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def unlimited_parser(site_url: str, **options) -> Parser:
+    """Parser without browser and without pacing, so only our own code is measured"""
+    return Parser(
+        site_url=site_url, use_browser=False, page_cache=None,
+        rate_limiter=RateLimiter(rate_per_min=1e9, max_rate_per_min=1e9, burst=1e6), **options
+    )
+
+
+def bench_sidebar(server: FixtureServer, repeats: int = 20) -> Dict[str, Any]:
+    parser: Parser = unlimited_parser(server.base_url, parse_mode="inline")
+    timings: List[float] = []
+    shops: int = 0
+
+    for _ in range(repeats):
+        start: float = time.perf_counter()
+        shops = len(parser.get_leftside_shop_list())
+        timings.append(time.perf_counter() - start)
+
+    return {"shops": shops, **timings_summary(timings)}
+
+
+def bench_parse_info(corpus: FixtureCorpus, repeats: int = 3) -> Dict[str, Any]:
+    pages: Dict[str, str] = {shop_name: corpus.read(path) for shop_name, path in corpus.shop_pages().items()}
+    total_mb: float = sum(len(html.encode("utf-8")) for html in pages.values()) / (1024 * 1024)
+    results: Dict[str, Any] = {"pages": len(pages), "total_mb": round(total_mb, 3)}
+
+    variants: List[Dict[str, Any]] = [{"backend": backend, "grid_only": grid_only} for backend in BACKENDS for grid_only in (False, True)]
+    for variant in variants:
+        name: str = f"{variant['backend']}{'+grid_only' if variant['grid_only'] else ''}"
+        timings: List[float] = []
+        try:
+            for _ in range(repeats):
+                for shop_name, html in pages.items():
+                    start: float = time.perf_counter()
+                    try:
+                        parse_brochures(html, shop_name, variant["backend"], variant["grid_only"])
+                    except NoGridError:
+                        # page without grid, still counts into the time
+                        pass
+                    timings.append(time.perf_counter() - start)
+        except Exception as e:
+            # optional backend (lxml/html5lib/selectolax) is not installed
+            results[name] = {"skipped": str(e)}
+            continue
+
+        total_s: float = sum(timings) / repeats
+        results[name] = {"s_per_mb": round(total_s / total_mb, 4) if total_mb else 0.0, **timings_summary(timings)}
+
+    return results
+
+
+def legacy_parse_date(date: str):
+    """Previous parse_date (re.sub + strptime per call), kept only as the baseline of bench_parse_date"""
+    try:
+        if date.find("-") == -1:
+            return (datetime.strptime(re.sub(r"[^\d.]", "", date).replace(" ", ""), "%d.%m.%Y"), None)
+        date_splitted = date.replace(" ", "").split("-")
+        return (datetime.strptime(date_splitted[0], "%d.%m.%Y"), datetime.strptime(date_splitted[1], "%d.%m.%Y"))
+    except Exception:
+        return (None, None)
+
+
+def bench_parse_date(corpus: FixtureCorpus, repeats: int = 200) -> Dict[str, Any]:
+    """Memoized parse_date_range vs. its uncached version vs. the old regex + strptime version (formats are covered by tests/test_date_range.py)"""
+    samples: List[str] = []
+    for path in corpus.shop_pages().values():
+        soup: BeautifulSoup = BeautifulSoup(corpus.read(path), "html.parser")
+        samples.extend(tag.text for tag in soup.find_all("small", attrs={"class": "hidden-sm"}))
+
+    if not samples:
+        return {"samples": 0}
+
+    def measure(parse) -> Dict[str, float]:
+        start: float = time.perf_counter()
+        for _ in range(repeats):
+            for sample in samples:
+                parse(sample)
+        elapsed: float = time.perf_counter() - start
+        return {"us_per_call": round(elapsed / calls * 1e6, 3), "calls_per_s": round(calls / elapsed)}
+
+    calls: int = repeats * len(samples)
+    _parse_date_range.cache_clear()
+    memoized: Dict[str, float] = measure(Parser.parse_date)
+    year: int = datetime.now().year
+    uncached: Dict[str, float] = measure(lambda sample: _parse_date_range.__wrapped__(sample, year))
+    legacy: Dict[str, float] = measure(legacy_parse_date)
+
+    return {
+        "samples": len(samples), "unique": len(set(samples)), "calls": calls, **memoized,
+        "uncached": uncached, "legacy": legacy,
+        "speedup_vs_legacy": round(legacy["us_per_call"] / memoized["us_per_call"], 1) if memoized["us_per_call"] else 0.0
+    }
+
+
+async def bench_full_run(server: FixtureServer, max_concurrent: int = 8, parse_mode: str = "thread") -> Dict[str, Any]:
+    parser: Parser = unlimited_parser(server.base_url, max_concurrent=max_concurrent, parse_mode=parse_mode)
+
+    start: float = time.perf_counter()
+    async with parser:
+        results: List[List[Dict[str, Any]]] = await parser.get_all_shop_data()
+    elapsed: float = time.perf_counter() - start
+
+    shops: int = len(parser.shop_timings)
+    return {
+        "shops": shops,
+        "successful": parser.requester.successful_requests,
+        "failed": parser.requester.failed_requests,
+        "brochures": sum(len(brochures) for brochures in results),
+        "elapsed_s": round(elapsed, 3),
+        "shops_per_min": round(shops / elapsed * 60, 1) if elapsed else 0.0,
+        "per_shop": timings_summary(list(parser.shop_timings.values()))
+    }
+
+
+def run_benchmarks(corpus_dir: str, latency_ms: List[float], error_rate: float, seed: int) -> Dict[str, Any]:
+    corpus: FixtureCorpus = FixtureCorpus(corpus_dir)
+    if not corpus.manifest:
+        raise SystemExit(f"No fixtures in {corpus_dir}, record them first with `python Benchmark.py record`")
+
+    report: Dict[str, Any] = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "settings": {"corpus": corpus_dir, "latency_ms": latency_ms, "error_rate": error_rate, "seed": seed},
+    }
+
+    report["parse_info"] = bench_parse_info(corpus)
+    report["parse_date"] = bench_parse_date(corpus)
+
+    with FixtureServer(corpus, tuple(latency_ms), error_rate, seed=seed) as server:
+        report["get_leftside_shop_list"] = bench_sidebar(server)
+        report["get_all_shop_data"] = asyncio.run(bench_full_run(server))
+        report["server"] = {"requests": server.requests_served, "errors_injected": server.errors_injected}
+
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def parse_import_times(stderr: str) -> Tuple[float, List[str]]:
+    """-X importtime output -> (total import time in ms, every imported module)"""
+    total_us: int = 0
+    modules: List[str] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        modules.append(name.strip())
+        # nested imports are indented and already part of their parent's cumulative time
+        if not name[1:].startswith(" "):
+            total_us += int(cumulative)
+    return total_us / 1000, modules
+
+
+def time_subcommand(arguments: List[str], cwd: str, first_result: str, timeout_s: float = 300) -> Tuple[float, float]:
+    """
+    Runs main.py with arguments in cwd, returns (wall time, time until first_result is a non empty file) in seconds.
+    Shops are streamed into ndjson files and stats prints to stdout (captured into stdout.txt), so a growing
+    file is the first result every subcommand gives
+    """
+    first_result_path: str = os.path.join(cwd, first_result)
+    # left over by the previous run
+    if os.path.exists(first_result_path):
+        os.remove(first_result_path)
+    with open(os.path.join(cwd, "stdout.txt"), "wb") as stdout:
+        start: float = time.perf_counter()
+        process = subprocess.Popen([sys.executable, MAIN, *arguments], cwd=cwd, stdout=stdout, stderr=subprocess.DEVNULL)
+        first_result_s: Optional[float] = None
+        while process.poll() is None:
+            if first_result_s is None and os.path.exists(first_result_path) and os.path.getsize(first_result_path) > 0:
+                first_result_s = time.perf_counter() - start
+            if time.perf_counter() - start > timeout_s:
+                process.kill()
+                raise RuntimeError(f"main.py {' '.join(arguments)} did not finish in {timeout_s}s")
+            time.sleep(0.001)
+        wall_s: float = time.perf_counter() - start
+
+    if process.returncode:
+        raise RuntimeError(f"main.py {' '.join(arguments)} exited with {process.returncode}")
+    # finished between two polls (or the ndjson was already compacted away)
+    return wall_s, first_result_s if first_result_s is not None else wall_s
+
+
+def bench_startup(corpus_dir: str, repeats: int = 5) -> Dict[str, Any]:
+    """
+    Cold start of every main.py subcommand in a fresh interpreter: import time (-X importtime), which heavy
+    modules got imported, wall time and time to the first result. crawl runs without browser against the fixture server
+    """
+    corpus: FixtureCorpus = FixtureCorpus(corpus_dir)
+    report: Dict[str, Any] = {}
+
+    with tempfile.TemporaryDirectory(prefix="startup_") as cwd, FixtureServer(corpus) as server:
+        subcommands: List[Tuple[str, List[str], str]] = [
+            ("parse-from-disk", ["parse-from-disk", os.path.abspath(corpus_dir), "--output", "result.json"], "result.json.ndjson"),
+            ("export", ["export", "--input", "result.json", "--columnar", "result.brch"], "result.brch"),
+            ("stats", ["stats", "--input", "result.json"], "stdout.txt"),
+            ("stats_columnar", ["stats", "--input", "result.brch"], "stdout.txt"),
+            ("crawl", ["crawl", "--site-url", server.base_url, "--no-browser"], "result.ndjson"),
+        ]
+        for name, arguments, first_result in subcommands:
+            importtime = subprocess.run([sys.executable, "-X", "importtime", MAIN, *arguments], cwd=cwd,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+            import_ms, modules = parse_import_times(importtime.stderr)
+
+            runs: List[Tuple[float, float]] = [time_subcommand(arguments, cwd, first_result) for _ in range(repeats)]
+            report[name] = {
+                "import_ms": round(import_ms, 1),
+                "modules": len(modules),
+                "heavy_modules": [module for module in HEAVY_MODULES if module in modules],
+                "wall": timings_summary([wall_s for wall_s, _ in runs]),
+                "first_result": timings_summary([first_result_s for _, first_result_s in runs])
+            }
+    return report
+
+
+def flatten(report: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat: Dict[str, float] = {}
+    for key, value in report.items():
+        name: str = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(report: Dict[str, Any], baseline_file: str) -> None:
+    with open(baseline_file, "r", encoding="utf-8") as file:
+        baseline: Dict[str, float] = flatten(json.load(file))
+
+    print(f"\nCompared to {baseline_file}:")
+    for name, value in flatten(report).items():
+        old: Optional[float] = baseline.get(name)
+        if old is None or name.startswith("settings."):
+            continue
+        change: str = f"{(value - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"  {name:55} {old:>12} -> {value:>12}  {change}")
+
+
+def main() -> None:
+    configure_logging()
+    arg_parser = argparse.ArgumentParser(description="Offline crawl benchmarks")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+
+    record = commands.add_parser("record", help="record sidebar + shop pages into a fixture corpus")
+    record.add_argument("--corpus", default="./fixtures")
+    record.add_argument("--limit", type=int, default=None, help="record only first N shops")
+    record.add_argument("--static", action="store_true", help="record plain html instead of browser rendered pages")
+
+    run = commands.add_parser("run", help="run benchmarks against the local fixture server")
+    run.add_argument("--corpus", default="./fixtures")
+    run.add_argument("--latency-ms", type=float, nargs=2, default=[0, 0], metavar=("MIN", "MAX"))
+    run.add_argument("--error-rate", type=float, default=0.0)
+    run.add_argument("--seed", type=int, default=1)
+    run.add_argument("--output", default="./bench_results")
+    run.add_argument("--compare", default=None, help="previous result json to compare with")
+
+    startup = commands.add_parser("startup", help="import time and time to first result of every main.py subcommand")
+    startup.add_argument("--corpus", default="./fixtures")
+    startup.add_argument("--repeats", type=int, default=5)
+
+    args = arg_parser.parse_args()
+
+    if args.command == "record":
+        asyncio.run(record_fixtures(args.corpus, args.limit, not args.static))
+        return
+    if args.command == "startup":
+        print(json.dumps(bench_startup(args.corpus, args.repeats), indent=4))
+        return
+
+    # crawl progress logs would only measure the terminal
+    logging.getLogger().setLevel(logging.WARNING)
+
+    report: Dict[str, Any] = run_benchmarks(args.corpus, args.latency_ms, args.error_rate, args.seed)
+
+    os.makedirs(args.output, exist_ok=True)
+    output_file: str = os.path.join(args.output, f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output_file, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=4)
+
+    print(json.dumps(report, indent=4))
+    print(f"\nSaved to {output_file}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import logging
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from datetime import datetime
+from typing import List, Dict, Tuple, Any, Optional
+
+from DateRange import parse_date_range
+
+
+logger = logging.getLogger(__name__)
+
+
+# "html.parser" is pure python, "lxml" / "html5lib" are bs4 tree builders,
+# "selectolax" is separate C parser with its own (css selector based) walk
+BACKENDS: Tuple[str, ...] = ("html.parser", "lxml", "html5lib", "selectolax")
+
+
+class NoGridError(ValueError):
+    """Page has no page-body / letaky-grid (not rendered, blocked, wrong page...)"""
+
+
+class IncompleteGridError(NoGridError):
+    """Grid is there, but part of its cards are still to be loaded by the page's js"""
+
+
+# chunks of the grid the page's js loads later: intersection observer sentinels, "load more" buttons, card skeletons
+LAZY_GRID_SELECTOR: str = '[class*="intersect-lazy-load"], [class*="load-more"], [class*="placeholder"], [class*="skeleton"]'
+# declared amount of brochures of the shop, more than the cards in the html means the rest is lazy loaded
+GRID_TOTAL_ATTRIBUTES: Tuple[str, ...] = ("data-total", "data-count")
+
+
+def _check_complete(shop_name: str, cards: int, has_lazy_chunks: bool, grid_attributes: Dict[str, Any]) -> None:
+    if has_lazy_chunks:
+        raise IncompleteGridError(f"Brochure grid of {shop_name} has lazy loaded chunks")
+    for name in GRID_TOTAL_ATTRIBUTES:
+        total: str = str(grid_attributes.get(name) or "")
+        if total.isdigit() and int(total) > cards:
+            raise IncompleteGridError(f"Brochure grid of {shop_name} has {cards} of {total} cards")
+
+
+def parse_brochures(html: str, shop_name: str, backend: str = "html.parser", grid_only: bool = False,
+                    require_complete: bool = False) -> List[Dict[str, str]]:
+    """
+    Synchronous brochure extraction, module level so it can be sent to thread/process executors.
+    grid_only builds the tree only for the letaky-grid subtree (SoupStrainer), skipping the rest of the page.
+    require_complete (static / cached html) raises IncompleteGridError when the grid still has lazy loaded parts
+    """
+    if backend == "selectolax":
+        return _parse_brochures_selectolax(html, shop_name, grid_only, require_complete)
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown parser backend: {backend}")
+
+    if grid_only:
+        soup: BeautifulSoup = BeautifulSoup(html, backend, parse_only=SoupStrainer("div", attrs={"class": "letaky-grid"}))
+        brochures_grid = soup.find("div", attrs={"class": "letaky-grid"})
+    else:
+        soup: BeautifulSoup = BeautifulSoup(html, backend)
+        page_body = soup.find("div", attrs={"class": "page-body"})
+        brochures_grid = page_body.find("div", attrs={"class": "letaky-grid"}) if page_body else None
+
+    if brochures_grid is None:
+        raise NoGridError(f"No brochure grid in html of {shop_name}")
+
+    brochures = brochures_grid.find_all("div", attrs={"class": "brochure-thumb"})
+    if require_complete:
+        _check_complete(shop_name, len(brochures), brochures_grid.select_one(LAZY_GRID_SELECTOR) is not None, brochures_grid.attrs)
+
+    # every brochure of the page shares one crawl timestamp
+    parsed_time: str = datetime.now().strftime("%m-%d-%Y %H:%M:%S")
+    brochures_parsed: List[Dict[str, str]] = []
+    for brochure in brochures:
+        try:
+            description_tag = brochure.find("div", attrs={"class": "letak-description"})
+            title_tag = description_tag.find("strong")
+            dates_tag = description_tag.find("small", attrs={"class": "hidden-sm"})
+
+            image_tag = brochure.find("div", attrs={"class": "img-container"}).find("img")
+
+            valid_from: Optional[datetime] = None
+            valid_to: Optional[datetime] = None
+            if dates_tag:
+                parsed_date: Tuple[Optional[datetime], Optional[datetime]] = parse_date_range(dates_tag.text)
+                valid_from, valid_to = parsed_date
+
+            info = {
+                "title": title_tag.text if title_tag else "Not found",
+                "thumbnail": image_tag.get("src") or image_tag.get("data-src") if image_tag else "Not found",
+                "shop_name": shop_name,
+                "valid_from": valid_from.strftime('%m-%d-%Y') if valid_from else "Not found",
+                "valid_to": valid_to.strftime('%m-%d-%Y') if valid_to else "Not specified",
+                "parsed_time": parsed_time
+            }
+            brochures_parsed.append(info)
+        except Exception as e:
+            logger.error(f"Error while parsing html of {shop_name}: {str(e)}")
+
+    return brochures_parsed
+
+
+def _parse_brochures_selectolax(html: str, shop_name: str, grid_only: bool, require_complete: bool) -> List[Dict[str, str]]:
+    """Same walk as the bs4 version, but with selectolax (lexbor) nodes"""
+    from selectolax.lexbor import LexborHTMLParser
+
+    tree = LexborHTMLParser(html)
+    # lexbor always parses whole document, grid_only only narrows the lookup
+    brochures_grid = tree.css_first("div.letaky-grid") if grid_only else tree.css_first("div.page-body div.letaky-grid")
+
+    if brochures_grid is None:
+        raise NoGridError(f"No brochure grid in html of {shop_name}")
+
+    brochures = brochures_grid.css("div.brochure-thumb")
+    if require_complete:
+        _check_complete(shop_name, len(brochures), brochures_grid.css_first(LAZY_GRID_SELECTOR) is not None, brochures_grid.attributes)
+
+    parsed_time: str = datetime.now().strftime("%m-%d-%Y %H:%M:%S")
+    brochures_parsed: List[Dict[str, str]] = []
+    for brochure in brochures:
+        try:
+            description_tag = brochure.css_first("div.letak-description")
+            title_tag = description_tag.css_first("strong")
+            dates_tag = description_tag.css_first("small.hidden-sm")
+
+            image_tag = brochure.css_first("div.img-container").css_first("img")
+
+            valid_from: Optional[datetime] = None
+            valid_to: Optional[datetime] = None
+            if dates_tag:
+                parsed_date: Tuple[Optional[datetime], Optional[datetime]] = parse_date_range(dates_tag.text())
+                valid_from, valid_to = parsed_date
+
+            info = {
+                "title": title_tag.text() if title_tag else "Not found",
+                "thumbnail": image_tag.attributes.get("src") or image_tag.attributes.get("data-src") if image_tag else "Not found",
+                "shop_name": shop_name,
+                "valid_from": valid_from.strftime('%m-%d-%Y') if valid_from else "Not found",
+                "valid_to": valid_to.strftime('%m-%d-%Y') if valid_to else "Not specified",
+                "parsed_time": parsed_time
+            }
+            brochures_parsed.append(info)
+        except Exception as e:
+            logger.error(f"Error while parsing html of {shop_name}: {str(e)}")
+
+    return brochures_parsed
+
+
+def backends_agree(html: str, shop_name: str, backend: str, grid_only: bool = False) -> bool:
+    """Checks that backend produces the same brochure dicts as the reference html.parser (parsed_time ignored)"""
+    def strip(brochures: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [{key: value for key, value in brochure.items() if key != "parsed_time"} for brochure in brochures]
+
+    reference: List[Dict[str, Any]] = strip(parse_brochures(html, shop_name))
+    candidate: List[Dict[str, Any]] = strip(parse_brochures(html, shop_name, backend, grid_only))
+
+    if reference != candidate:
+        logger.warning(f"Backend {backend} (grid_only={grid_only}) differs from html.parser for {shop_name}")
+        return False
+    return True
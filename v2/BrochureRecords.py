@@ -0,0 +1,273 @@
+import logging
+
+import os
+import sys
+import mmap
+import json
+import struct
+from array import array
+from datetime import date, datetime
+
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+# day ordinal used for "Not found" / "Not specified" dates (date.min is ordinal 1)
+NO_DATE: int = 0
+
+MAGIC: bytes = b"BRCH"
+VERSION: int = 1
+# magic, version, byte order (0 little / 1 big), rows, shops, columns
+HEADER = struct.Struct("<4sHBxIII")
+# name, offset, length of every column after the header
+COLUMN = struct.Struct("<32sQQ")
+
+# fixed width columns (array typecode per column), one value per brochure
+INT_COLUMNS: Dict[str, str] = {"shop": "I", "valid_from": "i", "valid_to": "i"}
+# variable width utf-8 columns, stored as offsets (n + 1) + one blob
+STRING_COLUMNS: Tuple[str, ...] = ("title", "thumbnail", "thumbnail_hash")
+
+
+def date_to_ordinal(value: Optional[str]) -> int:
+    """'%m-%d-%Y' string of result.json -> date ordinal, NO_DATE for missing/invalid dates"""
+    try:
+        month, day, year = value.split("-")
+        return date(int(year), int(month), int(day)).toordinal()
+    except (AttributeError, ValueError):
+        return NO_DATE
+
+
+def ordinal_to_date(ordinal: int) -> Optional[date]:
+    return date.fromordinal(ordinal) if ordinal != NO_DATE else None
+
+
+class Brochure:
+    """
+    Compact brochure record: dates are day ordinals, shop name is interned and the crawl
+    timestamp (epoch seconds) is shared by all brochures of a shop. to_dict() gives back
+    the result.json shape
+    """
+    __slots__ = ("title", "thumbnail", "shop_name", "valid_from", "valid_to", "parsed_at", "thumbnail_hash")
+
+    def __init__(self, title: str, thumbnail: str, shop_name: str, valid_from: int = NO_DATE, valid_to: int = NO_DATE,
+                 parsed_at: int = 0, thumbnail_hash: Optional[str] = None) -> None:
+        self.title: str = title
+        self.thumbnail: str = thumbnail
+        self.shop_name: str = sys.intern(shop_name)
+        self.valid_from: int = valid_from
+        self.valid_to: int = valid_to
+        self.parsed_at: int = parsed_at
+        self.thumbnail_hash: Optional[str] = thumbnail_hash
+
+    def __repr__(self) -> str:
+        return f"Brochure({self.shop_name!r}, {self.title!r}, {ordinal_to_date(self.valid_from)}, {ordinal_to_date(self.valid_to)})"
+
+    @classmethod
+    def from_dict(cls, brochure: Dict[str, Any], parsed_at: Optional[int] = None) -> "Brochure":
+        if parsed_at is None:
+            parsed_at = parse_timestamp(brochure.get("parsed_time"))
+        return cls(
+            brochure.get("title", "Not found"), brochure.get("thumbnail", "Not found"), brochure["shop_name"],
+            date_to_ordinal(brochure.get("valid_from")), date_to_ordinal(brochure.get("valid_to")),
+            parsed_at, brochure.get("thumbnail_hash")
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        valid_from: Optional[date] = ordinal_to_date(self.valid_from)
+        valid_to: Optional[date] = ordinal_to_date(self.valid_to)
+        brochure: Dict[str, Any] = {
+            "title": self.title,
+            "thumbnail": self.thumbnail,
+            "shop_name": self.shop_name,
+            "valid_from": valid_from.strftime("%m-%d-%Y") if valid_from else "Not found",
+            "valid_to": valid_to.strftime("%m-%d-%Y") if valid_to else "Not specified",
+            "parsed_time": datetime.fromtimestamp(self.parsed_at).strftime("%m-%d-%Y %H:%M:%S")
+        }
+        if self.thumbnail_hash:
+            brochure["thumbnail_hash"] = self.thumbnail_hash
+        return brochure
+
+    def is_valid_on(self, day: date) -> bool:
+        ordinal: int = day.toordinal()
+        return (self.valid_from == NO_DATE or self.valid_from <= ordinal) and (self.valid_to == NO_DATE or ordinal <= self.valid_to)
+
+
+def parse_timestamp(value: Optional[str]) -> int:
+    try:
+        return int(datetime.strptime(value, "%m-%d-%Y %H:%M:%S").timestamp())
+    except (TypeError, ValueError):
+        return 0
+
+
+def compact_shop(brochures: List[Dict[str, Any]]) -> List[Brochure]:
+    """Brochure dicts of one shop -> records, the crawl timestamp is parsed once for the whole shop"""
+    if not brochures:
+        return []
+    parsed_at: int = parse_timestamp(brochures[0].get("parsed_time"))
+    return [Brochure.from_dict(brochure, parsed_at) for brochure in brochures]
+
+
+def write_columnar(shops: Iterable[List[Dict[str, Any]]], filename: str) -> int:
+    """
+    Writes shops (result.json shape) as one columnar file: numeric columns are plain arrays,
+    strings are an offsets array + utf-8 blob, every column is 8 byte aligned so ColumnarReader
+    can cast it straight from the mmap. Returns amount of written brochures
+    """
+    shop_names: List[str] = []
+    shop_parsed_at: array = array("q")
+    ints: Dict[str, array] = {name: array(typecode) for name, typecode in INT_COLUMNS.items()}
+    strings: Dict[str, Tuple[array, bytearray]] = {name: (array("Q", [0]), bytearray()) for name in STRING_COLUMNS}
+
+    for brochures in shops:
+        records: List[Brochure] = compact_shop(brochures)
+        if not records:
+            continue
+
+        shop_id: int = len(shop_names)
+        shop_names.append(records[0].shop_name)
+        shop_parsed_at.append(records[0].parsed_at)
+        for record in records:
+            ints["shop"].append(shop_id)
+            ints["valid_from"].append(record.valid_from)
+            ints["valid_to"].append(record.valid_to)
+            for name in STRING_COLUMNS:
+                offsets, blob = strings[name]
+                blob += (getattr(record, name) or "").encode("utf-8")
+                offsets.append(len(blob))
+
+    shop_offsets: array = array("Q", [0])
+    shop_blob: bytearray = bytearray()
+    for shop_name in shop_names:
+        shop_blob += shop_name.encode("utf-8")
+        shop_offsets.append(len(shop_blob))
+
+    columns: List[Tuple[str, bytes]] = [(name, values.tobytes()) for name, values in ints.items()]
+    for name, (offsets, blob) in strings.items():
+        columns += [(f"{name}.offsets", offsets.tobytes()), (f"{name}.data", bytes(blob))]
+    columns += [("shop_name.offsets", shop_offsets.tobytes()), ("shop_name.data", bytes(shop_blob)), ("shop_parsed_at", shop_parsed_at.tobytes())]
+
+    rows: int = len(ints["shop"])
+    offset: int = HEADER.size + COLUMN.size * len(columns)
+    table: List[bytes] = []
+    for name, data in columns:
+        offset += -offset % 8
+        table.append(COLUMN.pack(name.encode("ascii"), offset, len(data)))
+        offset += len(data)
+
+    tmp_file: str = f"{filename}.tmp"
+    with open(tmp_file, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, 0 if sys.byteorder == "little" else 1, rows, len(shop_names), len(columns)))
+        file.write(b"".join(table))
+        for name, data in columns:
+            file.write(b"\0" * (-file.tell() % 8))
+            file.write(data)
+    os.replace(tmp_file, filename)
+
+    logger.info(f"Wrote {rows} brochures of {len(shop_names)} shops into {filename}")
+    return rows
+
+
+def export_columnar(result_json: str, filename: str) -> int:
+    """result.json -> columnar file next to it, the json itself stays as it is"""
+    with open(result_json, "r", encoding="utf-8") as file:
+        return write_columnar(json.load(file), filename)
+
+
+class ColumnarReader:
+    """
+    Memory mapped view of a write_columnar file. Numeric columns are memoryviews over the mapping
+    (nothing is copied or parsed), strings are decoded only for the rows that are accessed
+    """
+    def __init__(self, filename: str) -> None:
+        self.filename: str = filename
+        self.__file = open(filename, "rb")
+        self.__mmap: mmap.mmap = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.__views: List[memoryview] = [memoryview(self.__mmap)]
+
+        magic, version, byte_order, self.rows, self.shops, column_count = HEADER.unpack_from(self.__mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{filename} is not a brochure columnar file (version {VERSION})")
+        if byte_order != (0 if sys.byteorder == "little" else 1):
+            self.close()
+            raise ValueError(f"{filename} was written on a machine with different byte order")
+
+        # raw bytes of every column, numeric and offset columns also cast to their type
+        self.__columns: Dict[str, memoryview] = {}
+        for i in range(column_count):
+            name, offset, length = COLUMN.unpack_from(self.__mmap, HEADER.size + i * COLUMN.size)
+            name = name.rstrip(b"\0").decode("ascii")
+            self.__columns[name] = self.__keep(self.__views[0][offset: offset + length])
+
+            typecode: Optional[str] = INT_COLUMNS.get(name) or ("Q" if name.endswith(".offsets") else "q" if name == "shop_parsed_at" else None)
+            if typecode:
+                self.__columns[name] = self.__keep(self.__columns[name].cast(typecode))
+
+        self.__shop_names: List[str] = [sys.intern(self.__string("shop_name", i)) for i in range(self.shops)]
+
+    def __keep(self, view: memoryview) -> memoryview:
+        self.__views.append(view)
+        return view
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        # every view has to be released (newest first) before the mapping can be closed
+        for view in reversed(self.__views):
+            view.release()
+        self.__views = []
+        self.__mmap.close()
+        self.__file.close()
+
+    def column(self, name: str) -> memoryview:
+        """Numeric column (shop / valid_from / valid_to / shop_parsed_at) as typed memoryview"""
+        if name not in INT_COLUMNS and name != "shop_parsed_at":
+            raise KeyError(f"{name} is not a numeric column")
+        return self.__columns[name]
+
+    def __string(self, name: str, i: int) -> str:
+        offsets: memoryview = self.__columns[f"{name}.offsets"]
+        return bytes(self.__columns[f"{name}.data"][offsets[i]: offsets[i + 1]]).decode("utf-8")
+
+    @property
+    def shop_names(self) -> List[str]:
+        return list(self.__shop_names)
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def __getitem__(self, i: int) -> Brochure:
+        if not 0 <= i < self.rows:
+            raise IndexError(i)
+        shop: int = self.column("shop")[i]
+        return Brochure(
+            self.__string("title", i), self.__string("thumbnail", i), self.__shop_names[shop],
+            self.column("valid_from")[i], self.column("valid_to")[i], self.column("shop_parsed_at")[shop],
+            self.__string("thumbnail_hash", i) or None
+        )
+
+    def __iter__(self) -> Iterator[Brochure]:
+        return (self[i] for i in range(self.rows))
+
+    def rows_valid_on(self, day: date) -> List[int]:
+        """Indexes of brochures valid on the day, only the two date columns are touched"""
+        ordinal: int = day.toordinal()
+        valid_from: memoryview = self.column("valid_from")
+        valid_to: memoryview = self.column("valid_to")
+        return [
+            i for i in range(self.rows)
+            if (valid_from[i] == NO_DATE or valid_from[i] <= ordinal) and (valid_to[i] == NO_DATE or ordinal <= valid_to[i])
+        ]
+
+    def rows_of_shop(self, shop_name: str) -> List[int]:
+        try:
+            shop: int = self.__shop_names.index(shop_name)
+        except ValueError:
+            return []
+        return [i for i, value in enumerate(self.column("shop")) if value == shop]
@@ -0,0 +1,200 @@
+import logging
+
+import json
+import time
+import sqlite3
+import argparse
+from datetime import date
+
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
+
+from DeltaCrawl import brochure_key
+from BrochureRecords import Brochure, compact_shop, NO_DATE
+from LogConfig import configure_logging
+
+
+logger = logging.getLogger(__name__)
+
+
+SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS brochures (
+    key TEXT PRIMARY KEY,
+    shop_name TEXT NOT NULL,
+    title TEXT,
+    thumbnail TEXT,
+    thumbnail_hash TEXT,
+    valid_from INTEGER,
+    valid_to INTEGER,
+    parsed_at INTEGER,
+    first_seen INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS brochures_shop_name ON brochures (shop_name);
+CREATE INDEX IF NOT EXISTS brochures_valid_from ON brochures (valid_from);
+CREATE INDEX IF NOT EXISTS brochures_valid_to ON brochures (valid_to);
+"""
+
+UPSERT: str = """
+INSERT INTO brochures (key, shop_name, title, thumbnail, thumbnail_hash, valid_from, valid_to, parsed_at, first_seen)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET
+    title = excluded.title, thumbnail = excluded.thumbnail, thumbnail_hash = excluded.thumbnail_hash,
+    valid_from = excluded.valid_from, valid_to = excluded.valid_to, parsed_at = excluded.parsed_at
+"""
+
+COLUMNS: str = "shop_name, title, thumbnail, thumbnail_hash, valid_from, valid_to, parsed_at"
+
+
+def flatten_groups(data: List[Any]) -> Iterator[List[Dict[str, Any]]]:
+    """
+    v2 result.json is a list of shops (lists of brochure dicts), v1 parsed_page.json nests them
+    one level deeper in groups of WRITE_GROUP_SIZE shops. Yields shops of either one
+    """
+    for item in data:
+        if item and isinstance(item[0], list):
+            yield from item
+        else:
+            yield item
+
+
+class BrochureStore:
+    """
+    SQLite brochure store (WAL, so readers never block the crawl and several crawls can write
+    one after another). Dates are day ordinals (NULL when missing) with an index on shop_name,
+    valid_from and valid_to, so validity queries don't need the whole result.json.
+    append() has the NDJSONSink signature, shops are buffered and written batch_size brochures per transaction
+    """
+    def __init__(self, path: str = "./brochures.db", batch_size: int = 500, busy_timeout_s: float = 30) -> None:
+        self.path: str = path
+        self.batch_size: int = batch_size
+        self.__pending: List[Tuple[str, List[Dict[str, Any]]]] = []
+        self.__pending_brochures: int = 0
+
+        self.__connection: sqlite3.Connection = sqlite3.connect(path, timeout=busy_timeout_s)
+        self.__connection.execute("PRAGMA journal_mode=WAL")
+        self.__connection.execute("PRAGMA synchronous=NORMAL")
+        self.__connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        self.flush()
+        self.__connection.close()
+
+    def append(self, shop_name: str, brochures: List[Dict[str, Any]]) -> None:
+        self.__pending.append((shop_name, brochures))
+        self.__pending_brochures += len(brochures)
+        if self.__pending_brochures >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Writes buffered shops in one transaction. Every shop is a full snapshot of it, so its
+        brochures that are not in the snapshot anymore are deleted
+        """
+        if not self.__pending:
+            return
+
+        now: int = int(time.time())
+        with self.__connection:
+            for shop_name, brochures in self.__pending:
+                keys: List[str] = [brochure_key(brochure) for brochure in brochures]
+                self.__connection.executemany(UPSERT, [
+                    (key, record.shop_name, record.title, record.thumbnail, record.thumbnail_hash,
+                     record.valid_from or None, record.valid_to or None, record.parsed_at, now)
+                    for key, record in zip(keys, compact_shop(brochures))
+                ])
+
+                self.__connection.execute("CREATE TEMP TABLE IF NOT EXISTS current_keys (key TEXT PRIMARY KEY)")
+                self.__connection.execute("DELETE FROM current_keys")
+                self.__connection.executemany("INSERT OR IGNORE INTO current_keys VALUES (?)", [(key,) for key in keys])
+                self.__connection.execute(
+                    "DELETE FROM brochures WHERE shop_name = ? AND key NOT IN (SELECT key FROM current_keys)", (shop_name,)
+                )
+
+        logger.info(f"Stored {self.__pending_brochures} brochures of {len(self.__pending)} shops in {self.path}")
+        self.__pending = []
+        self.__pending_brochures = 0
+
+    def import_shops(self, shops: Iterable[List[Dict[str, Any]]]) -> int:
+        """Shops in result.json shape, returns amount of shops"""
+        imported: int = 0
+        for brochures in shops:
+            if brochures:
+                self.append(brochures[0]["shop_name"], brochures)
+                imported += 1
+        self.flush()
+        return imported
+
+    def import_json(self, filename: str) -> int:
+        """result.json of v2 or responses/parsed_page.json of v1 (groups of shops, see flatten_groups)"""
+        with open(filename, "r", encoding="utf-8") as file:
+            return self.import_shops(flatten_groups(json.load(file)))
+
+    def __query(self, where: str, parameters: Tuple[Any, ...]) -> List[Dict[str, Any]]:
+        self.flush()
+        rows = self.__connection.execute(f"SELECT {COLUMNS} FROM brochures WHERE {where} ORDER BY shop_name, valid_from", parameters)
+        return [
+            Brochure(title, thumbnail, shop_name, valid_from or NO_DATE, valid_to or NO_DATE, parsed_at or 0, thumbnail_hash).to_dict()
+            for shop_name, title, thumbnail, thumbnail_hash, valid_from, valid_to, parsed_at in rows
+        ]
+
+    def valid_between(self, start: date, end: date, shop_name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Brochures whose validity overlaps [start, end], missing dates count as open ended"""
+        where: str = "(valid_from IS NULL OR valid_from <= ?) AND (valid_to IS NULL OR valid_to >= ?)"
+        parameters: Tuple[Any, ...] = (end.toordinal(), start.toordinal())
+        if shop_name:
+            where += " AND shop_name = ?"
+            parameters += (shop_name,)
+        return self.__query(where, parameters)
+
+    def valid_on(self, day: date, shop_name: Optional[str] = None) -> List[Dict[str, Any]]:
+        return self.valid_between(day, day, shop_name)
+
+    def by_shop(self, shop_name: str) -> List[Dict[str, Any]]:
+        return self.__query("shop_name = ?", (shop_name,))
+
+    def shops(self) -> Dict[str, int]:
+        """shop name -> amount of stored brochures"""
+        self.flush()
+        return dict(self.__connection.execute("SELECT shop_name, COUNT(*) FROM brochures GROUP BY shop_name ORDER BY shop_name"))
+
+
+def main() -> None:
+    configure_logging()
+    arg_parser = argparse.ArgumentParser(description="SQLite brochure store")
+    arg_parser.add_argument("--db", default="./brochures.db")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+
+    load = commands.add_parser("import", help="upsert shops of result.json (v2) or responses/parsed_page.json (v1)")
+    load.add_argument("json_file")
+
+    valid = commands.add_parser("valid", help="brochures valid on a date (or overlapping --until)")
+    valid.add_argument("--date", type=date.fromisoformat, default=date.today(), help="YYYY-MM-DD, today by default")
+    valid.add_argument("--until", type=date.fromisoformat, default=None, help="end of the window, YYYY-MM-DD")
+    valid.add_argument("--shop", default=None)
+
+    shop = commands.add_parser("shop", help="all brochures of a shop")
+    shop.add_argument("shop_name")
+
+    commands.add_parser("shops", help="stored shops with amount of brochures")
+
+    args = arg_parser.parse_args()
+
+    with BrochureStore(args.db) as store:
+        if args.command == "import":
+            print(f"Imported {store.import_json(args.json_file)} shops into {args.db}")
+        elif args.command == "valid":
+            print(json.dumps(store.valid_between(args.date, args.until or args.date, args.shop), indent=4, ensure_ascii=False))
+        elif args.command == "shop":
+            print(json.dumps(store.by_shop(args.shop_name), indent=4, ensure_ascii=False))
+        else:
+            for shop_name, count in store.shops().items():
+                print(f"{shop_name:40} {count}")
+
+
+if __name__ == "__main__":
+    main()
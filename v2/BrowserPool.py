@@ -0,0 +1,458 @@
+import logging
+
+from selenium import webdriver
+from selenium.webdriver.firefox.service import Service
+from webdriver_manager.firefox import GeckoDriverManager
+
+import os
+import asyncio
+import threading
+import time
+import random
+import statistics
+from collections import deque
+from functools import lru_cache
+from contextlib import asynccontextmanager
+
+from typing import List, Dict, Any, Optional, Callable, TypeVar, Deque
+
+
+T = TypeVar("T")
+
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1)
+def resolve_driver_path() -> str:
+    """GeckoDriverManager hits github/disk every call, so the binary is resolved only once per process"""
+    return GeckoDriverManager().install()
+
+
+def process_tree_rss_mb(pid: int) -> Optional[float]:
+    """RSS of firefox main process + all of its content processes (linux /proc only)"""
+    pids: List[int] = [pid]
+    total_kb: int = 0
+
+    while pids:
+        current: int = pids.pop()
+        try:
+            with open(f"/proc/{current}/status", "r") as file:
+                for line in file:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        break
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children", "r") as file:
+                    pids.extend(int(child) for child in file.read().split())
+        except (FileNotFoundError, ProcessLookupError, PermissionError):
+            if current == pid:
+                return None
+
+    return total_kb / 1024
+
+
+class PooledDriver:
+    def __init__(self, driver: webdriver.Firefox) -> None:
+        self.driver: webdriver.Firefox = driver
+        self.created_at: float = time.monotonic()
+        self.pages_served: int = 0
+        self.pid: Optional[int] = driver.capabilities.get("moz:processID")
+
+        # webdriver session handles one command at a time, tabs of the driver take turns on this lock
+        self.lock: threading.Lock = threading.Lock()
+        self.current_handle: Optional[str] = None
+        self.tabs: List["BrowserTab"] = []
+        self.tabs_in_use: int = 0
+        # recycled/shrunk/dead driver: its tabs are not handed out anymore, it quits once the last one is back
+        self.retiring: bool = False
+        self.replace_after_drain: bool = False
+
+    @property
+    def age_s(self) -> float:
+        return time.monotonic() - self.created_at
+
+
+class BrowserTab:
+    """One window of a pooled driver, the unit that is checked out of the pool"""
+    def __init__(self, pooled: PooledDriver, handle: str) -> None:
+        self.pooled: PooledDriver = pooled
+        self.handle: str = handle
+
+    @property
+    def driver(self) -> webdriver.Firefox:
+        return self.pooled.driver
+
+    def run(self, command: Callable[[webdriver.Firefox], T]) -> T:
+        """Runs blocking driver command(s) in this tab, switching the session to it first when needed"""
+        with self.pooled.lock:
+            if self.pooled.current_handle != self.handle:
+                self.pooled.driver.switch_to.window(self.handle)
+                self.pooled.current_handle = self.handle
+            return command(self.pooled.driver)
+
+
+class BrowserPool:
+    """
+    Firefox pool that starts drivers in parallel threads, probes them on checkout,
+    recycles them after max_pages / max_rss_mb and grows/shrinks between min and max size
+    depending on how long callers wait for a free driver.
+    With tabs_per_browser > 1 every driver serves that many pages at once from separate tabs
+    (page load strategy "none", so navigation of one tab doesn't block the others),
+    pages in flight = max_size * tabs_per_browser
+    """
+    def __init__(self, user_agents: List[str], min_size: int = 1, max_size: int = 3, max_pages: int = 40, max_rss_mb: float = 1500,
+                 grow_after_wait_s: float = 1.0, shrink_after_idle_s: float = 60.0, probe_timeout_s: float = 5.0, tabs_per_browser: int = 1,
+                 proxy: Optional[str] = None) -> None:
+        self.user_agents: List[str] = user_agents
+        self.min_size: int = max(0, min(min_size, max_size))
+        self.max_size: int = max_size
+        self.max_pages: int = max_pages
+        self.max_rss_mb: float = max_rss_mb
+        self.grow_after_wait_s: float = grow_after_wait_s
+        self.shrink_after_idle_s: float = shrink_after_idle_s
+        self.probe_timeout_s: float = probe_timeout_s
+        self.tabs_per_browser: int = max(1, tabs_per_browser)
+        # "host:port" of FilterProxy, all browser traffic goes through it
+        self.proxy: Optional[str] = proxy
+
+        self.__idle: asyncio.Queue = asyncio.Queue()
+        self.__drivers: List[PooledDriver] = []
+        self.__starting: int = 0
+        self.__last_wait_at: float = time.monotonic()
+        self.__background: set = set()
+
+        # metrics, samples are bounded so a long running pool (CrawlDaemon) doesn't grow with every checkout
+        self.checkouts: int = 0
+        self.wait_times: Deque[float] = deque(maxlen=5000)
+        self.retired_ages: Deque[float] = deque(maxlen=500)
+        self.recycled: int = 0
+        self.restarted: int = 0
+        self.grown: int = 0
+        self.shrunk: int = 0
+
+    @property
+    def size(self) -> int:
+        return len(self.__drivers)
+
+    @property
+    def multi_tab(self) -> bool:
+        return self.tabs_per_browser > 1
+
+    @property
+    def capacity(self) -> int:
+        return self.max_size * self.tabs_per_browser
+
+    def _create_driver(self) -> webdriver.Firefox:
+        options = webdriver.FirefoxOptions()
+
+        options.add_argument("--headless")
+        options.add_argument("--disable-gpu")
+        options.add_argument("--width=1920")
+        options.add_argument("--height=1080")
+
+        profile = webdriver.FirefoxProfile()
+
+        profile.set_preference("dom.webdriver.enabled", False)
+        profile.set_preference("useAutomationExtension", False)
+        profile.set_preference("marionette.enabled", True)
+
+        profile.set_preference("general.useragent.override", random.choice(self.user_agents))
+
+        profile.set_preference("permissions.default.images", 2)
+        profile.set_preference("javascript.enabled", True)
+        profile.set_preference("media.autoplay.default", 5)
+        profile.set_preference("network.http.pipelining", True)
+        profile.set_preference("network.http.proxy.pipelining", True)
+        profile.set_preference("network.http.pipelining.maxrequests", 8)
+
+        profile.set_preference("dom.push.enabled", False)
+        profile.set_preference("dom.webnotifications.enabled", False)
+        profile.set_preference("geo.enabled", False)
+        profile.set_preference("media.navigator.enabled", False)
+
+        profile.set_preference("privacy.trackingprotection.enabled", False)
+        profile.set_preference("browser.safebrowsing.enabled", False)
+        profile.set_preference("browser.safebrowsing.malware.enabled", False)
+
+        profile.set_preference("devtools.console.stdout.content", False)
+
+        if self.proxy:
+            proxy_host, proxy_port = self.proxy.rsplit(":", 1)
+            profile.set_preference("network.proxy.type", 1)
+            for scheme in ("http", "ssl"):
+                profile.set_preference(f"network.proxy.{scheme}", proxy_host)
+                profile.set_preference(f"network.proxy.{scheme}_port", int(proxy_port))
+            profile.set_preference("network.proxy.no_proxies_on", "")
+            profile.set_preference("network.proxy.allow_hijacking_localhost", True)
+            # FilterProxy intercepts https with certificates of its local CA, the proxy verifies the real ones upstream
+            options.accept_insecure_certs = True
+            # fonts are not requested at all, without openssl the proxy sees only the host of https requests
+            profile.set_preference("gfx.downloadable_fonts.enabled", False)
+
+        if self.multi_tab:
+            # get() returns right away, readiness of every tab is polled from python
+            options.page_load_strategy = "none"
+            # background tabs must keep running their timers/lazy loading at full speed
+            profile.set_preference("dom.min_background_timeout_value", 4)
+            profile.set_preference("dom.timeout.enable_budget_throttling", False)
+            profile.set_preference("browser.tabs.remote.warmup.enabled", False)
+
+        options.profile = profile
+
+        driver = webdriver.Firefox(
+            service=Service(resolve_driver_path()),
+            options=options
+        )
+
+        driver.execute_script("""
+            Object.defineProperty(navigator, 'webdriver', {
+                get: () => undefined,
+            });
+
+            Object.defineProperty(navigator, 'plugins', {
+                get: () => [1, 2, 3, 4, 5]
+            });
+
+            Object.defineProperty(navigator, 'languages', {
+                get: () => ['en-Us', 'en', 'de']
+            });
+        """)
+
+        return driver
+
+    @staticmethod
+    def _quit_driver(driver: webdriver.Firefox) -> None:
+        try:
+            driver.quit()
+        except:
+            pass
+
+    def _open_tabs(self, driver: webdriver.Firefox) -> List[str]:
+        handles: List[str] = [driver.current_window_handle]
+        for _ in range(self.tabs_per_browser - 1):
+            driver.switch_to.new_window("tab")
+            handles.append(driver.current_window_handle)
+        return handles
+
+    async def __spawn(self, reserved: bool = False) -> None:
+        """
+        Starts one driver off the event loop and puts all of its tabs into the idle queue.
+        reserved: the caller already counted it into __starting (spawn scheduled in background)
+        """
+        if not reserved:
+            self.__starting += 1
+        try:
+            driver: webdriver.Firefox = await asyncio.to_thread(self._create_driver)
+            pooled: PooledDriver = PooledDriver(driver)
+            handles: List[str] = await asyncio.to_thread(self._open_tabs, driver)
+            pooled.current_handle = handles[-1]
+            pooled.tabs = [BrowserTab(pooled, handle) for handle in handles]
+
+            self.__drivers.append(pooled)
+            for tab in pooled.tabs:
+                await self.__idle.put(tab)
+            logger.info(f"Firefox browser started with {len(handles)} tabs, pool size: {self.size}/{self.max_size}")
+        except Exception as e:
+            logger.error(f"Firefox browser could not be started: {str(e)}")
+        finally:
+            self.__starting -= 1
+
+    def __in_background(self, coro) -> None:
+        task: asyncio.Task = asyncio.create_task(coro)
+        self.__background.add(task)
+        task.add_done_callback(self.__background.discard)
+
+    async def start(self) -> None:
+        logger.info(f"Initializing pool with min: {self.min_size}, max: {self.max_size}")
+
+        await asyncio.to_thread(resolve_driver_path)
+        await asyncio.gather(*(self.__spawn() for _ in range(max(self.min_size, 1))))
+
+        if not self.size:
+            raise RuntimeError("None of the Firefox browsers could be started")
+
+    async def __retire(self, pooled: PooledDriver) -> None:
+        pooled.retiring = True
+        if pooled in self.__drivers:
+            self.__drivers.remove(pooled)
+        self.retired_ages.append(pooled.age_s)
+        await asyncio.to_thread(self._quit_driver, pooled.driver)
+
+    async def __replace(self, pooled: PooledDriver) -> None:
+        await self.__retire(pooled)
+        await self.__spawn(reserved=True)
+
+    def __drain(self, pooled: PooledDriver, replace: bool) -> None:
+        """Stops handing out tabs of the driver, it is retired (and replaced) as soon as no tab is in use"""
+        if pooled.retiring:
+            return
+        pooled.retiring = True
+        pooled.replace_after_drain = replace
+        self.__retire_if_drained(pooled)
+
+    def __retire_if_drained(self, pooled: PooledDriver) -> None:
+        if pooled.retiring and pooled.tabs_in_use == 0 and pooled in self.__drivers:
+            # removed right away, so it is scheduled only once, its replacement is counted as starting instead
+            self.__drivers.remove(pooled)
+            if pooled.replace_after_drain:
+                self.__starting += 1
+                self.__in_background(self.__replace(pooled))
+            else:
+                self.__in_background(self.__retire(pooled))
+
+    def __maybe_grow(self) -> None:
+        if self.size + self.__starting < self.max_size:
+            self.grown += 1
+            # counted right away, several waiters can time out before the background spawn starts
+            self.__starting += 1
+            logger.info(f"Waited more than {self.grow_after_wait_s}s for a browser, growing the pool")
+            self.__in_background(self.__spawn(reserved=True))
+
+    def __is_alive(self, tab: BrowserTab) -> bool:
+        try:
+            tab.run(lambda driver: driver.current_window_handle)
+            return True
+        except Exception:
+            return False
+
+    async def __probe(self, tab: BrowserTab) -> bool:
+        try:
+            return await asyncio.wait_for(asyncio.to_thread(self.__is_alive, tab), timeout=self.probe_timeout_s)
+        except asyncio.TimeoutError:
+            return False
+
+    async def checkout(self) -> BrowserTab:
+        start: float = time.perf_counter()
+
+        while True:
+            try:
+                tab: BrowserTab = await asyncio.wait_for(self.__idle.get(), timeout=self.grow_after_wait_s)
+            except asyncio.TimeoutError:
+                self.__maybe_grow()
+                continue
+
+            pooled: PooledDriver = tab.pooled
+            # idle tab of a driver that is being recycled or already restarted
+            if pooled.retiring:
+                continue
+
+            if await self.__probe(tab):
+                break
+
+            logger.warning(f"Browser pid={pooled.pid} failed liveness probe, restarting it")
+            self.restarted += 1
+            self.__drain(pooled, replace=True)
+
+        pooled.tabs_in_use += 1
+        waited: float = time.perf_counter() - start
+        self.checkouts += 1
+        self.wait_times.append(waited)
+        if waited > 0.05:
+            self.__last_wait_at = time.monotonic()
+        return tab
+
+    def __needs_recycle(self, pooled: PooledDriver) -> Optional[str]:
+        if pooled.pages_served >= self.max_pages:
+            return f"served {pooled.pages_served} pages"
+
+        if pooled.pid:
+            rss_mb: Optional[float] = process_tree_rss_mb(pooled.pid)
+            if rss_mb and rss_mb > self.max_rss_mb:
+                return f"uses {rss_mb:.0f}MB RSS"
+        return None
+
+    @staticmethod
+    def _clean_tab(tab: BrowserTab) -> None:
+        """Unloads the page (its scripts, lazy loading, memory) so the tab is empty for the next shop"""
+        try:
+            tab.run(lambda driver: driver.get("about:blank"))
+        except Exception:
+            pass
+
+    async def checkin(self, tab: BrowserTab) -> None:
+        pooled: PooledDriver = tab.pooled
+        pooled.pages_served += 1
+        pooled.tabs_in_use -= 1
+
+        if pooled.retiring:
+            self.__retire_if_drained(pooled)
+            return
+
+        reason: Optional[str] = await asyncio.to_thread(self.__needs_recycle, pooled)
+        if pooled.retiring:
+            # another tab of the same driver started the recycling meanwhile
+            self.__retire_if_drained(pooled)
+            return
+        if reason:
+            logger.info(f"Recycling browser pid={pooled.pid}, it {reason}")
+            self.recycled += 1
+            self.__drain(pooled, replace=True)
+            return
+
+        # nobody had to wait for a while -> give memory back
+        idle_for: float = time.monotonic() - self.__last_wait_at
+        if self.size > self.min_size and idle_for > self.shrink_after_idle_s:
+            logger.info(f"No pool waits for {idle_for:.0f}s, shrinking the pool")
+            self.shrunk += 1
+            self.__last_wait_at = time.monotonic()
+            self.__drain(pooled, replace=False)
+            return
+
+        if self.multi_tab:
+            await asyncio.to_thread(self._clean_tab, tab)
+        await self.__idle.put(tab)
+
+    def shrink_idle(self) -> int:
+        """
+        Retires browsers without a tab in use until only min_size are left, checkin() shrinks only
+        while pages are loaded, so an idle pool between crawls would otherwise stay at its peak size
+        """
+        retired: int = 0
+        for pooled in list(self.__drivers):
+            if self.size <= self.min_size:
+                break
+            if pooled.tabs_in_use == 0 and not pooled.retiring:
+                # leaves __drivers right away, its idle tabs are skipped by checkout() from now on
+                self.__drain(pooled, replace=False)
+                retired += 1
+        if retired:
+            self.shrunk += retired
+            logger.info(f"Pool is idle, retired {retired} browsers, {self.min_size} stay open")
+        return retired
+
+    @asynccontextmanager
+    async def lease(self):
+        """Checks out one tab, commands go through tab.run() (or tab.driver when there is one tab per browser)"""
+        tab: BrowserTab = await self.checkout()
+        try:
+            yield tab
+        finally:
+            await self.checkin(tab)
+
+    async def close(self) -> None:
+        if self.__background:
+            await asyncio.gather(*self.__background, return_exceptions=True)
+        await asyncio.gather(*(asyncio.to_thread(self._quit_driver, pooled.driver) for pooled in self.__drivers))
+        self.__drivers.clear()
+        logger.info("All browsers are closed")
+
+    def metrics(self) -> Dict[str, Any]:
+        waits: List[float] = sorted(self.wait_times) or [0.0]
+        ages: List[float] = [pooled.age_s for pooled in self.__drivers]
+        return {
+            "size": self.size,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "tabs_per_browser": self.tabs_per_browser,
+            "checkouts": self.checkouts,
+            "wait_avg_s": round(statistics.mean(waits), 3),
+            "wait_p95_s": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3),
+            "wait_max_s": round(waits[-1], 3),
+            "driver_age_max_s": round(max(ages, default=0.0), 1),
+            "retired_driver_age_avg_s": round(statistics.mean(self.retired_ages), 1) if self.retired_ages else None,
+            "recycled": self.recycled,
+            "restarted": self.restarted,
+            "grown": self.grown,
+            "shrunk": self.shrunk
+        }
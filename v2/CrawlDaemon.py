@@ -0,0 +1,259 @@
+import logging
+
+import json
+import time
+import signal
+import asyncio
+import threading
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from typing import List, Dict, Any, Optional, Iterable
+
+from ParserV2 import Parser
+from PageCache import PageCache
+from ResultSink import NDJSONSink
+from RetryScheduler import RetryScheduler, DeadLetterQueue
+from DeltaCrawl import BrochureIndex
+from CrawlFrontier import CrawlFrontier
+from BrochureRecords import Brochure, compact_shop
+
+
+logger = logging.getLogger(__name__)
+
+
+class BrochureCatalog:
+    """Latest brochures of every shop in memory (compact records), replaced as a whole after every crawl"""
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        # lower cased shop name -> records
+        self.__by_shop: Dict[str, List[Brochure]] = {}
+        self.updated_at: Optional[float] = None
+
+    def replace(self, shops: Iterable[List[Dict[str, Any]]]) -> int:
+        by_shop: Dict[str, List[Brochure]] = {}
+        for brochures in shops:
+            records: List[Brochure] = compact_shop(brochures)
+            if records:
+                by_shop[records[0].shop_name.lower()] = records
+
+        with self.__lock:
+            self.__by_shop = by_shop
+            self.updated_at = time.time()
+        return sum(len(records) for records in by_shop.values())
+
+    def load(self, filename: str) -> int:
+        """Fills the catalog from result.json, returns amount of brochures (0 when there is no result yet)"""
+        try:
+            with open(filename, "r", encoding="utf-8") as file:
+                return self.replace(json.load(file))
+        except (FileNotFoundError, json.JSONDecodeError):
+            logger.warning(f"No usable result in {filename}, catalog stays as it was")
+            return 0
+
+    def query(self, shop_name: Optional[str] = None, valid_on: Optional[date] = None) -> List[Dict[str, Any]]:
+        with self.__lock:
+            by_shop: Dict[str, List[Brochure]] = self.__by_shop
+
+        if shop_name is not None:
+            candidates: Iterable[Brochure] = by_shop.get(shop_name.lower(), [])
+        else:
+            candidates = (record for records in by_shop.values() for record in records)
+        if valid_on is not None:
+            candidates = (record for record in candidates if record.is_valid_on(valid_on))
+        return [record.to_dict() for record in candidates]
+
+    def shops(self) -> Dict[str, int]:
+        with self.__lock:
+            by_shop: Dict[str, List[Brochure]] = self.__by_shop
+        return {records[0].shop_name: len(records) for records in by_shop.values()}
+
+
+class CrawlDaemon:
+    """
+    Service mode: one Parser (and its browser pool) stays open between crawls, shops are re-crawled
+    every interval_s seconds or on POST /crawl, and the latest brochures are answered from memory:
+
+        GET  /brochures?shop=<name>&date=<YYYY-MM-DD>   brochures of a shop / valid on a date (both optional)
+        GET  /shops                                     shop name -> amount of brochures
+        GET  /status                                    last crawl, next crawl, pool
+        POST /crawl                                     starts a crawl right away (queued when one is running)
+    """
+    def __init__(self, parser_options: Optional[Dict[str, Any]] = None, interval_s: float = 3600, port: int = 8765, host: str = "127.0.0.1",
+                 all_categories: bool = False, dead_letter_json: str = "./dead_letter.json", frontier_state: str = "./frontier.json") -> None:
+        self.parser_options: Dict[str, Any] = parser_options or {}
+        self.interval_s: float = interval_s
+        # browser pages of the previous scheduled crawl are always older than this, so every crawl loads them again
+        self.cache_ttl_s: float = interval_s / 2
+        self.all_categories: bool = all_categories
+        self.dead_letter_json: str = dead_letter_json
+        self.frontier_state: str = frontier_state
+
+        self.catalog: BrochureCatalog = BrochureCatalog()
+        self.parser: Optional[Parser] = None
+        self.crawls: int = 0
+        self.crawling: bool = False
+        self.last_crawl: Dict[str, Any] = {}
+        self.next_crawl_at: Optional[float] = None
+
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+        self.__trigger: asyncio.Event = asyncio.Event()
+        self.__stop: asyncio.Event = asyncio.Event()
+        self.__server = ThreadingHTTPServer((host, port), self.__handler_class())
+        self.__server.daemon_threads = True
+
+    @property
+    def address(self) -> str:
+        host, port = self.__server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def trigger(self) -> None:
+        """Thread safe, starts a crawl as soon as the current one (if any) is finished"""
+        self.__loop.call_soon_threadsafe(self.__trigger.set)
+
+    def stop(self) -> None:
+        self.__loop.call_soon_threadsafe(self.__stop.set)
+
+    async def run(self) -> None:
+        self.__loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self.__loop.add_signal_handler(signal_number, self.__stop.set)
+            except (NotImplementedError, RuntimeError):
+                # windows / not the main thread
+                pass
+
+        threading.Thread(target=self.__server.serve_forever, name="crawl-daemon-api", daemon=True).start()
+        logger.info(f"Crawl daemon API on {self.address}, crawling every {self.interval_s:.0f}s")
+
+        try:
+            async with Parser(page_cache=PageCache(browser_ttl_s=self.cache_ttl_s), **self.parser_options) as parser:
+                self.parser = parser
+                # previous result is served until the first crawl is done
+                self.catalog.load(parser.json_output)
+
+                triggered: bool = False
+                while not self.__stop.is_set():
+                    self.__trigger.clear()
+                    # POST /crawl asks for the current state of the site, cached browser pages are not used at all
+                    parser.requester.page_cache.browser_ttl_s = 0 if triggered else self.cache_ttl_s
+                    await self.__crawl_once(parser)
+                    # only --warm-browsers stay open until the next crawl
+                    if parser.requester.use_browser:
+                        parser.requester.pool.shrink_idle()
+
+                    self.next_crawl_at = time.time() + self.interval_s
+                    triggered = await self.__wait_for_next_crawl()
+        finally:
+            self.__server.shutdown()
+            self.__server.server_close()
+            logger.info("Crawl daemon stopped")
+
+    async def __wait_for_next_crawl(self) -> bool:
+        """Returns after interval_s, on trigger() or on stop(), True when the next crawl was triggered"""
+        waiters = [asyncio.create_task(self.__trigger.wait()), asyncio.create_task(self.__stop.wait())]
+        try:
+            await asyncio.wait(waiters, timeout=self.interval_s, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+        return self.__trigger.is_set()
+
+    async def __crawl_once(self, parser: Parser) -> None:
+        self.crawling = True
+        start: float = time.perf_counter()
+        try:
+            shop_data: Optional[List[Dict[str, Any]]] = None
+            frontier: Optional[CrawlFrontier] = None
+            if self.all_categories:
+                frontier = await asyncio.to_thread(parser.get_all_categories_shop_list, CrawlFrontier(self.frontier_state))
+                shop_data = frontier.ordered(BrochureIndex.load(parser.json_output))
+
+            # result.json is replaced only by finalize(), so it can be served until then
+            sink: NDJSONSink = NDJSONSink("./result.ndjson")
+            try:
+                retry: RetryScheduler = RetryScheduler(dead_letter=DeadLetterQueue(self.dead_letter_json))
+                await parser.get_all_shop_data(shop_data, sink, retry=retry)
+            finally:
+                sink.close()
+            shops: int = sink.finalize(parser.json_output)
+            brochures: int = self.catalog.load(parser.json_output)
+
+            if frontier:
+                frontier.record_snapshot(BrochureIndex.load(parser.json_output))
+                frontier.save()
+            if parser.requester.page_cache:
+                parser.requester.page_cache.save()
+
+            self.last_crawl = {"finished": datetime.now().isoformat(timespec="seconds"), "shops": shops, "brochures": brochures,
+                               "elapsed_s": round(time.perf_counter() - start, 1), "error": None}
+        except Exception as e:
+            # the daemon keeps serving the previous catalog and tries again next time
+            logger.exception("Crawl failed")
+            self.last_crawl = {"finished": datetime.now().isoformat(timespec="seconds"), "elapsed_s": round(time.perf_counter() - start, 1), "error": str(e)}
+        finally:
+            self.crawling = False
+            self.crawls += 1
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "crawling": self.crawling,
+            "crawls": self.crawls,
+            "last_crawl": self.last_crawl,
+            "next_crawl_in_s": round(max(0.0, self.next_crawl_at - time.time()), 1) if self.next_crawl_at and not self.crawling else None,
+            "catalog_updated": datetime.fromtimestamp(self.catalog.updated_at).isoformat(timespec="seconds") if self.catalog.updated_at else None,
+            "pool": self.parser.requester.pool.metrics() if self.parser else None
+        }
+
+    def __handler_class(self):
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                daemon._get(self)
+
+            def do_POST(self):
+                daemon._post(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    @staticmethod
+    def __respond(request: BaseHTTPRequestHandler, status: int, payload: Any) -> None:
+        body: bytes = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json; charset=utf-8")
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    def _get(self, request: BaseHTTPRequestHandler) -> None:
+        url = urlsplit(request.path)
+        path: str = url.path.rstrip("/")
+        query: Dict[str, List[str]] = parse_qs(url.query)
+
+        if path == "/brochures":
+            try:
+                valid_on: Optional[date] = date.fromisoformat(query["date"][0]) if "date" in query else None
+            except ValueError:
+                CrawlDaemon.__respond(request, 400, {"error": "date has to be YYYY-MM-DD"})
+                return
+            shop_name: Optional[str] = query["shop"][0] if "shop" in query else None
+            brochures: List[Dict[str, Any]] = self.catalog.query(shop_name, valid_on)
+            CrawlDaemon.__respond(request, 200, {"count": len(brochures), "brochures": brochures})
+        elif path == "/shops":
+            CrawlDaemon.__respond(request, 200, self.catalog.shops())
+        elif path == "/status":
+            CrawlDaemon.__respond(request, 200, self.status())
+        else:
+            CrawlDaemon.__respond(request, 404, {"error": f"unknown path {url.path}"})
+
+    def _post(self, request: BaseHTTPRequestHandler) -> None:
+        if urlsplit(request.path).path.rstrip("/") != "/crawl":
+            CrawlDaemon.__respond(request, 404, {"error": f"unknown path {request.path}"})
+            return
+        self.trigger()
+        CrawlDaemon.__respond(request, 202, {"queued": self.crawling, "started": not self.crawling})
@@ -0,0 +1,150 @@
+import logging
+
+import os
+import json
+import time
+import hashlib
+from datetime import date, timedelta
+from urllib.parse import urljoin, urlsplit
+
+from bs4 import BeautifulSoup
+
+from typing import List, Dict, Any, Optional, Tuple
+
+from DeltaCrawl import BrochureIndex, brochure_fingerprint, parse_valid_to
+
+
+logger = logging.getLogger(__name__)
+
+
+# scheduling tiers, lower goes first
+EXPIRING, NEVER_SEEN, CHANGED, UNCHANGED = range(4)
+TIER_NAMES: Tuple[str, ...] = ("expiring", "never_seen", "changed", "unchanged")
+
+
+def discover_categories(html: str, site_url: str) -> List[Dict[str, str]]:
+    """Category links of the top navigation (li.has_child > a.is_category) as {"category", "link"}"""
+    soup: BeautifulSoup = BeautifulSoup(html, "html.parser")
+    categories: List[Dict[str, str]] = []
+    seen: set = set()
+    for link in soup.select("li.has_child > a.is_category[href]"):
+        url: str = urljoin(f"{site_url}/", link["href"])
+        if url in seen:
+            continue
+        seen.add(url)
+        categories.append({"category": link.text.strip() or urlsplit(url).path.strip("/"), "link": url})
+    return categories
+
+
+def normalize_link(link: str) -> str:
+    """Same shop page linked as /aez, /aez/ or /aez/?ref=... from different sidebars"""
+    parts = urlsplit(link)
+    return f"{parts.scheme}://{parts.netloc.lower()}{parts.path.rstrip('/')}/"
+
+
+def shop_fingerprint(brochures: List[Dict[str, Any]]) -> str:
+    fingerprints: List[str] = sorted(json.dumps(brochure_fingerprint(brochure), ensure_ascii=False) for brochure in brochures)
+    return hashlib.sha256("\n".join(fingerprints).encode("utf-8")).hexdigest()
+
+
+class CrawlFrontier:
+    """
+    Shops of all category sidebars, deduplicated by url (every shop keeps the list of its categories),
+    ordered by freshness: shops with brochures expiring soon first, never crawled shops next,
+    shops that changed last time after them and shops that were unchanged on their last crawl last.
+    Per shop history (last crawl, last change, fingerprint of the brochures) is kept in state_file
+    """
+    def __init__(self, state_file: str = "./frontier.json", expiring_within_days: int = 2) -> None:
+        self.state_file: str = state_file
+        self.expiring_within_days: int = expiring_within_days
+        # normalized link -> shop dict ({"shop_name", "link", "categories"})
+        self.shops: Dict[str, Dict[str, Any]] = {}
+        self.duplicates: int = 0
+        self.__history: Dict[str, Dict[str, Any]] = self.__load()
+
+    def __load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError:
+            logger.warning(f"Frontier state {self.state_file} is corrupted, every shop counts as never seen")
+            return {}
+
+    def save(self) -> None:
+        tmp_file: str = f"{self.state_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as file:
+            json.dump(self.__history, file, indent=4, ensure_ascii=False)
+        os.replace(tmp_file, self.state_file)
+
+    def add(self, shop: Dict[str, str], category: str) -> None:
+        link: str = normalize_link(shop["link"])
+        known: Optional[Dict[str, Any]] = self.shops.get(link)
+        if known is None:
+            self.shops[link] = {"shop_name": shop["shop_name"], "link": shop["link"], "categories": [category]}
+            return
+
+        self.duplicates += 1
+        if category not in known["categories"]:
+            known["categories"].append(category)
+
+    def add_category(self, category: str, shop_data: List[Dict[str, str]]) -> None:
+        for shop in shop_data:
+            self.add(shop, category)
+
+    def __priority(self, shop: Dict[str, Any], previous: BrochureIndex, today: date) -> Tuple[int, float]:
+        expires: List[date] = [
+            valid_to for valid_to in (parse_valid_to(brochure.get("valid_to")) for brochure in previous.by_shop.get(shop["shop_name"], []))
+            if valid_to is not None
+        ]
+        if expires and min(expires) <= today + timedelta(days=self.expiring_within_days):
+            return EXPIRING, min(expires).toordinal()
+
+        history: Optional[Dict[str, Any]] = self.__history.get(normalize_link(shop["link"]))
+        if history is None:
+            return NEVER_SEEN, 0
+        # oldest crawl first inside the tier, the most recently confirmed unchanged shop is the very last
+        return (CHANGED if history["changed_at"] == history["crawled_at"] else UNCHANGED), history["crawled_at"]
+
+    def ordered(self, previous: Optional[BrochureIndex] = None, today: Optional[date] = None) -> List[Dict[str, Any]]:
+        """All shops in crawl order (see class docstring), previous is the last result snapshot"""
+        previous = previous or BrochureIndex([])
+        today = today or date.today()
+
+        prioritized: List[Tuple[Tuple[int, float], Dict[str, Any]]] = [
+            (self.__priority(shop, previous, today), shop) for shop in self.shops.values()
+        ]
+        prioritized.sort(key=lambda item: item[0])
+
+        tiers: Dict[str, int] = {name: 0 for name in TIER_NAMES}
+        for (tier, _), _ in prioritized:
+            tiers[TIER_NAMES[tier]] += 1
+        logger.info(f"Frontier: {len(self.shops)} shops ({self.duplicates} duplicate sidebar entries skipped), {tiers}")
+
+        return [shop for _, shop in prioritized]
+
+    def record(self, shop: Dict[str, Any], brochures: List[Dict[str, Any]]) -> None:
+        """Remembers the crawl of a shop, changed_at moves only when its brochures differ from the last crawl"""
+        link: str = normalize_link(shop["link"])
+        fingerprint: str = shop_fingerprint(brochures)
+        now: float = time.time()
+
+        history: Dict[str, Any] = self.__history.get(link) or {"changed_at": now, "fingerprint": None}
+        if history["fingerprint"] != fingerprint:
+            history["changed_at"] = now
+        history.update({
+            "shop_name": shop["shop_name"], "categories": shop.get("categories", []),
+            "fingerprint": fingerprint, "crawled_at": now
+        })
+        self.__history[link] = history
+
+    def record_snapshot(self, current: BrochureIndex) -> int:
+        """Records every frontier shop present in the finished result, returns amount of recorded shops"""
+        recorded: int = 0
+        for shop in self.shops.values():
+            brochures: Optional[List[Dict[str, Any]]] = current.by_shop.get(shop["shop_name"])
+            if brochures:
+                self.record(shop, brochures)
+                recorded += 1
+        return recorded
@@ -0,0 +1,123 @@
+import logging
+
+import os
+import json
+import time
+
+from typing import List, Dict, Any, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+PENDING: str = "pending"
+DONE: str = "done"
+FAILED: str = "failed"
+
+
+class CrawlJournal:
+    """
+    Checkpoint of the crawl keyed by shop url ({url: {"state", "shop_name", "brochures", ...}}).
+    The file is append only (one json line per state change, fsynced), so after a crash/ban/ctrl+c
+    it always contains the last finished shop and a finished shop costs one line instead of the whole journal.
+    start() compacts it into one line per shop (temp file + fsync + rename), later lines win on load
+    """
+    def __init__(self, path: str = "./crawl_journal.json", resume: bool = False) -> None:
+        self.path: str = path
+        self.__entries: Dict[str, Dict[str, Any]] = self.__load() if resume else {}
+        self.__compacted: bool = False
+
+        if resume:
+            logger.info(f"Resuming from {path}: {self.summary()}")
+
+    def __load(self) -> Dict[str, Dict[str, Any]]:
+        entries: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        record: Dict[str, Any] = json.loads(line)
+                    except json.JSONDecodeError:
+                        # only the line being written when the crawl died can be cut off
+                        logger.warning(f"Skipping corrupted line of journal {self.path}")
+                        continue
+                    if "url" in record:
+                        entries[record.pop("url")] = record
+                    else:
+                        # whole journal as one object (written before the journal was append only)
+                        entries.update(record)
+        except FileNotFoundError:
+            logger.warning(f"No journal found at {self.path}, starting from scratch")
+        return entries
+
+    @staticmethod
+    def __line(url: str, entry: Dict[str, Any]) -> str:
+        return json.dumps({"url": url, **entry}, ensure_ascii=False) + "\n"
+
+    def __compact(self) -> None:
+        tmp_path: str = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.writelines(CrawlJournal.__line(url, entry) for url, entry in self.__entries.items())
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+        self.__compacted = True
+
+    def __append(self, url: str) -> None:
+        # lines of a previous crawl are dropped first (resumed ones are in __entries already)
+        if not self.__compacted:
+            self.__compact()
+            return
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(CrawlJournal.__line(url, self.__entries[url]))
+            file.flush()
+            os.fsync(file.fileno())
+
+    def __set(self, url: str, shop_name: str, state: str, **fields) -> None:
+        entry: Dict[str, Any] = self.__entries.setdefault(url, {"shop_name": shop_name, "attempts": 0})
+        entry.update(fields)
+        entry["state"] = state
+        entry["updated"] = time.time()
+
+    def start(self, shop_data: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Marks not finished shops as pending and returns them (done shops are skipped)"""
+        pending: List[Dict[str, str]] = []
+        for shop in shop_data:
+            if self.is_done(shop["link"]):
+                continue
+            self.__set(shop["link"], shop["shop_name"], PENDING)
+            pending.append(shop)
+
+        self.__compact()
+        return pending
+
+    def is_done(self, url: str) -> bool:
+        entry: Optional[Dict[str, Any]] = self.__entries.get(url)
+        return bool(entry) and entry["state"] == DONE
+
+    def mark_done(self, url: str, shop_name: str, brochures: List[Dict[str, Any]]) -> None:
+        self.__set(url, shop_name, DONE, brochures=brochures, error=None)
+        self.__entries[url]["attempts"] += 1
+        self.__append(url)
+
+    def mark_failed(self, url: str, shop_name: str, error: str) -> None:
+        self.__set(url, shop_name, FAILED, brochures=[], error=error)
+        self.__entries[url]["attempts"] += 1
+        self.__append(url)
+
+    def done_shops(self, shop_data: List[Dict[str, str]]) -> List[Tuple[str, List[Dict[str, Any]]]]:
+        """Stored (shop_name, brochures) of already finished shops of shop_data, in shop_data order"""
+        return [
+            (shop["shop_name"], self.__entries[shop["link"]]["brochures"])
+            for shop in shop_data if self.is_done(shop["link"])
+        ]
+
+    def brochures(self, url: str) -> List[Dict[str, Any]]:
+        entry: Optional[Dict[str, Any]] = self.__entries.get(url)
+        return entry.get("brochures", []) if entry else []
+
+    def summary(self) -> str:
+        counts: Dict[str, int] = {PENDING: 0, DONE: 0, FAILED: 0}
+        for entry in self.__entries.values():
+            counts[entry["state"]] += 1
+        return ", ".join(f"{state}: {count}" for state, count in counts.items())
@@ -0,0 +1,202 @@
+import logging
+
+import time
+import heapq
+import asyncio
+from collections import deque
+
+from typing import List, Dict, Tuple, Any, Optional, Iterable, Callable, Deque
+
+from RequestMaker import Requester, FETCH_TIERS, next_tier
+from RetryScheduler import RetryScheduler, ShopFetchError
+from ThumbnailStore import ThumbnailDownloader
+
+
+logger = logging.getLogger(__name__)
+
+
+# called by the writer for every finished shop: (shop, brochures, error of the last attempt or None)
+ResultHandler = Callable[[Dict[str, str], List[Dict[str, Any]], Optional[ShopFetchError]], None]
+
+
+class CrawlPipeline:
+    """
+    frontier -> fetch workers -> parse workers [-> thumbnail workers] -> writer, connected with bounded queues.
+    A full queue blocks the stage before it, so at most queue_size pages wait for parsing
+    no matter how big the catalog is, and a slow writer/parser slows down fetching instead of piling up html
+    """
+    def __init__(self, requester: Requester, parse_func: Callable, fetch_workers: int = 8, parse_workers: int = 2,
+                 queue_size: int = 16, retry: Optional[RetryScheduler] = None, thumbnails: Optional[ThumbnailDownloader] = None,
+                 thumbnail_workers: int = 4) -> None:
+        self.requester: Requester = requester
+        self.parse_func: Callable = parse_func
+        self.fetch_workers: int = fetch_workers
+        self.parse_workers: int = parse_workers
+        self.retry: RetryScheduler = retry or RetryScheduler()
+        self.thumbnails: Optional[ThumbnailDownloader] = thumbnails
+        self.thumbnail_workers: int = thumbnail_workers if thumbnails else 0
+
+        # (shop, first tier to try)
+        self.fetch_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        # (shop, html, tier)
+        self.parse_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        # (shop, brochures), only with thumbnails
+        self.thumbnail_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        # (shop, brochures, error)
+        self.write_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+        # pages that need the next tier go before new shops; they are never more than the shops in flight,
+        # and putting them into fetch_queue directly could deadlock with full queues
+        self.__escalations: Deque[Tuple[Dict[str, str], str]] = deque()
+        # (not_before, sequence, shop), fed only after every shop had its first attempt
+        self.__retries: List[Tuple[float, int, Dict[str, str]]] = []
+        self.__retry_sequence: int = 0
+        self.__in_flight: int = 0
+        self.__changed: asyncio.Event = asyncio.Event()
+        self.__started_at: Dict[str, float] = {}
+
+        self.shop_timings: Dict[str, float] = {}
+        self.completed: int = 0
+
+        metrics = requester.metrics
+        metrics.gauge("fetch_queue", self.fetch_queue.qsize)
+        metrics.gauge("parse_queue", self.parse_queue.qsize)
+        metrics.gauge("thumbnail_queue", self.thumbnail_queue.qsize)
+        metrics.gauge("write_queue", self.write_queue.qsize)
+        metrics.gauge("shops_in_flight", lambda: self.__in_flight)
+
+    async def run(self, shops: Iterable[Dict[str, str]], on_result: ResultHandler) -> None:
+        fetchers = [asyncio.create_task(self.__fetch_worker()) for _ in range(self.fetch_workers)]
+        parsers = [asyncio.create_task(self.__parse_worker()) for _ in range(self.parse_workers)]
+        thumbnailers = [asyncio.create_task(self.__thumbnail_worker()) for _ in range(self.thumbnail_workers)]
+        writer = asyncio.create_task(self.__writer(on_result))
+        driver = asyncio.create_task(self.__drive(shops, fetchers, parsers, thumbnailers, writer))
+
+        try:
+            # a stage that dies would leave the others waiting on its queue forever,
+            # so the first failure of any task ends the whole run
+            pending = {driver, *fetchers, *parsers, *thumbnailers, writer}
+            while driver in pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.cancelled() and task.exception() is not None:
+                        raise task.exception()
+        finally:
+            for task in (driver, *fetchers, *parsers, *thumbnailers, writer):
+                task.cancel()
+
+    async def __drive(self, shops: Iterable[Dict[str, str]], fetchers: List[asyncio.Task], parsers: List[asyncio.Task],
+                      thumbnailers: List[asyncio.Task], writer: asyncio.Task) -> None:
+        await self.__frontier(shops)
+
+        # every stage stops after the one before it is drained
+        for _ in fetchers:
+            await self.fetch_queue.put(None)
+        await asyncio.gather(*fetchers)
+        for _ in parsers:
+            await self.parse_queue.put(None)
+        await asyncio.gather(*parsers)
+        for _ in thumbnailers:
+            await self.thumbnail_queue.put(None)
+        await asyncio.gather(*thumbnailers)
+        await self.write_queue.put(None)
+        await writer
+
+    async def __feed(self, shop: Dict[str, str], tier: str) -> None:
+        self.__started_at.setdefault(shop["link"], time.perf_counter())
+        await self.fetch_queue.put((shop, tier))
+
+    async def __feed_escalations(self) -> None:
+        while self.__escalations:
+            await self.__feed(*self.__escalations.popleft())
+
+    async def __frontier(self, shops: Iterable[Dict[str, str]]) -> None:
+        # shops are tracked by link, the same link twice would be fetched twice and finish once
+        links: set = set()
+        for shop in shops:
+            if shop["link"] in links:
+                logger.warning(f"{shop['shop_name']} ({shop['link']}) is listed more than once, fetching it once")
+                continue
+            links.add(shop["link"])
+
+            await self.__feed_escalations()
+            self.__in_flight += 1
+            await self.__feed(shop, FETCH_TIERS[0])
+
+        # retries come last, after every shop of the catalog had its first attempt
+        while self.__in_flight:
+            await self.__feed_escalations()
+
+            if self.__retries and self.__retries[0][0] <= time.monotonic():
+                _, _, shop = heapq.heappop(self.__retries)
+                await self.__feed(shop, FETCH_TIERS[0])
+                continue
+
+            self.__changed.clear()
+            timeout: Optional[float] = max(0.0, self.__retries[0][0] - time.monotonic()) if self.__retries else None
+            try:
+                await asyncio.wait_for(self.__changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def __fail(self, shop: Dict[str, str], error: Exception) -> None:
+        fetch_error: ShopFetchError = self.requester.record_failure(shop["shop_name"], error)
+        not_before: Optional[float] = self.retry.schedule(shop, fetch_error)
+
+        if not_before is None:
+            await self.write_queue.put((shop, [], fetch_error))
+            return
+
+        self.requester.metrics.inc("retries")
+        self.requester.metrics.inc(f"retry_{fetch_error.error_class}")
+        self.__retry_sequence += 1
+        heapq.heappush(self.__retries, (not_before, self.__retry_sequence, shop))
+        self.__changed.set()
+
+    async def __fetch_worker(self) -> None:
+        while (item := await self.fetch_queue.get()) is not None:
+            shop, tier = item
+            try:
+                html, tier = await self.requester.fetch_shop_page(shop["shop_name"], shop["link"], tier)
+            except Exception as e:
+                await self.__fail(shop, e)
+                continue
+            await self.parse_queue.put((shop, html, tier))
+
+    async def __parse_worker(self) -> None:
+        while (item := await self.parse_queue.get()) is not None:
+            shop, html, tier = item
+            try:
+                brochures: Optional[List[Dict[str, Any]]] = await self.requester.parse_shop_page(shop["shop_name"], shop["link"], html, tier, self.parse_func)
+            except Exception as e:
+                await self.__fail(shop, e)
+                continue
+
+            if brochures is None:
+                self.__escalations.append((shop, next_tier(tier)))
+                self.__changed.set()
+                continue
+
+            if self.thumbnails:
+                await self.thumbnail_queue.put((shop, brochures))
+            else:
+                await self.write_queue.put((shop, brochures, None))
+
+    async def __thumbnail_worker(self) -> None:
+        while (item := await self.thumbnail_queue.get()) is not None:
+            shop, brochures = item
+            # images that couldn't be fetched only stay without thumbnail_path, the shop itself is done
+            await self.write_queue.put((shop, await self.thumbnails.annotate(brochures, shop["shop_name"]), None))
+
+    async def __writer(self, on_result: ResultHandler) -> None:
+        while (item := await self.write_queue.get()) is not None:
+            shop, brochures, error = item
+            with self.requester.metrics.timer("write", shop["shop_name"]):
+                on_result(shop, brochures, error)
+
+            self.shop_timings[shop["link"]] = time.perf_counter() - self.__started_at.pop(shop["link"], time.perf_counter())
+            self.requester.metrics.observe("shop_total", self.shop_timings[shop["link"]], shop["shop_name"])
+
+            self.completed += 1
+            self.__in_flight -= 1
+            self.__changed.set()
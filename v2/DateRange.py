@@ -0,0 +1,103 @@
+import logging
+
+import re
+import time
+from datetime import date, datetime
+from functools import lru_cache
+
+from typing import List, Tuple, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+# "03.03.2025", "03.03.25", "03.03." (year taken from the other end of the range)
+DATE_PATTERN = re.compile(r"(\d{1,2})\.(\d{1,2})\.(\d{4}|\d{2})?")
+# hyphen, en dash, em dash or "bis" between two dates
+RANGE_SEPARATOR_PATTERN = re.compile(r"\s*(?:-|–|—|\bbis\b)\s*", re.IGNORECASE)
+# "bis Samstag 08.03.2025", "gültig bis 08.03." -> only the end is known
+UNTIL_PATTERN = re.compile(r"^\W*(?:g(?:ü|ue)ltig\s+)?bis\b", re.IGNORECASE)
+
+DateRange = Tuple[Optional[datetime], Optional[datetime]]
+
+
+# current year and the moment it ends, so the year is not looked up with date.today() on every card
+_current: List[float] = [0, 0.0]
+
+
+def _current_year() -> int:
+    if time.time() >= _current[1]:
+        year: int = date.today().year
+        _current[:] = [year, datetime(year + 1, 1, 1).timestamp()]
+    return int(_current[0])
+
+
+def _year(text: Optional[str]) -> Optional[int]:
+    if not text:
+        return None
+    year: int = int(text)
+    return year + 2000 if year < 100 else year
+
+
+def _fast_range(text: str) -> Optional[DateRange]:
+    """'dd.mm.yyyy - dd.mm.yyyy' (what nearly every card has) without regex or strptime"""
+    if len(text) != 23 or text[10:13] != " - " or text[2] != "." or text[5] != "." or text[15] != "." or text[18] != ".":
+        return None
+    try:
+        return (
+            datetime(int(text[6:10]), int(text[3:5]), int(text[0:2])),
+            datetime(int(text[19:23]), int(text[16:18]), int(text[13:15]))
+        )
+    except ValueError:
+        return None
+
+
+def parse_date_range(text: str, current_year: Optional[int] = None) -> DateRange:
+    """
+    Validity text of a brochure card -> (valid_from, valid_to), None for the missing end.
+    Handles "03.03.2025 - 08.03.2025" (also en dash / "bis"), "von Montag 03.03.2025",
+    "bis Samstag 08.03.2025", weekday names, two digit years and "03.03. - 08.03.2025".
+    Dates without any year get current_year (this year by default)
+    """
+    # resolved on every call, so the memoized results of a long running daemon don't stay in the old year
+    return _parse_date_range(text, current_year or _current_year())
+
+
+@lru_cache(maxsize=4096)
+def _parse_date_range(text: str, current_year: int) -> DateRange:
+    """Same strings repeat on every shop, so results are memoized per (text, current_year)"""
+    text = text.strip()
+    fast: Optional[DateRange] = _fast_range(text)
+    if fast:
+        return fast
+
+    try:
+        matches: List[re.Match] = list(DATE_PATTERN.finditer(text))
+        if not matches:
+            raise ValueError("no date")
+
+        if len(matches) == 1:
+            day, month, year = matches[0].groups()
+            # "03.03." alone has no year to take over
+            found: datetime = datetime(_year(year) or current_year, int(month), int(day))
+            return (None, found) if UNTIL_PATTERN.search(text) else (found, None)
+
+        first, last = matches[0], matches[-1]
+        if not RANGE_SEPARATOR_PATTERN.search(text, first.end(), last.start()):
+            raise ValueError("two dates without range separator")
+
+        end_year: int = _year(last.group(3)) or current_year
+        valid_to: datetime = datetime(end_year, int(last.group(2)), int(last.group(1)))
+
+        start_year: Optional[int] = _year(first.group(3))
+        if start_year is None:
+            # "28.12. - 03.01.2026" starts in the previous year
+            start_year = end_year - 1 if int(first.group(2)) > valid_to.month else end_year
+        valid_from: datetime = datetime(start_year, int(first.group(2)), int(first.group(1)))
+
+        return (valid_from, valid_to)
+    except ValueError as ve:
+        # memoized, so every unknown format is logged only once
+        logger.warning(f"Unknown date format {text!r}: {ve}")
+        return (None, None)
+
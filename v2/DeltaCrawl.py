@@ -0,0 +1,106 @@
+import logging
+
+import os
+import json
+from datetime import date, datetime
+from urllib.parse import urlsplit
+
+from typing import List, Dict, Any, Optional, Tuple, Iterable
+
+
+logger = logging.getLogger(__name__)
+
+
+def brochure_key(brochure: Dict[str, Any]) -> str:
+    """
+    Stable identity of a brochure: shop + thumbnail path (it contains brochure id, query is only
+    a cache buster). Brochures without thumbnail fall back to shop + title + validity dates
+    """
+    thumbnail: str = brochure.get("thumbnail") or "Not found"
+    if thumbnail != "Not found":
+        return f"{brochure['shop_name']}|{urlsplit(thumbnail).path}"
+    return f"{brochure['shop_name']}|{brochure.get('title')}|{brochure.get('valid_from')}|{brochure.get('valid_to')}"
+
+
+def brochure_fingerprint(brochure: Dict[str, Any]) -> Tuple[str, ...]:
+    """Fields that make a brochure 'changed' when its key stays the same (parsed_time is ignored)"""
+    return (brochure.get("title"), brochure.get("thumbnail"), brochure.get("valid_from"), brochure.get("valid_to"))
+
+
+def parse_valid_to(value: Optional[str]) -> Optional[date]:
+    try:
+        return datetime.strptime(value, "%m-%d-%Y").date()
+    except (TypeError, ValueError):
+        # "Not specified" / "Not found"
+        return None
+
+
+class BrochureIndex:
+    """Previous snapshot (result.json shape: list of shops, every shop a list of brochures) indexed by brochure key"""
+    def __init__(self, shops: Iterable[List[Dict[str, Any]]]) -> None:
+        self.by_key: Dict[str, Dict[str, Any]] = {}
+        self.by_shop: Dict[str, List[Dict[str, Any]]] = {}
+
+        for brochures in shops:
+            for brochure in brochures:
+                self.by_key[brochure_key(brochure)] = brochure
+                self.by_shop.setdefault(brochure["shop_name"], []).append(brochure)
+
+    @classmethod
+    def load(cls, filename: str) -> "BrochureIndex":
+        try:
+            with open(filename, "r", encoding="utf-8") as file:
+                return cls(json.load(file))
+        except FileNotFoundError:
+            logger.warning(f"No previous snapshot at {filename}, every shop will be fetched")
+            return cls([])
+        except json.JSONDecodeError:
+            logger.warning(f"Previous snapshot {filename} is invalid or empty, every shop will be fetched")
+            return cls([])
+
+    def is_still_valid(self, shop_name: str, today: date) -> bool:
+        """True when the shop had brochures and none of them expired yet (open ended ones count as expired)"""
+        brochures: List[Dict[str, Any]] = self.by_shop.get(shop_name, [])
+        if not brochures:
+            return False
+        for brochure in brochures:
+            valid_to: Optional[date] = parse_valid_to(brochure.get("valid_to"))
+            if valid_to is None or valid_to < today:
+                return False
+        return True
+
+    def split_shops(self, shop_data: List[Dict[str, str]], force: bool = False, today: Optional[date] = None) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+        """Returns (shops to fetch, shops whose previous brochures can be reused)"""
+        if force:
+            return shop_data, []
+
+        today = today or date.today()
+        to_fetch: List[Dict[str, str]] = []
+        reused: List[Dict[str, str]] = []
+        for shop in shop_data:
+            (reused if self.is_still_valid(shop["shop_name"], today) else to_fetch).append(shop)
+        return to_fetch, reused
+
+
+def diff_snapshots(previous: BrochureIndex, current: BrochureIndex) -> Dict[str, List[Any]]:
+    added: List[Dict[str, Any]] = []
+    changed: List[Dict[str, Any]] = []
+
+    for key, brochure in current.by_key.items():
+        before: Optional[Dict[str, Any]] = previous.by_key.get(key)
+        if before is None:
+            added.append(brochure)
+        elif brochure_fingerprint(before) != brochure_fingerprint(brochure):
+            changed.append({"key": key, "before": before, "after": brochure})
+
+    removed: List[Dict[str, Any]] = [brochure for key, brochure in previous.by_key.items() if key not in current.by_key]
+    return {"added": added, "removed": removed, "changed": changed}
+
+
+def write_delta(delta: Dict[str, List[Any]], filename: str) -> None:
+    tmp_file: str = f"{filename}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as file:
+        json.dump({"generated": datetime.now().strftime("%m-%d-%Y %H:%M:%S"), **delta}, file, indent=4, ensure_ascii=False)
+    os.replace(tmp_file, filename)
+
+    logger.info(f"Delta written to {filename}: {len(delta['added'])} added, {len(delta['removed'])} removed, {len(delta['changed'])} changed")
@@ -0,0 +1,447 @@
+import logging
+
+import os
+import ssl
+import json
+import shutil
+import socket
+import selectors
+import threading
+import subprocess
+import http.client
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+
+from typing import List, Dict, Any, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_DENY_DOMAINS: Tuple[str, ...] = (
+    "google-analytics.com", "googletagmanager.com", "googletagservices.com", "doubleclick.net",
+    "googlesyndication.com", "googleadservices.com", "adservice.google.com", "amazon-adsystem.com",
+    "facebook.net", "facebook.com", "hotjar.com", "criteo.com", "criteo.net", "taboola.com", "outbrain.com",
+    "adnxs.com", "rubiconproject.com", "pubmatic.com", "openx.net", "casalemedia.com", "scorecardresearch.com",
+    "fonts.googleapis.com", "fonts.gstatic.com", "youtube.com", "ytimg.com"
+)
+DEFAULT_DENY_PATHS: Tuple[str, ...] = (".woff", ".woff2", ".ttf", ".otf", ".eot", ".mp4", ".webm", ".mp3", ".gif")
+DEFAULT_DENY_CONTENT_TYPES: Tuple[str, ...] = ("font/", "video/", "audio/", "image/", "application/font", "application/x-font")
+CACHEABLE_CONTENT_TYPES: Tuple[str, ...] = ("javascript", "text/css", "ecmascript")
+
+HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "proxy-connection", "proxy-authorization", "te", "trailers", "transfer-encoding", "upgrade"}
+
+
+class FilterRules:
+    """
+    Allow/deny rules for browser traffic. Domains match with their subdomains, paths are substrings of the url path,
+    content types are prefixes of the response Content-Type. With allow_domains only those domains are let through
+    """
+    def __init__(self, deny_domains: Tuple[str, ...] = DEFAULT_DENY_DOMAINS, allow_domains: Optional[Tuple[str, ...]] = None,
+                 deny_paths: Tuple[str, ...] = DEFAULT_DENY_PATHS, deny_content_types: Tuple[str, ...] = DEFAULT_DENY_CONTENT_TYPES) -> None:
+        self.deny_domains: Tuple[str, ...] = tuple(deny_domains)
+        self.allow_domains: Optional[Tuple[str, ...]] = tuple(allow_domains) if allow_domains else None
+        self.deny_paths: Tuple[str, ...] = tuple(deny_paths)
+        self.deny_content_types: Tuple[str, ...] = tuple(deny_content_types)
+
+    @classmethod
+    def load(cls, filename: str) -> "FilterRules":
+        """json with any of the keys deny_domains / allow_domains / deny_paths / deny_content_types"""
+        with open(filename, "r", encoding="utf-8") as file:
+            return cls(**json.load(file))
+
+    @staticmethod
+    def __matches_domain(host: str, domains: Tuple[str, ...]) -> bool:
+        return any(host == domain or host.endswith(f".{domain}") for domain in domains)
+
+    def host_rule(self, host: str) -> Optional[str]:
+        """Name of the rule that blocks the host, None when it is allowed"""
+        host = host.lower()
+        if self.allow_domains is not None and not self.__matches_domain(host, self.allow_domains):
+            return "not_allowed_domain"
+        if self.__matches_domain(host, self.deny_domains):
+            return "deny_domain"
+        return None
+
+    def path_rule(self, path: str) -> Optional[str]:
+        path = path.lower()
+        return "deny_path" if any(pattern in path for pattern in self.deny_paths) else None
+
+    def content_type_rule(self, content_type: str) -> Optional[str]:
+        content_type = content_type.lower()
+        return "deny_content_type" if any(content_type.startswith(prefix) for prefix in self.deny_content_types) else None
+
+
+class AssetCache:
+    """In-memory LRU of static assets (site js/css) shared by all browsers that use the proxy"""
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_object_bytes: int = 4 * 1024 * 1024) -> None:
+        self.max_bytes: int = max_bytes
+        self.max_object_bytes: int = max_object_bytes
+        self.size_bytes: int = 0
+        self.__objects: "OrderedDict[str, Tuple[int, List[Tuple[str, str]], bytes]]" = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, url: str) -> Optional[Tuple[int, List[Tuple[str, str]], bytes]]:
+        with self.__lock:
+            entry = self.__objects.get(url)
+            if entry is not None:
+                self.__objects.move_to_end(url)
+            return entry
+
+    def put(self, url: str, status: int, headers: List[Tuple[str, str]], body: bytes) -> None:
+        if len(body) > self.max_object_bytes:
+            return
+        with self.__lock:
+            if url in self.__objects:
+                return
+            self.__objects[url] = (status, headers, body)
+            self.size_bytes += len(body)
+            while self.size_bytes > self.max_bytes and self.__objects:
+                _, (_, _, evicted) = self.__objects.popitem(last=False)
+                self.size_bytes -= len(evicted)
+
+    @staticmethod
+    def is_cacheable(method: str, status: int, headers: Dict[str, str]) -> bool:
+        cache_control: str = headers.get("cache-control", "").lower()
+        content_type: str = headers.get("content-type", "").lower()
+        return method == "GET" and status == 200 and "no-store" not in cache_control and "private" not in cache_control \
+            and any(kind in content_type for kind in CACHEABLE_CONTENT_TYPES)
+
+
+class CertificateAuthority:
+    """
+    Local CA for TLS interception: every CONNECT host gets a leaf certificate signed by it, so the proxy
+    sees plain requests of https pages. Keys and certificates are made by the openssl command line tool
+    (the standard library can't create them) and kept in ca_dir between runs
+    """
+    def __init__(self, ca_dir: str = "./.filter_proxy_ca", openssl: str = "openssl") -> None:
+        self.ca_dir: str = ca_dir
+        self.openssl: str = openssl
+        self.ca_cert: str = os.path.join(ca_dir, "ca.pem")
+        self.ca_key: str = os.path.join(ca_dir, "ca.key")
+        self.__contexts: Dict[str, ssl.SSLContext] = {}
+        self.__lock = threading.Lock()
+
+        os.makedirs(os.path.join(ca_dir, "hosts"), mode=0o700, exist_ok=True)
+        if not (os.path.exists(self.ca_cert) and os.path.exists(self.ca_key)):
+            self.__run("req", "-x509", "-newkey", "rsa:2048", "-nodes", "-sha256", "-days", "3650",
+                       "-subj", "/CN=Prospekt filter proxy CA", "-addext", "basicConstraints=critical,CA:TRUE",
+                       "-addext", "keyUsage=critical,keyCertSign,cRLSign", "-keyout", self.ca_key, "-out", self.ca_cert)
+
+    @staticmethod
+    def available(openssl: str = "openssl") -> bool:
+        return shutil.which(openssl) is not None
+
+    def __run(self, *arguments: str) -> None:
+        subprocess.run([self.openssl, *arguments], check=True, capture_output=True)
+
+    def context(self, host: str) -> ssl.SSLContext:
+        """Server side context with the certificate of host, created once per host"""
+        with self.__lock:
+            context: Optional[ssl.SSLContext] = self.__contexts.get(host)
+            if context is None:
+                cert, key = self.__host_certificate(host)
+                context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+                context.load_cert_chain(cert, key)
+                self.__contexts[host] = context
+            return context
+
+    def __host_certificate(self, host: str) -> Tuple[str, str]:
+        base: str = os.path.join(self.ca_dir, "hosts", host.replace(":", "_"))
+        cert, key = f"{base}.pem", f"{base}.key"
+        if os.path.exists(cert) and os.path.exists(key):
+            return cert, key
+
+        try:
+            socket.inet_pton(socket.AF_INET6 if ":" in host else socket.AF_INET, host)
+            san: str = f"IP:{host}"
+        except OSError:
+            san = f"DNS:{host}"
+        self.__run("req", "-new", "-newkey", "rsa:2048", "-nodes", "-subj", f"/CN={host}", "-addext", f"subjectAltName={san}",
+                   "-keyout", key, "-out", f"{base}.csr")
+        self.__run("x509", "-req", "-in", f"{base}.csr", "-CA", self.ca_cert, "-CAkey", self.ca_key, "-CAcreateserial",
+                   "-sha256", "-days", "825", "-copy_extensions", "copy", "-out", cert)
+        os.remove(f"{base}.csr")
+        return cert, key
+
+
+class ProxyStats:
+    def __init__(self) -> None:
+        self.requests: int = 0
+        # opaque tunnels (TLS not intercepted) can only be filtered by host
+        self.tunnels: int = 0
+        self.intercepted: int = 0
+        self.blocked: Dict[str, int] = {}
+        self.blocked_hosts: Dict[str, int] = {}
+        # requests denied by host/path rule before anything was downloaded, their size is not known
+        self.blocked_before_download: int = 0
+        # content type is known only from the response, so these bodies were downloaded anyway
+        self.bytes_downloaded_then_blocked: int = 0
+        self.bytes_from_cache: int = 0
+        self.cache_hits: int = 0
+        self.bytes_transferred: int = 0
+        self.__lock = threading.Lock()
+
+    def add(self, **amounts: int) -> None:
+        with self.__lock:
+            for name, amount in amounts.items():
+                setattr(self, name, getattr(self, name) + amount)
+
+    def block(self, rule: str, host: str, downloaded: Optional[int] = None) -> None:
+        """downloaded is the body size of a response denied after it was fetched, None for a request that never went out"""
+        with self.__lock:
+            self.blocked[rule] = self.blocked.get(rule, 0) + 1
+            self.blocked_hosts[host] = self.blocked_hosts.get(host, 0) + 1
+            if downloaded is None:
+                self.blocked_before_download += 1
+            else:
+                self.bytes_downloaded_then_blocked += downloaded
+
+    def report(self) -> Dict[str, Any]:
+        with self.__lock:
+            top_hosts: List[Tuple[str, int]] = sorted(self.blocked_hosts.items(), key=lambda item: item[1], reverse=True)[:10]
+            report: Dict[str, Any] = {
+                "requests": self.requests,
+                "https_intercepted": self.intercepted,
+                "https_tunnels": self.tunnels,
+                "blocked": dict(self.blocked),
+                "blocked_before_download": self.blocked_before_download,
+                "top_blocked_hosts": dict(top_hosts),
+                "cache_hits": self.cache_hits,
+                "mb_transferred": round(self.bytes_transferred / (1024 * 1024), 2),
+                "mb_downloaded_then_blocked": round(self.bytes_downloaded_then_blocked / (1024 * 1024), 2),
+                # only what the cache served is measured, requests blocked before download have no known size
+                "mb_saved": round(self.bytes_from_cache / (1024 * 1024), 2)
+            }
+            if self.tunnels:
+                report["note"] = (f"{self.tunnels} https connections were not intercepted, they are filtered by host only: "
+                                  "path/content type rules and the asset cache don't apply to them and their traffic is not in mb_saved")
+            return report
+
+
+class FilterProxy:
+    """
+    Local proxy for the pooled browsers (BrowserPool(proxy=FilterProxy.address)).
+    Requests are filtered by domain, path and response content type, and js/css is served from AssetCache.
+    https is intercepted with certificates of CertificateAuthority (the pooled browsers accept them, the proxy
+    verifies the real upstream certificates itself). Without openssl or with intercept_tls=False https goes through
+    opaque CONNECT tunnels that can only be filtered by domain
+    """
+    def __init__(self, rules: Optional[FilterRules] = None, cache: Optional[AssetCache] = None, port: int = 0,
+                 host: str = "127.0.0.1", upstream_timeout_s: float = 20.0, intercept_tls: bool = True,
+                 ca_dir: str = "./.filter_proxy_ca", upstream_ssl_context: Optional[ssl.SSLContext] = None) -> None:
+        self.rules: FilterRules = rules or FilterRules()
+        self.cache: AssetCache = cache or AssetCache()
+        self.stats: ProxyStats = ProxyStats()
+        self.upstream_timeout_s: float = upstream_timeout_s
+        self.upstream_ssl_context: ssl.SSLContext = upstream_ssl_context or ssl.create_default_context()
+
+        self.authority: Optional[CertificateAuthority] = None
+        if intercept_tls:
+            if CertificateAuthority.available():
+                self.authority = CertificateAuthority(ca_dir)
+            else:
+                logger.warning("openssl not found, https is tunneled without interception (host rules only)")
+
+        self.__server = ThreadingHTTPServer((host, port), self.__handler_class())
+        self.__server.daemon_threads = True
+
+    @property
+    def address(self) -> str:
+        host, port = self.__server.server_address[:2]
+        return f"{host}:{port}"
+
+    def __handler_class(self):
+        proxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # (host, port) of the CONNECT for requests read from an intercepted TLS connection
+            origin: Optional[Tuple[str, int]] = None
+
+            def do_CONNECT(self):
+                proxy._tunnel(self)
+
+            def do_GET(self):
+                proxy._forward(self)
+
+            do_POST = do_HEAD = do_PUT = do_DELETE = do_OPTIONS = do_PATCH = do_GET
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    @staticmethod
+    def __deny(request: BaseHTTPRequestHandler) -> None:
+        request.send_response(403)
+        request.send_header("Content-Length", "0")
+        request.end_headers()
+
+    def _tunnel(self, request: BaseHTTPRequestHandler) -> None:
+        host, _, port = request.path.rpartition(":")
+        self.stats.add(requests=1)
+
+        rule: Optional[str] = self.rules.host_rule(host)
+        if rule:
+            self.stats.block(rule, host)
+            self.__deny(request)
+            return
+
+        if self.authority:
+            self.__intercept(request, host, int(port or 443))
+            return
+
+        try:
+            upstream: socket.socket = socket.create_connection((host, int(port or 443)), timeout=self.upstream_timeout_s)
+        except OSError as e:
+            logger.debug(f"Tunnel to {request.path} failed: {str(e)}")
+            request.send_error(502)
+            return
+
+        request.send_response(200, "Connection Established")
+        request.end_headers()
+        request.close_connection = True
+        self.stats.add(tunnels=1)
+        self.__pump(request.connection, upstream)
+
+    def __intercept(self, request: BaseHTTPRequestHandler, host: str, port: int) -> None:
+        """Terminates TLS of the browser and serves requests of the connection like plain http ones (see _forward)"""
+        try:
+            context: ssl.SSLContext = self.authority.context(host)
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.error(f"Certificate for {host} couldn't be created: {str(e)}")
+            request.send_error(502)
+            return
+
+        request.send_response(200, "Connection Established")
+        request.end_headers()
+        request.close_connection = True
+        try:
+            connection: ssl.SSLSocket = context.wrap_socket(request.connection, server_side=True)
+        except (OSError, ssl.SSLError) as e:
+            logger.debug(f"TLS handshake with the browser for {host} failed: {str(e)}")
+            return
+
+        self.stats.add(intercepted=1)
+        # same handler class, it serves the decrypted keep-alive connection until the browser closes it
+        handler_class = type("InterceptedHandler", (type(request),), {"origin": (host, port)})
+        try:
+            handler_class(connection, request.client_address, request.server)
+        except OSError as e:
+            logger.debug(f"Intercepted connection to {host} failed: {str(e)}")
+        finally:
+            connection.close()
+
+    def __pump(self, client: socket.socket, upstream: socket.socket) -> None:
+        selector = selectors.DefaultSelector()
+        selector.register(client, selectors.EVENT_READ, upstream)
+        selector.register(upstream, selectors.EVENT_READ, client)
+        transferred: int = 0
+
+        try:
+            while True:
+                events = selector.select(timeout=self.upstream_timeout_s)
+                if not events:
+                    break
+                for key, _ in events:
+                    data: bytes = key.fileobj.recv(65536)
+                    if not data:
+                        return
+                    key.data.sendall(data)
+                    transferred += len(data)
+        except OSError:
+            pass
+        finally:
+            selector.close()
+            upstream.close()
+            self.stats.add(bytes_transferred=transferred)
+
+    def _forward(self, request: BaseHTTPRequestHandler) -> None:
+        url: str = request.path
+        if request.origin:
+            # path of an intercepted https request is relative to its CONNECT target
+            origin_host, origin_port = request.origin
+            url = f"https://{origin_host}{'' if origin_port == 443 else f':{origin_port}'}{request.path}"
+        parts = urlsplit(url)
+        host: str = parts.hostname or ""
+        self.stats.add(requests=1)
+
+        rule: Optional[str] = self.rules.host_rule(host) or self.rules.path_rule(parts.path)
+        if rule:
+            self.stats.block(rule, host)
+            self.__deny(request)
+            return
+
+        if request.command == "GET":
+            cached = self.cache.get(url)
+            if cached is not None:
+                self.stats.add(cache_hits=1, bytes_from_cache=len(cached[2]))
+                self.__respond(request, *cached)
+                return
+
+        body: Optional[bytes] = None
+        length: int = int(request.headers.get("Content-Length") or 0)
+        if length:
+            body = request.rfile.read(length)
+
+        headers: Dict[str, str] = {name: value for name, value in request.headers.items() if name.lower() not in HOP_BY_HOP_HEADERS}
+        path: str = parts.path or "/"
+        if parts.query:
+            path += f"?{parts.query}"
+
+        try:
+            if parts.scheme == "https":
+                connection = http.client.HTTPSConnection(host, parts.port or 443, timeout=self.upstream_timeout_s, context=self.upstream_ssl_context)
+            else:
+                connection = http.client.HTTPConnection(host, parts.port or 80, timeout=self.upstream_timeout_s)
+            connection.request(request.command, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response_body: bytes = response.read()
+            connection.close()
+        except (OSError, http.client.HTTPException) as e:
+            logger.debug(f"Proxy request to {url} failed: {str(e)}")
+            request.send_error(502)
+            return
+
+        # body is sent whole with its own Content-Length
+        response_headers: List[Tuple[str, str]] = [
+            (name, value) for name, value in response.getheaders() if name.lower() not in HOP_BY_HOP_HEADERS and name.lower() != "content-length"
+        ]
+        lowered: Dict[str, str] = {name.lower(): value for name, value in response_headers}
+
+        rule = self.rules.content_type_rule(lowered.get("content-type", ""))
+        if rule:
+            self.stats.block(rule, host, len(response_body))
+            self.stats.add(bytes_transferred=len(response_body))
+            self.__deny(request)
+            return
+
+        self.stats.add(bytes_transferred=len(response_body))
+        if AssetCache.is_cacheable(request.command, response.status, lowered):
+            self.cache.put(url, response.status, response_headers, response_body)
+        self.__respond(request, response.status, response_headers, response_body)
+
+    @staticmethod
+    def __respond(request: BaseHTTPRequestHandler, status: int, headers: List[Tuple[str, str]], body: bytes) -> None:
+        request.send_response(status)
+        for name, value in headers:
+            request.send_header(name, value)
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        if request.command != "HEAD":
+            request.wfile.write(body)
+
+    def report(self) -> Dict[str, Any]:
+        return {**self.stats.report(), "cache_mb": round(self.cache.size_bytes / (1024 * 1024), 2)}
+
+    def __enter__(self):
+        threading.Thread(target=self.__server.serve_forever, name="filter-proxy", daemon=True).start()
+        logger.info(f"Filter proxy listening on {self.address}")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.__server.shutdown()
+        self.__server.server_close()
+        logger.info(f"Filter proxy -> {self.report()}")
@@ -0,0 +1,167 @@
+import logging
+
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+
+from typing import Dict, Any, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+class FixtureCorpus:
+    """
+    Recorded pages on disk: <corpus_dir>/manifest.json maps url path ("/hypermarkte/", "/aez/")
+    to html file inside <corpus_dir>/pages
+    """
+    def __init__(self, corpus_dir: str) -> None:
+        self.corpus_dir: str = corpus_dir
+        self.pages_dir: str = os.path.join(corpus_dir, "pages")
+        self.manifest_file: str = os.path.join(corpus_dir, "manifest.json")
+        self.manifest: Dict[str, Dict[str, Any]] = {}
+
+        if os.path.exists(self.manifest_file):
+            with open(self.manifest_file, "r", encoding="utf-8") as file:
+                self.manifest = json.load(file)
+
+    def add(self, url: str, html: str, shop_name: Optional[str] = None) -> None:
+        os.makedirs(self.pages_dir, exist_ok=True)
+        path: str = urlsplit(url).path or "/"
+        filename: str = f"{hashlib.sha1(path.encode('utf-8')).hexdigest()[:16]}.html"
+
+        with open(os.path.join(self.pages_dir, filename), "w", encoding="utf-8") as file:
+            file.write(html)
+        self.manifest[path] = {"file": filename, "shop_name": shop_name, "bytes": len(html.encode("utf-8"))}
+
+    def save(self) -> None:
+        with open(self.manifest_file, "w", encoding="utf-8") as file:
+            json.dump(self.manifest, file, indent=4, ensure_ascii=False)
+
+    def read(self, path: str) -> Optional[str]:
+        entry: Optional[Dict[str, Any]] = self.manifest.get(path)
+        if not entry:
+            return None
+        with open(os.path.join(self.pages_dir, entry["file"]), "r", encoding="utf-8") as file:
+            return file.read()
+
+    def shop_pages(self) -> Dict[str, str]:
+        """{shop_name: path} of all recorded shop pages (sidebar excluded)"""
+        return {entry["shop_name"]: path for path, entry in self.manifest.items() if entry.get("shop_name")}
+
+
+async def record_fixtures(corpus_dir: str, limit: Optional[int] = None, use_browser: bool = True) -> FixtureCorpus:
+    """Saves sidebar page and shop pages (rendered by the browser pool, or plain html with use_browser=False)"""
+    import asyncio
+    from ParserV2 import Parser
+
+    corpus: FixtureCorpus = FixtureCorpus(corpus_dir)
+
+    async with Parser(max_browsers=2, use_browser=use_browser) as parser:
+        requester = parser.requester
+
+        sidebar: Optional[str] = requester.send_request(parser.base_url)
+        if not sidebar:
+            raise RuntimeError(f"Sidebar page {parser.base_url} could not be downloaded")
+        corpus.add(parser.base_url, sidebar)
+
+        shops = parser.get_leftside_shop_list()[:limit]
+
+        async def record_shop(shop: Dict[str, str]) -> None:
+            await requester.rate_limiter.acquire(shop["link"])
+            if use_browser:
+                async with requester._get_browser() as tab:
+                    html = await asyncio.to_thread(requester._get_dynamic_page, tab.driver, shop["link"], shop["shop_name"])
+            else:
+                html = await asyncio.to_thread(requester._get_static_page, shop["link"], shop["shop_name"])
+
+            if html:
+                corpus.add(shop["link"], html, shop["shop_name"])
+            else:
+                logger.warning(f"Nothing recorded for {shop['shop_name']}")
+
+        await asyncio.gather(*(record_shop(shop) for shop in shops))
+
+    corpus.save()
+    logger.info(f"Recorded {len(corpus.manifest)} pages into {corpus_dir}")
+    return corpus
+
+
+class FixtureServer:
+    """
+    Local stand-in for prospektmaschine.de, replays a FixtureCorpus with random latency
+    (latency_ms range) and injected errors (error_rate share of requests answered with error_status)
+    """
+    def __init__(self, corpus: FixtureCorpus, latency_ms: Tuple[float, float] = (0, 0), error_rate: float = 0.0,
+                 error_status: int = 503, port: int = 0, seed: Optional[int] = None) -> None:
+        self.corpus: FixtureCorpus = corpus
+        self.latency_ms: Tuple[float, float] = latency_ms
+        self.error_rate: float = error_rate
+        self.error_status: int = error_status
+        self.requests_served: int = 0
+        self.errors_injected: int = 0
+
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__server = ThreadingHTTPServer(("127.0.0.1", port), self.__handler_class())
+        self.__server.daemon_threads = True
+        self.__thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.__server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _handle(self, request: BaseHTTPRequestHandler) -> None:
+        with self.__lock:
+            delay_ms: float = self.__random.uniform(*self.latency_ms)
+            inject_error: bool = self.__random.random() < self.error_rate
+            self.requests_served += 1
+            if inject_error:
+                self.errors_injected += 1
+
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+
+        if inject_error:
+            request.send_error(self.error_status)
+            return
+
+        html: Optional[str] = self.corpus.read(urlsplit(request.path).path)
+        if html is None:
+            request.send_error(404)
+            return
+
+        body: bytes = html.encode("utf-8")
+        request.send_response(200)
+        request.send_header("Content-Type", "text/html; charset=utf-8")
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    def __enter__(self):
+        self.__thread = threading.Thread(target=self.__server.serve_forever, name="fixture-server", daemon=True)
+        self.__thread.start()
+        logger.info(f"Fixture server listening on {self.base_url}")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.__server.shutdown()
+        self.__server.server_close()
@@ -0,0 +1,142 @@
+import logging
+
+import time
+import json
+import asyncio
+import statistics
+
+from typing import List, Dict, Any, Optional, Callable, Awaitable
+
+
+logger = logging.getLogger(__name__)
+
+
+# Resolves as soon as the amount of .brochure-thumb elements did not change for quiet_ms
+# (or when cap_ms runs out). Every time new cards show up the page is scrolled to the bottom
+# again, so the next lazy loaded chunk is requested right away instead of after fixed sleep
+LAZY_LOAD_SCRIPT = """
+const quietMs = arguments[0];
+const capMs = arguments[1];
+const done = arguments[arguments.length - 1];
+
+const start = performance.now();
+const count = () => document.querySelectorAll('.brochure-thumb').length;
+
+let last = count();
+let quietTimer = null;
+
+const finish = (reason) => {
+    observer.disconnect();
+    clearTimeout(quietTimer);
+    clearTimeout(capTimer);
+    done({count: last, elapsed_ms: performance.now() - start, reason: reason});
+};
+
+const restartQuietTimer = () => {
+    clearTimeout(quietTimer);
+    // nothing rendered yet -> keep waiting for the first cards (up to the cap)
+    quietTimer = setTimeout(() => last > 0 ? finish('quiet') : restartQuietTimer(), quietMs);
+};
+
+const observer = new MutationObserver(() => {
+    const current = count();
+    if (current !== last) {
+        last = current;
+        window.scrollTo(0, document.body.scrollHeight);
+        restartQuietTimer();
+    }
+});
+
+const capTimer = setTimeout(() => finish('cap'), capMs);
+
+observer.observe(document.body, {childList: true, subtree: true});
+window.scrollTo(0, document.body.scrollHeight);
+restartQuietTimer();
+"""
+
+
+# one step of the python side detector (multi-tab mode), the async script above would hold
+# the whole webdriver session, so the other tabs of the browser could not be used meanwhile
+POLL_SCRIPT = """
+window.scrollTo(0, document.body ? document.body.scrollHeight : 0);
+return document.querySelectorAll('.brochure-thumb').length;
+"""
+
+
+class LazyLoadDetector:
+    """Waits until the brochure grid stops growing and keeps per shop time-to-ready"""
+    def __init__(self, quiet_period_s: float = 0.75, hard_cap_s: float = 8.0) -> None:
+        self.quiet_period_s: float = quiet_period_s
+        self.hard_cap_s: float = hard_cap_s
+        self.ready_times: Dict[str, Dict[str, Any]] = {}
+
+    def wait(self, driver, shop_name: str) -> int:
+        """Blocks until the grid is complete, returns amount of brochure cards"""
+        start: float = time.perf_counter()
+
+        # script timeout has to be above the cap or selenium aborts the wait first
+        driver.set_script_timeout(self.hard_cap_s + 5)
+        try:
+            result: Optional[Dict[str, Any]] = driver.execute_async_script(
+                LAZY_LOAD_SCRIPT, int(self.quiet_period_s * 1000), int(self.hard_cap_s * 1000)
+            )
+        except Exception as e:
+            logger.warning(f"Lazy load detector failed for {shop_name}: {str(e)}")
+            result = None
+
+        result = result or {"count": 0, "reason": "error"}
+        self.record(shop_name, result["count"], time.perf_counter() - start, result["reason"])
+        return result["count"]
+
+    async def poll(self, execute_script: Callable[[str], Awaitable[Any]], shop_name: str, interval_s: float = 0.25) -> int:
+        """
+        Same quiet period / cap logic as wait(), but every check is a short script run through
+        execute_script, so the browser is free for other tabs between the checks
+        """
+        start: float = time.perf_counter()
+        last: int = -1
+        changed_at: float = start
+        reason: str = "cap"
+
+        try:
+            while time.perf_counter() - start < self.hard_cap_s:
+                count: int = await execute_script(POLL_SCRIPT)
+                now: float = time.perf_counter()
+                if count != last:
+                    last, changed_at = count, now
+                # nothing rendered yet -> keep waiting for the first cards (up to the cap)
+                elif count > 0 and now - changed_at >= self.quiet_period_s:
+                    reason = "quiet"
+                    break
+                await asyncio.sleep(interval_s)
+        except Exception as e:
+            logger.warning(f"Lazy load detector failed for {shop_name}: {str(e)}")
+            reason = "error"
+
+        last = max(last, 0)
+        self.record(shop_name, last, time.perf_counter() - start, reason)
+        return last
+
+    def record(self, shop_name: str, count: int, elapsed_s: float, reason: str) -> None:
+        self.ready_times[shop_name] = {"count": count, "elapsed_s": round(elapsed_s, 3), "reason": reason}
+
+        if reason == "cap":
+            logger.warning(f"Brochure grid of {shop_name} kept changing until the {self.hard_cap_s}s cap")
+        elif count == 0:
+            logger.warning(f"No brochure-thumb elements were found for {shop_name}")
+
+        logger.info(f"{shop_name} ready after {elapsed_s:.2f}s ({count} brochures, {reason})")
+
+    def summary(self) -> str:
+        if not self.ready_times:
+            return "no browser pages"
+
+        elapsed: List[float] = sorted(entry["elapsed_s"] for entry in self.ready_times.values())
+        capped: int = sum(1 for entry in self.ready_times.values() if entry["reason"] == "cap")
+        p95: float = elapsed[min(len(elapsed) - 1, int(len(elapsed) * 0.95))]
+        return f"time-to-ready p50: {statistics.median(elapsed):.2f}s, p95: {p95:.2f}s, max: {elapsed[-1]:.2f}s, capped: {capped}/{len(elapsed)}"
+
+    def dump(self, filename: str) -> None:
+        """Saves measured per shop times, used to tune quiet period and cap"""
+        with open(filename, "w", encoding="utf-8") as file:
+            json.dump({"quiet_period_s": self.quiet_period_s, "hard_cap_s": self.hard_cap_s, "shops": self.ready_times}, file, indent=4, ensure_ascii=False)
@@ -0,0 +1,9 @@
+import logging
+
+
+LOG_FORMAT: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+def configure_logging(level: int = logging.INFO) -> None:
+    """Called by entry points only (main.py, crawl worker processes, tools), importing a module never configures logging"""
+    logging.basicConfig(level=level, format=LOG_FORMAT)
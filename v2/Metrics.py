@@ -0,0 +1,205 @@
+import logging
+
+import os
+import json
+import time
+import asyncio
+import threading
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from typing import List, Dict, Any, Optional, Callable, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+# seconds, tuned for everything from a parse of a small page to a slow browser page load
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, keep_samples: int = 5000) -> None:
+        self.buckets: Tuple[float, ...] = buckets
+        self.counts: List[int] = [0] * (len(buckets) + 1)
+        self.count: int = 0
+        self.sum: float = 0.0
+        self.max: float = 0.0
+        # last keep_samples values, p50/p95 of the logs and json snapshot follow the recent crawls (CrawlDaemon runs for days)
+        self.samples: "deque[float]" = deque(maxlen=keep_samples)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        self.samples.append(value)
+
+    def percentile(self, share: float) -> float:
+        ordered: List[float] = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * share))] if ordered else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum_s": round(self.sum, 4),
+            "avg_s": round(self.sum / self.count, 4) if self.count else 0.0,
+            "p50_s": round(self.percentile(0.5), 4),
+            "p95_s": round(self.percentile(0.95), 4),
+            "max_s": round(self.max, 4)
+        }
+
+
+class Metrics:
+    """
+    Stage timers (pool_wait, page_load, lazy_load, page_source, static_fetch, parse, write),
+    per shop and aggregated, plus event counters (tiers, cache, retries, ...) and gauges read on export
+    """
+    def __init__(self) -> None:
+        self.stages: Dict[str, Histogram] = {}
+        self.shop_stages: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, int] = {}
+        self.gauges: Dict[str, Callable[[], float]] = {}
+        self.started_at: float = time.time()
+        self.__lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float, shop_name: Optional[str] = None) -> None:
+        with self.__lock:
+            self.stages.setdefault(stage, Histogram()).observe(seconds)
+            if shop_name:
+                shop: Dict[str, float] = self.shop_stages.setdefault(shop_name, {})
+                # a stage can run more than once per shop (http tier + browser, retries)
+                shop[stage] = shop.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def timer(self, stage: str, shop_name: Optional[str] = None):
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, shop_name)
+
+    def inc(self, event: str, amount: int = 1) -> None:
+        with self.__lock:
+            self.counters[event] = self.counters.get(event, 0) + amount
+
+    def gauge(self, name: str, read: Callable[[], float]) -> None:
+        """Registers value that is read only when metrics are exported (pool size, cache hits...)"""
+        self.gauges[name] = read
+
+    def __read_gauges(self) -> Dict[str, float]:
+        values: Dict[str, float] = {}
+        for name, read in self.gauges.items():
+            try:
+                values[name] = read()
+            except Exception as e:
+                logger.debug(f"Gauge {name} could not be read: {str(e)}")
+        return values
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.__lock:
+            return {
+                "timestamp": time.time(),
+                "uptime_s": round(time.time() - self.started_at, 1),
+                "stages": {stage: histogram.snapshot() for stage, histogram in self.stages.items()},
+                "counters": dict(self.counters),
+                "gauges": self.__read_gauges(),
+                "shops": {shop: {stage: round(seconds, 4) for stage, seconds in stages.items()} for shop, stages in self.shop_stages.items()}
+            }
+
+    def to_prometheus(self, prefix: str = "crawler") -> str:
+        lines: List[str] = []
+        with self.__lock:
+            lines.append(f"# TYPE {prefix}_stage_seconds histogram")
+            for stage, histogram in self.stages.items():
+                cumulative: int = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+            lines.append(f"# TYPE {prefix}_events_total counter")
+            for event, count in self.counters.items():
+                lines.append(f'{prefix}_events_total{{event="{event}"}} {count}')
+
+            for name, value in self.__read_gauges().items():
+                lines.append(f"# TYPE {prefix}_{name} gauge")
+                lines.append(f"{prefix}_{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        with self.__lock:
+            return ", ".join(
+                f"{stage}: p50 {histogram.percentile(0.5):.2f}s / p95 {histogram.percentile(0.95):.2f}s ({histogram.count}x)"
+                for stage, histogram in self.stages.items()
+            ) or "nothing measured"
+
+    def write_snapshot(self, filename: str) -> None:
+        tmp_file: str = f"{filename}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as file:
+            json.dump(self.snapshot(), file, indent=4, ensure_ascii=False)
+        os.replace(tmp_file, filename)
+
+
+class MetricsServer:
+    """Serves Metrics in Prometheus text format on http://<host>:<port>/metrics"""
+    def __init__(self, metrics: Metrics, port: int = 9464, host: str = "127.0.0.1") -> None:
+        self.metrics: Metrics = metrics
+
+        metrics_ref: Metrics = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                body: bytes = metrics_ref.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.__server = ThreadingHTTPServer((host, port), Handler)
+        self.__server.daemon_threads = True
+
+    def __enter__(self):
+        threading.Thread(target=self.__server.serve_forever, name="metrics-server", daemon=True).start()
+        host, port = self.__server.server_address[:2]
+        logger.info(f"Metrics available on http://{host}:{port}/metrics")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+
+class SnapshotWriter:
+    """Writes Metrics json snapshot every interval_s seconds (and once more on exit)"""
+    def __init__(self, metrics: Metrics, filename: str = "./metrics.json", interval_s: float = 15.0) -> None:
+        self.metrics: Metrics = metrics
+        self.filename: str = filename
+        self.interval_s: float = interval_s
+        self.__task: Optional[asyncio.Task] = None
+
+    async def __loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_s)
+            await asyncio.to_thread(self.metrics.write_snapshot, self.filename)
+
+    async def __aenter__(self):
+        self.__task = asyncio.create_task(self.__loop())
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self.__task:
+            self.__task.cancel()
+        self.metrics.write_snapshot(self.filename)
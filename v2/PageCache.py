@@ -0,0 +1,193 @@
+import logging
+
+import os
+import gzip
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from typing import Dict, Any, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class PageCache:
+    """
+    Persistent page cache. Bodies are stored gzipped under their sha256 hash
+    (same page for several urls is stored only once), index keeps per url info
+    like etag/last-modified and fetch time and is kept in LRU order
+    """
+    def __init__(self, cache_dir: str = "./.page_cache", max_bytes: int = 200 * 1024 * 1024, browser_ttl_s: float = 6 * 3600) -> None:
+        self.cache_dir: str = cache_dir
+        self.objects_dir: str = os.path.join(cache_dir, "objects")
+        self.index_file: str = os.path.join(cache_dir, "index.json")
+        self.max_bytes: int = max_bytes
+        self.browser_ttl_s: float = browser_ttl_s
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.revalidations: int = 0
+
+        self.__lock = threading.Lock()
+        self.__missed_urls: set = set()
+
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.__index: "OrderedDict[str, Dict[str, Any]]" = self.__load_index()
+
+        # objects can be shared between urls: urls per hash, size of the store counts every hash once
+        self.__refs: Dict[str, int] = {}
+        self.__bytes: int = 0
+        for entry in self.__index.values():
+            self.__ref(entry)
+
+    def __load_index(self) -> "OrderedDict[str, Dict[str, Any]]":
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as file:
+                return OrderedDict(json.load(file))
+        except FileNotFoundError:
+            return OrderedDict()
+        except json.JSONDecodeError:
+            logger.warning(f"Cache index {self.index_file} is corrupted, starting with empty cache")
+            return OrderedDict()
+
+    def save(self) -> None:
+        """Writes index to disk atomically (temp file + rename)"""
+        with self.__lock:
+            tmp_file: str = f"{self.index_file}.tmp"
+            with open(tmp_file, "w", encoding="utf-8") as file:
+                json.dump(self.__index, file)
+            os.replace(tmp_file, self.index_file)
+
+    def __object_path(self, content_hash: str) -> str:
+        return os.path.join(self.objects_dir, f"{content_hash}.html.gz")
+
+    def __read_object(self, content_hash: str) -> Optional[str]:
+        try:
+            with gzip.open(self.__object_path(content_hash), "rt", encoding="utf-8") as file:
+                return file.read()
+        except (FileNotFoundError, OSError, EOFError):
+            return None
+
+    def __ref(self, entry: Dict[str, Any]) -> None:
+        self.__refs[entry["hash"]] = self.__refs.get(entry["hash"], 0) + 1
+        if self.__refs[entry["hash"]] == 1:
+            self.__bytes += entry["size"]
+
+    def __unref(self, entry: Dict[str, Any]) -> None:
+        """Drops one url of the object, the object itself goes when no url uses it anymore"""
+        self.__refs[entry["hash"]] -= 1
+        if self.__refs[entry["hash"]]:
+            return
+        del self.__refs[entry["hash"]]
+        self.__bytes -= entry["size"]
+        try:
+            os.remove(self.__object_path(entry["hash"]))
+        except FileNotFoundError:
+            pass
+
+    def __evict(self) -> None:
+        """Drops least recently used urls until the store fits into max_bytes"""
+        while self.__index and self.__bytes > self.max_bytes:
+            url, entry = self.__index.popitem(last=False)
+            self.__unref(entry)
+            logger.info(f"Evicted {url} from page cache")
+
+    def start_run(self) -> None:
+        """Next crawl of the same process (CrawlDaemon), its misses are counted again"""
+        with self.__lock:
+            self.__missed_urls.clear()
+
+    def __count_miss(self, url: str) -> None:
+        # once per url, a retry or the next tier of the same page is not another miss
+        if url not in self.__missed_urls:
+            self.__missed_urls.add(url)
+            self.misses += 1
+
+    def get_fresh(self, url: str) -> Optional[str]:
+        """Returns body of a browser fetched page if it is younger than browser_ttl_s"""
+        with self.__lock:
+            entry: Optional[Dict[str, Any]] = self.__index.get(url)
+            if not entry or entry["tier"] != "browser" or time.time() - entry["fetched_at"] > self.browser_ttl_s:
+                self.__count_miss(url)
+                return None
+
+            body: Optional[str] = self.__read_object(entry["hash"])
+            if body is None:
+                self.__count_miss(url)
+                return None
+
+            self.__index.move_to_end(url)
+            self.hits += 1
+            return body
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """If-None-Match / If-Modified-Since headers for the http tier"""
+        with self.__lock:
+            entry: Optional[Dict[str, Any]] = self.__index.get(url)
+            # sidebar pages are looked up only here
+            self.__count_miss(url)
+            if not entry or entry["tier"] != "http":
+                return {}
+
+            headers: Dict[str, str] = {}
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+            return headers
+
+    def revalidated(self, url: str) -> Optional[str]:
+        """Called on 304 response, returns stored body and refreshes the entry"""
+        with self.__lock:
+            entry: Optional[Dict[str, Any]] = self.__index.get(url)
+            if not entry:
+                return None
+
+            body: Optional[str] = self.__read_object(entry["hash"])
+            if body is None:
+                return None
+
+            entry["fetched_at"] = time.time()
+            self.__index.move_to_end(url)
+            # 304 turns the miss of the lookup into a revalidation
+            if url in self.__missed_urls:
+                self.__missed_urls.discard(url)
+                self.misses -= 1
+            self.revalidations += 1
+            return body
+
+    def store(self, url: str, html: str, tier: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        data: bytes = html.encode("utf-8")
+        content_hash: str = hashlib.sha256(data).hexdigest()
+
+        with self.__lock:
+            path: str = self.__object_path(content_hash)
+            if not os.path.exists(path):
+                tmp_path: str = f"{path}.tmp"
+                with gzip.open(tmp_path, "wb") as file:
+                    file.write(data)
+                os.replace(tmp_path, path)
+
+            entry: Dict[str, Any] = {
+                "hash": content_hash,
+                "size": os.path.getsize(path),
+                "tier": tier,
+                "etag": etag,
+                "last_modified": last_modified,
+                "fetched_at": time.time()
+            }
+            # reference the new object before the old one is dropped, they can be the same
+            self.__ref(entry)
+            previous: Optional[Dict[str, Any]] = self.__index.get(url)
+            if previous:
+                self.__unref(previous)
+
+            self.__index[url] = entry
+            self.__index.move_to_end(url)
+            self.__evict()
+
+    def stats(self) -> str:
+        return f"hits: {self.hits}, misses: {self.misses}, revalidated: {self.revalidations}"
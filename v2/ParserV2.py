@@ -1,26 +1,70 @@
 import logging
 
-from RequestMaker import Requester
+from PageCache import PageCache
+from Metrics import Metrics
+from BrochureParsing import parse_brochures
+from DateRange import parse_date_range
+from ResultSink import NDJSONSink
+from CrawlJournal import CrawlJournal
+from RetryScheduler import RetryScheduler, ShopFetchError
+from BrochureStore import BrochureStore
+from CrawlFrontier import CrawlFrontier, discover_categories
 
 from bs4 import BeautifulSoup
 
 import asyncio
 
 from datetime import datetime
-import re
 import json
-from typing import List, Dict, Tuple, Any, Optional, Union
+import multiprocessing
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import List, Dict, Tuple, Any, Optional, Union, TYPE_CHECKING
+
+# selenium / webdriver_manager / requests come in only with the first use of Parser.requester,
+# so parse-only jobs (main.py parse-from-disk / export / stats) start without them
+if TYPE_CHECKING:
+    from RequestMaker import Requester
+    from ThumbnailStore import ThumbnailDownloader
 
 
-logging.basicConfig(level=logging.INFO, format="format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'")
 logger = logging.getLogger(__name__)
 
 
 class Parser:
-    def __init__(self, max_browsers: int = 3, max_concurrent: int = 8, base_delay: float = 1.0) -> None:
-        self.requester = Requester(max_browsers, max_concurrent, base_delay)
+    def __init__(self, max_browsers: int = 3, max_concurrent: int = 8, base_delay: float = 1.0, use_http_tier: bool = True, page_cache: Optional[PageCache] = None,
+                 parse_mode: str = "thread", parse_workers: int = 2, parser_backend: str = "html.parser", parse_grid_only: bool = False,
+                 site_url: str = "https://www.prospektmaschine.de", fetch_workers: Optional[int] = None, queue_size: int = 16,
+                 thumbnail_dir: Optional[str] = None, **requester_options) -> None:
+        self.__requester: Optional["Requester"] = None
+        self.__requester_args: Tuple[Any, ...] = (max_browsers, max_concurrent, base_delay, use_http_tier, page_cache)
+        self.__requester_options: Dict[str, Any] = requester_options
+        self.metrics: Metrics = requester_options.pop("metrics", None) or Metrics()
         self.json_output: str = "./result.json"
-        self.base_url: str = "https://www.prospektmaschine.de/hypermarkte/"
+        # site_url can point to a local fixture server (see FixtureServer.py)
+        self.site_url: str = site_url.rstrip("/")
+        self.base_url: str = f"{self.site_url}/hypermarkte/"
+        # seconds from start to finish of every shop of the last get_all_shop_data
+        self.shop_timings: Dict[str, float] = {}
+
+        self.parser_backend: str = parser_backend
+        self.parse_grid_only: bool = parse_grid_only
+        self.parse_executor: Optional[Executor] = Parser.__create_parse_executor(parse_mode, parse_workers)
+
+        # pipeline stages: fetch workers default to the concurrency limit, parse workers match the parse executor
+        self.fetch_workers: int = fetch_workers or max_concurrent
+        self.pipeline_parse_workers: int = parse_workers if self.parse_executor else 1
+        self.queue_size: int = queue_size
+
+        # with thumbnail_dir images of parsed brochures are downloaded into a content addressed store
+        self.thumbnails: Optional["ThumbnailDownloader"] = self.__create_thumbnails(thumbnail_dir) if thumbnail_dir else None
+
+    @property
+    def requester(self) -> "Requester":
+        """Created on first use, parsing alone never starts it"""
+        if self.__requester is None:
+            from RequestMaker import Requester
+            self.__requester = Requester(*self.__requester_args, metrics=self.metrics, **self.__requester_options)
+        return self.__requester
     
 
     async def __aenter__(self):
@@ -28,44 +72,132 @@ class Parser:
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        await self.requester.__aexit__(exc_type, exc_val, exc_tb)
+        if self.__requester is not None:
+            await self.__requester.__aexit__(exc_type, exc_val, exc_tb)
+        self.close()
+
+    def close(self) -> None:
+        """
+        Releases parse executor, thumbnails and the http session, browsers are closed only by `async with`.
+        Enough for parse only / sidebar only use without it
+        """
+        if self.__requester is not None:
+            self.__requester.session.close()
+        if self.thumbnails:
+            self.thumbnails.close()
+        if self.parse_executor:
+            self.parse_executor.shutdown(wait=True)
 
+    def __create_thumbnails(self, thumbnail_dir: str) -> "ThumbnailDownloader":
+        from ThumbnailStore import ThumbnailStore, ThumbnailDownloader
+        return ThumbnailDownloader(ThumbnailStore(thumbnail_dir), f"{self.site_url}/", metrics=self.metrics)
 
-    async def get_all_shop_data(self):
+    @staticmethod
+    def __create_parse_executor(parse_mode: str, parse_workers: int) -> Optional[Executor]:
+        """'thread' / 'process' executor for parse_info, 'inline' parses directly on the event loop"""
+        if parse_mode == "thread":
+            return ThreadPoolExecutor(max_workers=parse_workers, thread_name_prefix="parse")
+        if parse_mode == "process":
+            return ProcessPoolExecutor(max_workers=parse_workers, mp_context=multiprocessing.get_context("spawn"))
+        if parse_mode == "inline":
+            return None
+        raise ValueError(f"Unknown parse mode: {parse_mode}")
+
+
+    async def get_all_shop_data(self, shop_data: Optional[List[Dict[str, str]]] = None, sink: Optional[NDJSONSink] = None,
+                                journal: Optional[CrawlJournal] = None, retry: Optional[RetryScheduler] = None):
+        """
+        Crawls all given shops (whole sidebar if shop_data is None).
+        With sink every shop is appended to it as soon as it is done and nothing is kept in memory.
+        With journal shops finished in a previous run are not fetched again, their stored brochures are reused.
+        Shops go through CrawlPipeline (bounded fetch -> parse -> write stages), failed ones are retried
+        after all others (see RetryScheduler), shops still failing end up in retry.dead_letter
+        """
         results: List[Dict[str, Any]] = []
-        completed: int = 0
+        # per crawl state, the Parser can be reused for several crawls
+        if self.thumbnails:
+            self.thumbnails.start_run()
+        if self.requester.page_cache:
+            self.requester.page_cache.start_run()
 
-        shop_data: List[Dict[str, str]] = self.get_leftside_shop_list()
+        if shop_data is None:
+            shop_data = self.get_leftside_shop_list()
 
         logger.info(f"Found {len(shop_data)} shops")
-        logger.info(f"Using Firefox with settings: {self.requester.pool.maxsize} browsers, {self.requester.semaphore._value} concurrent, {self.requester.base_delay}s base delay")
-        
-        tasks = [
-            self.requester.send_shop_request(shop_name=shop.get("shop_name"), url=shop.get("link"), parse_shop_page_func=self.parse_info)
-            for shop in shop_data
-        ]
-
-        for coro in asyncio.as_completed(tasks):
-            result = await coro
-            results.append(result)
-            completed += 1
-
-            logger.info(f"""
-                Progress: {completed}/{len(tasks)},
-                Success: {self.requester.successful_requests},
-                Failed: {self.requester.failed_requests},
-                Errors: {self.requester.error_count}
-            """)
+        logger.info(f"Using Firefox with settings: {self.requester.pool.min_size}-{self.requester.pool.max_size} browsers, {self.requester.semaphore._value} concurrent, {self.requester.rate_limiter.options['rate_per_min']:.0f} pages/min starting rate")
+
+        if journal:
+            for shop_name, brochures in journal.done_shops(shop_data):
+                if sink is None:
+                    results.append((brochures, shop_name))
+                elif brochures:
+                    sink.append(shop_name, brochures)
+
+            shop_data = journal.start(shop_data)
+            logger.info(f"Journal -> {journal.summary()}, fetching {len(shop_data)} unfinished shops")
+
+        from CrawlPipeline import CrawlPipeline
+
+        retry = retry or RetryScheduler()
+        pipeline: CrawlPipeline = CrawlPipeline(self.requester, self.parse_info, self.fetch_workers, self.pipeline_parse_workers, self.queue_size, retry,
+                                                self.thumbnails)
+        total: int = len(shop_data)
+
+        def on_result(shop: Dict[str, str], brochures: List[Dict[str, Any]], error: Optional[ShopFetchError]) -> None:
+            if sink is None:
+                results.append((brochures, shop["shop_name"]))
+            elif brochures:
+                sink.append(shop["shop_name"], brochures)
+
+            if journal:
+                # a shop without brochures at the moment comes without error, it is done as well
+                if error is None:
+                    journal.mark_done(shop["link"], shop["shop_name"], brochures)
+                else:
+                    journal.mark_failed(shop["link"], shop["shop_name"], f"{error.error_class}: {str(error)}")
+            self.__log_progress(pipeline.completed + 1, total)
+
+        await pipeline.run(shop_data, on_result)
+        self.shop_timings.update(pipeline.shop_timings)
+
+        if retry.dead_letter is not None:
+            retry.dead_letter.save()
 
         logger.info("--PARSING COMPLETED--")
+        logger.info(f"Retries -> {retry.summary()}")
+        logger.info(f"Shops served by tier -> {self.requester.tier_summary()}")
+        logger.info(f"Lazy load -> {self.requester.lazy_load.summary()}")
+        logger.info(f"Browser pool -> {self.requester.pool.metrics()}")
+        logger.info(f"Rate limiter -> {self.requester.rate_limiter.summary()}")
+        if self.thumbnails:
+            logger.info(f"Thumbnails -> {self.thumbnails.summary()}")
+        logger.info(f"Stages -> {self.metrics.summary()}")
         
         successful_results = [result[0] for result in results if result and result[0]]
         return successful_results
 
-    def get_leftside_shop_list(self) -> List[Dict[str, str]]:
-        """Returns the list of all the shops inside the side panel with info like url and shop's name"""
-        html: str = self.requester.send_request(self.base_url)
-        
+    def __log_progress(self, completed: int, total: int) -> None:
+        logger.info(f"""
+            Progress: {completed}/{total},
+            Success: {self.requester.successful_requests},
+            Failed: {self.requester.failed_requests},
+            Errors: {self.requester.error_count},
+            Cache: {self.requester.page_cache.stats() if self.requester.page_cache else "disabled"},
+            Browsers: {self.requester.pool.size}/{self.requester.pool.max_size}
+        """)
+
+    def get_leftside_shop_list(self, url: Optional[str] = None) -> List[Dict[str, str]]:
+        """Returns the list of all the shops inside the side panel (of base_url or given category page) with info like url and shop's name"""
+        return self.__sidebar_shops(self.__sidebar_page(url or self.base_url))
+
+    def __sidebar_page(self, url: str) -> str:
+        """send_request logs the error and returns None, without the sidebar there is nothing to crawl"""
+        html: Optional[str] = self.requester.send_request(url)
+        if html is None:
+            raise RuntimeError(f"Sidebar page {url} couldn't be fetched")
+        return html
+
+    def __sidebar_shops(self, html: str) -> List[Dict[str, str]]:
         soup: BeautifulSoup = BeautifulSoup(html, 'html.parser')
         
         shops: List[Dict[str, str]] = []
@@ -77,64 +209,47 @@ class Parser:
             if not link:
                 continue
             
-            shops.append({"shop_name": li.text.strip(),"link": f"https://www.prospektmaschine.de{link}"})
+            shops.append({"shop_name": li.text.strip(),"link": f"{self.site_url}{link}"})
         
         return shops
-        
-    async def parse_info(self, html: str, shop_name: str) -> List[Dict[str, str]]:  
-        soup: BeautifulSoup = BeautifulSoup(html, "html.parser")
 
-        brochures_grid = soup.find("div", attrs={"class": "page-body"}).find("div", attrs={"class": "letaky-grid"})
-        brochures = brochures_grid.find_all("div", attrs={"class": "brochure-thumb"})
+    def get_all_categories_shop_list(self, frontier: CrawlFrontier) -> CrawlFrontier:
+        """
+        Adds sidebars of all categories of the top navigation into frontier (it dedupes shops listed
+        in several categories). Without navigation only the base_url sidebar is used
+        """
+        html: str = self.__sidebar_page(self.base_url)
+        categories: List[Dict[str, str]] = discover_categories(html, self.site_url)
+        if not categories:
+            logger.warning("No category navigation found, crawling only the base category")
+            frontier.add_category(self.base_url.rstrip("/").rsplit("/", 1)[-1], self.__sidebar_shops(html))
+            return frontier
 
-        brochures_parsed: List[Dict[str, str]] = []
-        for brochure in brochures:
+        for category in categories:
             try:
-                description_tag = brochure.find("div", attrs={"class": "letak-description"})
-                title_tag = description_tag.find("strong")
-                dates_tag = description_tag.find("small", attrs={"class": "hidden-sm"})
-                
-                image_tag = brochure.find("div", attrs={"class": "img-container"}).find("img")
-
-                if dates_tag:
-                    parsed_date: Tuple[datetime, datetime] = Parser.parse_date(dates_tag.text)
-                    valid_from: datetime = parsed_date[0]
-                    valid_to: datetime = parsed_date[1]
-
-                info = {
-                    "title": title_tag.text if title_tag else "Not found",
-                    "thumbnail": image_tag.get("src") or image_tag.get("data-src") if image_tag else "Not found",
-                    "shop_name": shop_name,
-                    "valid_from": valid_from.strftime('%m-%d-%Y') if valid_from else "Not found",
-                    "valid_to": valid_to.strftime('%m-%d-%Y') if valid_to else "Not specified",
-                    "parsed_time": datetime.now().strftime("%m-%d-%Y %H:%M:%S")
-                }
-                brochures_parsed.append(info)
+                page: str = html if category["link"] == self.base_url else self.__sidebar_page(category["link"])
+                frontier.add_category(category["category"], self.__sidebar_shops(page))
             except Exception as e:
-                logger.error(f"Error while parsing html of {shop_name}: {str(e)}")
+                logger.error(f"Sidebar of category {category['category']} couldn't be read: {str(e)}")
 
-        return brochures_parsed
+        logger.info(f"Found {len(categories)} categories")
+        return frontier
+        
+    async def parse_info(self, html: str, shop_name: str, require_complete: bool = False) -> List[Dict[str, str]]:
+        """Runs the (CPU bound) parsing in parse executor so big pages don't block other requests"""
+        # with an executor the time includes waiting for a free parse worker
+        with self.metrics.timer("parse", shop_name):
+            if self.parse_executor is None:
+                return parse_brochures(html, shop_name, self.parser_backend, self.parse_grid_only, require_complete)
+
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.parse_executor, parse_brochures, html, shop_name, self.parser_backend, self.parse_grid_only, require_complete
+            )
 
     @staticmethod
     def parse_date(date: str) -> Tuple[Optional[datetime]]:
-        try:
-            # if date has smth like "von Montag 03.03.2025" inside
-            if date.find("-") == -1:
-                clean_date = re.sub(r"[^\d.]", "", date).replace(" ", "")
-                valid_from = datetime.strptime(clean_date, "%d.%m.%Y")
-                return (valid_from, None)
-            # for formats like this "03.03.2025 - 30.03.2025"
-            else:
-                date_splitted = date.replace(" ", "").split("-")
-                valid_from = datetime.strptime(date_splitted[0], "%d.%m.%Y")
-                valid_to = datetime.strptime(date_splitted[1], "%d.%m.%Y")
-                return (valid_from, valid_to)
-        except ValueError as ve:
-            print(f"Incorrect date format...: {ve}")
-            return (None, None)
-        except Exception as e:
-            print(f"Date parsing error occured...: {e}")
-            return (None, None)
+        return parse_date_range(date)
     
     def check_output_file_exists(self) -> bool:
         try:        
@@ -151,3 +266,8 @@ class Parser:
         except FileNotFoundError as fnfe:
             print(f"'{self.json_output=}' not found...")
             return False
+
+    def write_to_sqlite(self, data: List[List[Dict[str, Any]]], db_path: str = "./brochures.db") -> int:
+        """Same data as write_to_json, upserted into BrochureStore (see BrochureStore.py for queries)"""
+        with BrochureStore(db_path) as store:
+            return store.import_shops(data)
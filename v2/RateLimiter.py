@@ -0,0 +1,140 @@
+import logging
+
+import asyncio
+import threading
+import time
+from urllib.parse import urlsplit
+
+from typing import Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class HostLimiter:
+    """
+    Token bucket of one host. The refill rate is adapted with AIMD: every successful page adds
+    `increase_per_min` to the rate, every 429/5xx/timeout multiplies it by `decrease_factor`
+    """
+    def __init__(self, rate_per_min: float, min_rate_per_min: float, max_rate_per_min: float, burst: float,
+                 increase_per_min: float, decrease_factor: float, latency_alpha: float) -> None:
+        self.rate_per_min: float = rate_per_min
+        self.min_rate_per_min: float = min_rate_per_min
+        self.max_rate_per_min: float = max_rate_per_min
+        self.burst: float = burst
+        self.increase_per_min: float = increase_per_min
+        self.decrease_factor: float = decrease_factor
+        self.latency_alpha: float = latency_alpha
+
+        self.tokens: float = burst
+        self.updated_at: float = time.monotonic()
+        self.avg_latency_s: Optional[float] = None
+        self.successes: int = 0
+        self.throttles: int = 0
+
+        self.__lock = threading.Lock()
+
+    def __refill(self) -> None:
+        now: float = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate_per_min / 60)
+        self.updated_at = now
+
+    def try_take(self) -> float:
+        """Takes a token and returns 0, or returns how many seconds to wait for the next one"""
+        with self.__lock:
+            self.__refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) * 60 / self.rate_per_min
+
+    def on_success(self, latency_s: float) -> None:
+        with self.__lock:
+            self.successes += 1
+            self.avg_latency_s = latency_s if self.avg_latency_s is None else \
+                self.latency_alpha * latency_s + (1 - self.latency_alpha) * self.avg_latency_s
+            self.rate_per_min = min(self.max_rate_per_min, self.rate_per_min + self.increase_per_min)
+
+    def on_throttle(self) -> None:
+        with self.__lock:
+            self.throttles += 1
+            self.rate_per_min = max(self.min_rate_per_min, self.rate_per_min * self.decrease_factor)
+            # drop saved up burst as well, otherwise next requests go out right away
+            self.tokens = min(self.tokens, 0.0)
+
+
+class RateLimiter:
+    """Per host request pacing, acquire() is awaited before a concurrency slot/browser is taken"""
+    def __init__(self, rate_per_min: float = 60, min_rate_per_min: float = 6, max_rate_per_min: float = 120, burst: float = 2,
+                 increase_per_min: float = 1, decrease_factor: float = 0.5, latency_alpha: float = 0.2) -> None:
+        self.options: Dict[str, float] = {
+            "rate_per_min": rate_per_min,
+            "min_rate_per_min": min_rate_per_min,
+            "max_rate_per_min": max_rate_per_min,
+            "burst": burst,
+            "increase_per_min": increase_per_min,
+            "decrease_factor": decrease_factor,
+            "latency_alpha": latency_alpha
+        }
+        self.hosts: Dict[str, HostLimiter] = {}
+        # acquire() runs on the event loop, wait()/record() also in worker threads
+        self.__lock = threading.Lock()
+
+    def host(self, url: str) -> HostLimiter:
+        netloc: str = urlsplit(url).netloc
+        limiter: Optional[HostLimiter] = self.hosts.get(netloc)
+        if limiter is None:
+            with self.__lock:
+                limiter = self.hosts.get(netloc)
+                if limiter is None:
+                    limiter = self.hosts[netloc] = HostLimiter(**self.options)
+        return limiter
+
+    async def acquire(self, url: str) -> float:
+        """Waits for a token of the url's host, returns the time spent waiting"""
+        limiter: HostLimiter = self.host(url)
+        waited: float = 0.0
+
+        while True:
+            wait_s: float = limiter.try_take()
+            if wait_s == 0:
+                return waited
+            await asyncio.sleep(wait_s)
+            waited += wait_s
+
+    def wait(self, url: str) -> float:
+        """Blocking acquire for requests made from worker threads, returns the time spent waiting"""
+        limiter: HostLimiter = self.host(url)
+        waited: float = 0.0
+
+        while True:
+            wait_s: float = limiter.try_take()
+            if wait_s == 0:
+                return waited
+            time.sleep(wait_s)
+            waited += wait_s
+
+    def record(self, url: str, latency_s: float, status: Optional[int] = None, timeout: bool = False) -> None:
+        """Feeds the result of one request back: 429/5xx and timeouts slow the host down, anything else speeds it up"""
+        limiter: HostLimiter = self.host(url)
+
+        if timeout or status == 429 or (status is not None and status >= 500):
+            limiter.on_throttle()
+            logger.warning(f"Throttling {urlsplit(url).netloc} to {limiter.rate_per_min:.1f} pages/min ({'timeout' if timeout else status})")
+        else:
+            limiter.on_success(latency_s)
+
+    @property
+    def error_count(self) -> int:
+        return sum(limiter.throttles for limiter in list(self.hosts.values()))
+
+    @property
+    def avg_latency_s(self) -> Optional[float]:
+        latencies = [limiter.avg_latency_s for limiter in list(self.hosts.values()) if limiter.avg_latency_s is not None]
+        return sum(latencies) / len(latencies) if latencies else None
+
+    def summary(self) -> str:
+        return ", ".join(
+            f"{host}: {limiter.rate_per_min:.1f} pages/min, avg latency {limiter.avg_latency_s or 0:.2f}s, {limiter.throttles} throttles"
+            for host, limiter in list(self.hosts.items())
+        ) or "no requests"
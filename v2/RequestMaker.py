@@ -1,30 +1,58 @@
 import logging
 
 from selenium import webdriver
-from selenium.webdriver.firefox.service import Service
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.firefox import GeckoDriverManager
 from selenium.webdriver.common.by import By
+from selenium.common.exceptions import TimeoutException
 
 import asyncio
 import requests
+from requests.adapters import HTTPAdapter
 import time
-from contextlib import asynccontextmanager
 
 from typing import List, Dict, Tuple, Any, Optional, Union, Callable
 import random
 
+from PageCache import PageCache
+from LazyLoadDetector import LazyLoadDetector
+from BrowserPool import BrowserPool, BrowserTab
+from RateLimiter import RateLimiter
+from Metrics import Metrics
+from RetryScheduler import ShopFetchError, classify_error, TIMEOUT, NO_PAGE_BODY, EMPTY_GRID, HTTP_ERROR
+from BrochureParsing import NoGridError, IncompleteGridError
+
 
-logging.basicConfig(level=logging.INFO, format="format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'")
 logger = logging.getLogger(__name__)
 
 
+# fetch tiers from the cheapest one, a page that is not complete falls back to the next tier
+FETCH_TIERS: Tuple[str, ...] = ("cache", "http", "browser")
+
+
+def next_tier(tier: str) -> str:
+    return FETCH_TIERS[min(FETCH_TIERS.index(tier) + 1, len(FETCH_TIERS) - 1)]
+
+
 class Requester:
-    def __init__(self, max_browsers: int = 3, max_concurrent: int = 8, base_delay: float = 1.0) -> None:
+    def __init__(self, max_browsers: int = 3, max_concurrent: int = 8, base_delay: float = 1.0, use_http_tier: bool = True, page_cache: Optional[PageCache] = None,
+                 lazy_quiet_s: float = 0.75, lazy_cap_s: float = 8.0, min_browsers: int = 1, use_browser: bool = True,
+                 rate_limiter: Optional[RateLimiter] = None, metrics: Optional[Metrics] = None, **pool_options) -> None:
         self.semaphore = asyncio.Semaphore(max_concurrent)
-        self.pool = asyncio.Queue(maxsize=max_browsers)
         self.base_delay = base_delay
+        # base_delay is the starting gap between pages of one host, AIMD adapts it from there
+        self.rate_limiter = rate_limiter or RateLimiter(rate_per_min=60 / base_delay if base_delay > 0 else 120)
+        self.use_http_tier = use_http_tier
+        # without browser only the http tier (and cache) is used, no Firefox is started
+        self.use_browser = use_browser
+        self.page_cache = page_cache
+        self.lazy_load = LazyLoadDetector(lazy_quiet_s, lazy_cap_s)
+
+        # keep-alive session shared by all static requests (sidebar + http tier)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_concurrent)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
         self.user_agents = [
             "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
@@ -34,181 +62,315 @@ class Requester:
             "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Safari/605.1.15"
         ]
 
+        self.pool = BrowserPool(self.user_agents, min_size=min_browsers, max_size=max_browsers, **pool_options)
+
         self.total_requests: int = 0
         self.successful_requests: int = 0
         self.failed_requests: int = 0
-        self.avg_response_time: float = 8.0
-        self.error_count: int = 0
+
+        # how many shops were served by each fetch tier
+        self.tier_counts: Dict[str, int] = {"cache": 0, "http": 0, "browser": 0}
+        self.browser_time_s: float = 0.0
+
+        # per stage timings and event counters, exported by MetricsServer / SnapshotWriter
+        self.metrics: Metrics = metrics or Metrics()
+        self.__register_gauges()
 
     async def __aenter__(self):
-        await self.__init_browser_pool()
+        if self.use_browser:
+            await self.pool.start()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         await self.__cleanup()
 
-    async def __init_browser_pool(self):
-        logger.info(f"Initializing pool with max: {self.pool.maxsize}")
+    async def __cleanup(self):
+        await self.pool.close()
+        self.session.close()
+        if self.page_cache:
+            self.page_cache.save()
+
+    def __register_gauges(self) -> None:
+        self.metrics.gauge("browsers", lambda: self.pool.size)
+        self.metrics.gauge("browsers_recycled", lambda: self.pool.recycled)
+        self.metrics.gauge("browsers_restarted", lambda: self.pool.restarted)
+        self.metrics.gauge("throttles", lambda: self.rate_limiter.error_count)
+        if self.page_cache:
+            self.metrics.gauge("cache_hits", lambda: self.page_cache.hits)
+            self.metrics.gauge("cache_misses", lambda: self.page_cache.misses)
+            self.metrics.gauge("cache_revalidations", lambda: self.page_cache.revalidations)
+
+    def _get_browser(self):
+        return self.pool.lease()
+
+    @property
+    def avg_response_time(self) -> Optional[float]:
+        """Moving average of the real page latency"""
+        return self.rate_limiter.avg_latency_s
+
+    @property
+    def error_count(self) -> int:
+        """429/5xx responses and timeouts so far"""
+        return self.rate_limiter.error_count
+
+    def _load_dynamic_page(self, driver: webdriver.Firefox, url: str, shop_name: str) -> str:
+        """Renders the page in the driver, failures are raised as ShopFetchError with their error class"""
+        logger.info(f"Getting dynamic page for {shop_name}")
+
+        driver.set_page_load_timeout(30)
+        driver.implicitly_wait(10)
+
+        start: float = time.perf_counter()
+        try:
+            driver.get(url)
+        except TimeoutException as e:
+            self.rate_limiter.record(url, time.perf_counter() - start, timeout=True)
+            raise ShopFetchError(TIMEOUT, f"Page load of {shop_name} timed out") from e
+        self.rate_limiter.record(url, time.perf_counter() - start)
 
-        for i in range(self.pool.maxsize):
-            options = webdriver.FirefoxOptions()
+        try:
+            WebDriverWait(driver, 15).until(
+                EC.presence_of_element_located((By.CLASS_NAME, "page-body"))
+            )
+        except TimeoutException as e:
+            raise ShopFetchError(NO_PAGE_BODY, f"No page-body in the page of {shop_name}") from e
+        self.metrics.observe("page_load", time.perf_counter() - start, shop_name)
 
-            options.add_argument("--headless")
-            options.add_argument("--disable-gpu")
-            options.add_argument("--width=1920")
-            options.add_argument("--height=1080")
+        # returns as soon as the grid stops growing instead of fixed scroll sleeps
+        with self.metrics.timer("lazy_load", shop_name):
+            self.lazy_load.wait(driver, shop_name)
 
-            profile = webdriver.FirefoxProfile()
+        with self.metrics.timer("page_source", shop_name):
+            return driver.page_source
 
-            profile.set_preference("dom.webdriver.enabled", False)
-            profile.set_preference("useAutomationExtension", False)
-            profile.set_preference("marionette.enabled", True)
+    async def _load_tab_page(self, tab: BrowserTab, url: str, shop_name: str, load_timeout_s: float = 30, body_timeout_s: float = 15,
+                             poll_interval_s: float = 0.25) -> str:
+        """
+        Multi-tab version of _load_dynamic_page: navigation doesn't block (page load strategy "none")
+        and readiness is polled with short commands, so other tabs of the same browser run in between
+        """
+        logger.info(f"Getting dynamic page for {shop_name} in tab {tab.handle}")
 
-            profile.set_preference("general.useragent.override", random.choice(self.user_agents))
-            
-            profile.set_preference("permissions.default.images", 2)
-            profile.set_preference("javascript.enabled", True)
-            profile.set_preference("media.autoplay.default", 5)
-            profile.set_preference("network.http.pipelining", True)
-            profile.set_preference("network.http.proxy.pipelining", True)
-            profile.set_preference("network.http.pipelining.maxrequests", 8)
+        async def execute(script: str) -> Any:
+            return await asyncio.to_thread(tab.run, lambda driver: driver.execute_script(script))
 
-            profile.set_preference("dom.push.enabled", False)
-            profile.set_preference("dom.webnotifications.enabled", False)
-            profile.set_preference("geo.enabled", False)
-            profile.set_preference("media.navigator.enabled", False)
+        start: float = time.perf_counter()
+        await asyncio.to_thread(tab.run, lambda driver: driver.get(url))
 
-            profile.set_preference("privacy.trackingprotection.enabled", False)
-            profile.set_preference("browser.safebrowsing.enabled", False)
-            profile.set_preference("browser.safebrowsing.malware.enabled", False)
+        # same limits as the blocking version: page load timeout, then waiting for page-body
+        while True:
+            state: Dict[str, Any] = await execute(
+                "return {ready: document.readyState, body: !!document.querySelector('.page-body')};"
+            )
+            elapsed: float = time.perf_counter() - start
+            if state["body"]:
+                break
+            if state["ready"] != "complete" and elapsed > load_timeout_s:
+                self.rate_limiter.record(url, elapsed, timeout=True)
+                raise ShopFetchError(TIMEOUT, f"Page load of {shop_name} timed out")
+            if elapsed > load_timeout_s + body_timeout_s:
+                raise ShopFetchError(NO_PAGE_BODY, f"No page-body in the page of {shop_name}")
+            await asyncio.sleep(poll_interval_s)
 
-            profile.set_preference("devtools.console.stdout.content", False)
+        self.rate_limiter.record(url, time.perf_counter() - start)
+        self.metrics.observe("page_load", time.perf_counter() - start, shop_name)
 
-            options.profile = profile
+        with self.metrics.timer("lazy_load", shop_name):
+            await self.lazy_load.poll(execute, shop_name, poll_interval_s)
 
-            driver = webdriver.Firefox(
-                service=Service(GeckoDriverManager().install()),
-                options=options
-            )
+        with self.metrics.timer("page_source", shop_name):
+            return await asyncio.to_thread(tab.run, lambda driver: driver.page_source)
 
-            driver.execute_script("""
-                Object.defineProperty(navigator, 'webdriver', {
-                    get: () => undefined,
-                });
-                                  
-                Object.defineProperty(navigator, 'plugins', {
-                    get: () => [1, 2, 3, 4, 5]
-                });
-                                  
-                Object.defineProperty(navigator, 'languages', {
-                    get: () => ['en-Us', 'en', 'de']
-                });
-            """)
-
-            await self.pool.put(driver)
-            logger.info(f"Firefox browser {i + 1}/{self.pool.maxsize} initialized")
-    
-    async def __cleanup(self):
-        while not self.pool.empty():
-            driver: webdriver.Firefox = await self.pool.get()
-            try:
-                driver.quit()
-            except:
-                pass
-        logger.info("All browsers are closed")
-
-    @asynccontextmanager
-    async def _get_browser(self):
-        driver: webdriver.Firefox = await self.pool.get()
+    def _get_dynamic_page(self, driver: webdriver.Firefox, url: str, shop_name: str) -> Optional[str]:
         try:
-            yield driver
-        finally:
-            await self.pool.put(driver)
+            return self._load_dynamic_page(driver, url, shop_name)
+        except Exception as e:
+            logger.error(f"Error with dynamic parsing of the {shop_name} page: {str(e)}")
+            return None
 
-    def _calculate_delay(self) -> float:
-        delay: float = self.base_delay
+    
+    def _get_static_page(self, url: str, shop_name: str) -> Optional[str]:
+        """Plain GET over the pooled session, no JS is executed"""
+        try:
+            logger.info(f"Getting static page for {shop_name}")
+            return self._conditional_get(url, headers={"User-Agent": random.choice(self.user_agents)})
+        except Exception as e:
+            logger.error(f"Error with static request of the {shop_name} page: {str(e)}")
+            return None
 
-        if self.error_count > 0:
-            delay *= (1.3 ** min(self.error_count, 4))
-        
-        if self.avg_response_time > 8:
-            delay *= 1.4
-        elif self.avg_response_time < 4:
-            delay *= 0.7
+    def _conditional_get(self, url: str, headers: Optional[Dict[str, str]] = None) -> Optional[str]:
+        """GET with If-None-Match/If-Modified-Since when the page is cached, 304 is served from the cache"""
+        headers = dict(headers or {})
+        if self.page_cache:
+            headers.update(self.page_cache.conditional_headers(url))
+
+        page = self._timed_get(url, headers)
+
+        if page.status_code == 304 and self.page_cache:
+            body: Optional[str] = self.page_cache.revalidated(url)
+            if body is not None:
+                return body
+            # object disappeared from the store, fetch it again without validators
+            self.metrics.inc("refetch_after_304")
+            self.rate_limiter.wait(url)
+            page = self._timed_get(url, {k: v for k, v in headers.items() if not k.startswith("If-")})
+
+        if page.status_code != 200:
+            logger.warning(f"Request to {url} returned {page.status_code}")
+            return None
 
-        return random.uniform(delay * 0.7, delay * 1.4)
+        if self.page_cache:
+            self.page_cache.store(url, page.text, "http", page.headers.get("ETag"), page.headers.get("Last-Modified"))
+        return page.text
 
-    def _get_dynamic_page(self, driver: webdriver.Firefox, url: str, shop_name: str) -> Optional[str]:
+    def _timed_get(self, url: str, headers: Dict[str, str]) -> requests.Response:
+        """session.get that reports latency/status (or timeout) to the rate limiter"""
+        start: float = time.perf_counter()
+        try:
+            page = self.session.get(url, headers=headers, timeout=15)
+        except requests.Timeout:
+            self.rate_limiter.record(url, time.perf_counter() - start, timeout=True)
+            raise
+        self.rate_limiter.record(url, time.perf_counter() - start, page.status_code)
+        return page
+
+    async def fetch_shop_page(self, shop_name: str, url: str, start_tier: str = "cache") -> Tuple[str, str]:
+        """
+        Fetch half of a shop request: returns (html, tier) from the first usable tier starting at start_tier
+        (cache -> http -> browser) without parsing it. Raises ShopFetchError when nothing could be fetched
+        """
+        tiers: Tuple[str, ...] = FETCH_TIERS[FETCH_TIERS.index(start_tier):]
+
+        if "cache" in tiers and self.page_cache:
+            # fresh browser page from the cache needs neither a rate limiter token nor a slot
+            html: Optional[str] = self.page_cache.get_fresh(url)
+            if html:
+                return html, "cache"
+
+        self.total_requests += 1
+
+        if "http" in tiers and self.use_http_tier:
+            # pacing happens before the slot is taken, so waiting requests don't hold concurrency
+            await self.rate_limiter.acquire(url)
+            async with self.semaphore:
+                with self.metrics.timer("static_fetch", shop_name):
+                    html = await asyncio.to_thread(self._get_static_page, url, shop_name)
+            if html:
+                return html, "http"
+            self.metrics.inc("http_tier_failed")
+
+        if not self.use_browser:
+            raise ShopFetchError(HTTP_ERROR, f"Static html of {shop_name} is not usable and browser is disabled")
+
+        # the browser load is a request of its own, an escalated shop takes a second token
+        await self.rate_limiter.acquire(url)
+        async with self.semaphore:
+            checkout_start: float = time.perf_counter()
+            async with self._get_browser() as tab:
+                self.metrics.observe("pool_wait", time.perf_counter() - checkout_start, shop_name)
+                start: float = time.perf_counter()
+                try:
+                    if self.pool.multi_tab:
+                        html = await self._load_tab_page(tab, url, shop_name)
+                    else:
+                        html = await asyncio.to_thread(self._load_dynamic_page, tab.driver, url, shop_name)
+                finally:
+                    self.browser_time_s += time.perf_counter() - start
+            return html, "browser"
+
+    async def parse_shop_page(self, shop_name: str, url: str, html: str, tier: str, parse_shop_page_func: Callable) -> Optional[List[Dict[str, Any]]]:
+        """
+        Parse half of a shop request: returns brochures of a page from fetch_shop_page, or None when
+        a cache/http page is not complete and the next tier has to be fetched
+        """
         try:
-            logger.info(f"Getting dynamic page for {shop_name}")
+            # static / cached html must not have lazy loaded parts of the grid left, those cards are only in the browser
+            parsed_info: List[Dict[str, Any]] = await parse_shop_page_func(html, shop_name, require_complete=tier != "browser")
+        except IncompleteGridError as e:
+            logger.info(f"{str(e)} in {tier} html, falling back to {next_tier(tier)}")
+            self.metrics.inc(f"{tier}_tier_incomplete")
+            return None
+        except NoGridError:
+            if tier == "browser":
+                raise
+            # no page-body / letaky-grid in the cached or static page
+            logger.info(f"{tier.capitalize()} html of {shop_name} has no brochure grid, falling back to {next_tier(tier)}")
+            self.metrics.inc(f"{tier}_tier_no_grid")
+            return None
 
-            driver.set_page_load_timeout(30)
-            driver.implicitly_wait(10)
+        if tier == "browser":
+            if not parsed_info:
+                raise ShopFetchError(EMPTY_GRID, f"Brochure grid of {shop_name} is empty")
+            # only complete pages are cached, a retry must not get the empty one back
+            if self.page_cache:
+                self.page_cache.store(url, html, "browser")
+
+        # cards without title are most likely not rendered yet
+        elif any(info["title"] == "Not found" for info in parsed_info):
+            logger.info(f"{tier.capitalize()} html of {shop_name} has incomplete brochure grid, falling back to {next_tier(tier)}")
+            self.metrics.inc(f"{tier}_tier_incomplete")
+            return None
 
-            driver.get(url)
+        # complete but empty static grid: the browser has the last word when there is one,
+        # without it the shop really has no brochures at the moment (not an error to retry)
+        elif not parsed_info and self.use_browser:
+            logger.info(f"{tier.capitalize()} html of {shop_name} has empty brochure grid, checking it with {next_tier(tier)}")
+            self.metrics.inc(f"{tier}_tier_empty")
+            return None
 
-            WebDriverWait(driver, 15).until(
-                EC.presence_of_element_located((By.CLASS_NAME, "page-body"))
-            )
+        self.successful_requests += 1
+        self.tier_counts[tier] += 1
+        self.metrics.inc(f"tier_{tier}")
 
-            driver.execute_script("window.scrollTo({top: document.body.scrollHeight/4, behavior: 'smooth'})")
-            time.sleep(0.8)
-            driver.execute_script("window.scrollTo({top: document.body.scrollHeight/2, behavior: 'smooth'})")
-            time.sleep(0.8)
-            driver.execute_script("window.scrollTo({top: document.body.scrollHeight*3/4, behavior: 'smooth'})")
-            time.sleep(0.8)
-            driver.execute_script("window.scrollTo({top: document.body.scrollHeight, behavior: 'smooth'})")
+        logger.info(f"Shop {shop_name} was parsed successfuly ({tier} tier)! Brochures: {len(parsed_info)}")
+        return parsed_info
 
-            try:
-                WebDriverWait(driver, 8).until(
-                    EC.presence_of_element_located((By.CLASS_NAME, "brochure-thumb"))
-                )
-            except:
-                logger.warning(f"No brochure-thumb elements were found for {shop_name}")
+    def record_failure(self, shop_name: str, error: Exception) -> ShopFetchError:
+        """Counts a failed shop attempt and returns it as ShopFetchError with its error class"""
+        self.failed_requests += 1
+        error_class: str = classify_error(error)
+        self.metrics.inc(f"error_{error_class}")
+        logger.error(f"Error with {shop_name} ({error_class}): {str(error)}")
 
-            time.sleep(1.5)
+        if isinstance(error, ShopFetchError):
+            return error
+        wrapped: ShopFetchError = ShopFetchError(error_class, str(error))
+        wrapped.__cause__ = error
+        return wrapped
 
-            return driver.page_source
-        
-        except Exception as e:
-            logger.error(f"Error with dynamic parsing of the {shop_name} page: {str(e)}")
-            return None
+    def tier_summary(self) -> str:
+        total: int = sum(self.tier_counts.values())
+        summary: str = ", ".join(f"{tier}: {count}/{total}" for tier, count in self.tier_counts.items())
+
+        # estimate the saved time from the average browser page of this run
+        if self.tier_counts["browser"]:
+            avg_browser_time: float = self.browser_time_s / self.tier_counts["browser"]
+            summary += f", ~{avg_browser_time * self.tier_counts['http']:.1f}s of browser time saved"
+        return summary
 
-    
     def send_request(self, url: str) -> Optional[str]:
         try:
             logger.info(f"Sending reqular request to {url}")
-            page = requests.get(url)
-            return page.text
+            return self._conditional_get(url)
         except Exception as e:
             logger.error(f"Error occurred while trying to get page by {url=}: {str(e)}")
             return None
 
-    async def send_shop_request(self, shop_name: str, url: str, parse_shop_page_func: Callable) -> Tuple[List[Dict], str]:
-        async with self.semaphore:
-            try:
-                delay: float = self._calculate_delay()
-                await asyncio.sleep(delay)
-
-                self.total_requests += 1
-
-                async with self._get_browser() as driver:
-                    html: Optional[str] = await asyncio.to_thread(
-                        self._get_dynamic_page, driver, url, shop_name
-                    )
-
-                    if html:
-                        parsed_info: List[Dict[str, Any]] = await parse_shop_page_func(html, shop_name)
-                        self.successful_requests += 1
-
-                        logger.info(f"Shop {shop_name} was parsed successfuly! Brochures: {len(parsed_info)}")
-                        return parsed_info, shop_name
-                    else:
-                        logger.warning(f"Empty html received for {shop_name}")
-            except Exception as e:
-                self.failed_requests += 1
-                logger.error(f"Error with {shop_name}: {str(e)}")
-                return [], shop_name
-
-
-    
\ No newline at end of file
+    async def send_shop_request(self, shop_name: str, url: str, parse_shop_page_func: Callable, raise_errors: bool = False) -> Tuple[List[Dict], str]:
+        """
+        Fetches and parses one shop, falling back tier by tier. Returns (brochures, shop_name),
+        a failed attempt returns ([], shop_name), with raise_errors it raises ShopFetchError instead so the caller can schedule a retry
+        """
+        tier: str = FETCH_TIERS[0]
+        try:
+            while True:
+                html, tier = await self.fetch_shop_page(shop_name, url, tier)
+                parsed_info: Optional[List[Dict[str, Any]]] = await self.parse_shop_page(shop_name, url, html, tier, parse_shop_page_func)
+                if parsed_info is not None:
+                    return parsed_info, shop_name
+                tier = next_tier(tier)
+        except Exception as e:
+            error: ShopFetchError = self.record_failure(shop_name, e)
+            if raise_errors:
+                raise error
+            return [], shop_name
@@ -0,0 +1,94 @@
+import logging
+
+import os
+import json
+import textwrap
+
+from typing import List, Dict, Any, Iterator
+
+
+logger = logging.getLogger(__name__)
+
+
+class NDJSONSink:
+    """
+    Appends every finished shop as one json line ({"shop_name": ..., "brochures": [...]}),
+    so a crash keeps everything parsed so far. fsync is done every fsync_every lines.
+    fresh=False keeps lines of a previous (interrupted) run and appends after them
+    """
+    def __init__(self, path: str = "./result.ndjson", fsync_every: int = 10, fresh: bool = True) -> None:
+        self.path: str = path
+        self.fsync_every: int = fsync_every
+        self.lines_written: int = 0
+        self.__file = open(path, "w" if fresh else "a", encoding="utf-8")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def append(self, shop_name: str, brochures: List[Dict[str, Any]]) -> None:
+        self.__file.write(json.dumps({"shop_name": shop_name, "brochures": brochures}, ensure_ascii=False) + "\n")
+        self.__file.flush()
+        self.lines_written += 1
+
+        if self.lines_written % self.fsync_every == 0:
+            os.fsync(self.__file.fileno())
+
+    def close(self) -> None:
+        if self.__file.closed:
+            return
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+        self.__file.close()
+
+    def finalize(self, output_json: str, remove: bool = True, ensure_ascii: bool = True) -> int:
+        """Closes the sink and compacts its lines into the result.json shape"""
+        self.close()
+        return compact_ndjson([self.path], output_json, remove, ensure_ascii)
+
+
+def read_ndjson(path: str) -> Iterator[Dict[str, Any]]:
+    """Yields records of NDJSON file, the last line can be cut in half by a crash, so broken lines are skipped"""
+    with open(path, "r", encoding="utf-8") as file:
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping broken line {number} of {path}")
+
+
+def compact_ndjson(paths: List[str], output_json: str, remove: bool = True, ensure_ascii: bool = True) -> int:
+    """
+    Streams shop lines of all paths into one list of lists (same output as json.dump(..., indent=4)),
+    without loading the whole catalog into memory. Shops without brochures are left out like before.
+    Returns amount of written shops
+    """
+    written: int = 0
+    tmp_output: str = f"{output_json}.tmp"
+
+    with open(tmp_output, "w", encoding="utf-8") as output:
+        output.write("[")
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            for record in read_ndjson(path):
+                if not record.get("brochures"):
+                    continue
+                output.write(",\n" if written else "\n")
+                output.write(textwrap.indent(json.dumps(record["brochures"], indent=4, ensure_ascii=ensure_ascii), "    "))
+                written += 1
+        output.write("\n]" if written else "]")
+
+    os.replace(tmp_output, output_json)
+
+    if remove:
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    logger.info(f"Compacted {written} shops into {output_json}")
+    return written
@@ -0,0 +1,137 @@
+import logging
+
+import os
+import json
+import time
+import random
+import asyncio
+from datetime import datetime
+
+from typing import List, Dict, Any, Optional
+
+from BrochureParsing import NoGridError
+
+
+logger = logging.getLogger(__name__)
+
+
+# why a shop attempt failed, every class has its own retry budget
+TIMEOUT = "timeout"
+DRIVER_CRASH = "driver_crash"
+NO_PAGE_BODY = "no_page_body"
+EMPTY_GRID = "empty_grid"
+HTTP_ERROR = "http_error"
+OTHER = "other"
+
+DEFAULT_BUDGETS: Dict[str, int] = {
+    TIMEOUT: 3,
+    DRIVER_CRASH: 2,
+    NO_PAGE_BODY: 2,
+    HTTP_ERROR: 2,
+    # a shop can really have no brochures at the moment, one more look is enough
+    EMPTY_GRID: 1,
+    OTHER: 1
+}
+
+
+class ShopFetchError(Exception):
+    """Failed shop attempt together with its error class"""
+    def __init__(self, error_class: str, message: str) -> None:
+        super().__init__(message)
+        self.error_class: str = error_class
+
+
+def classify_error(error: BaseException) -> str:
+    if isinstance(error, ShopFetchError):
+        return error.error_class
+    if isinstance(error, NoGridError):
+        return EMPTY_GRID
+    # selenium/requests timeouts are matched by name, so selenium doesn't have to be imported here
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)) or "Timeout" in type(error).__name__:
+        return TIMEOUT
+    # dead geckodriver/Firefox shows up as WebDriverException or as refused connection to the driver
+    if type(error).__module__.startswith(("selenium", "urllib3")) or isinstance(error, ConnectionError):
+        return DRIVER_CRASH
+    return OTHER
+
+
+class DeadLetterQueue:
+    """Shops that failed even after all retries, saved so a follow-up run can replay only them"""
+    def __init__(self, path: str = "./dead_letter.json") -> None:
+        self.path: str = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, shop: Dict[str, str], error_class: str, attempts: int, error: str) -> None:
+        self.entries[shop["link"]] = {
+            "shop_name": shop["shop_name"],
+            "link": shop["link"],
+            "error_class": error_class,
+            "attempts": attempts,
+            "error": error,
+            "failed_at": datetime.now().isoformat(timespec="seconds")
+        }
+
+    def save(self) -> None:
+        """Overwrites the file, so shops that succeeded on replay disappear from it"""
+        tmp_file: str = f"{self.path}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as file:
+            json.dump(list(self.entries.values()), file, indent=4, ensure_ascii=False)
+        os.replace(tmp_file, self.path)
+        logger.info(f"{len(self.entries)} shops saved to dead letter file {self.path}")
+
+    @staticmethod
+    def load_shops(path: str) -> List[Dict[str, str]]:
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                return [{"shop_name": entry["shop_name"], "link": entry["link"]} for entry in json.load(file)]
+        except FileNotFoundError:
+            logger.warning(f"No dead letter file at {path}, nothing to replay")
+            return []
+
+
+class RetryScheduler:
+    """
+    Decides if a failed shop is tried again and when: exponential backoff with full jitter,
+    limited by the budget of the error class. Shops out of budget go to the dead letter queue
+    """
+    def __init__(self, budgets: Optional[Dict[str, int]] = None, base_delay_s: float = 2.0, max_delay_s: float = 60.0,
+                 dead_letter: Optional[DeadLetterQueue] = None, seed: Optional[int] = None) -> None:
+        self.budgets: Dict[str, int] = {**DEFAULT_BUDGETS, **(budgets or {})}
+        self.base_delay_s: float = base_delay_s
+        self.max_delay_s: float = max_delay_s
+        self.dead_letter: Optional[DeadLetterQueue] = dead_letter
+
+        # failed attempts of every shop url, split by error class
+        self.attempts: Dict[str, Dict[str, int]] = {}
+        self.retries: int = 0
+        self.given_up: int = 0
+        self.__random = random.Random(seed)
+
+    def backoff_s(self, attempt: int) -> float:
+        return self.__random.uniform(0, min(self.max_delay_s, self.base_delay_s * 2 ** attempt))
+
+    def schedule(self, shop: Dict[str, str], error: ShopFetchError) -> Optional[float]:
+        """Returns time.monotonic() time of the next attempt, or None when the shop is given up"""
+        shop_attempts: Dict[str, int] = self.attempts.setdefault(shop["link"], {})
+        used: int = shop_attempts.get(error.error_class, 0)
+
+        if used >= self.budgets.get(error.error_class, 0):
+            self.given_up += 1
+            total: int = sum(shop_attempts.values()) + 1
+            logger.warning(f"Giving up {shop['shop_name']} after {total} attempts ({error.error_class}: {str(error)})")
+            if self.dead_letter is not None:
+                self.dead_letter.add(shop, error.error_class, total, str(error))
+            return None
+
+        shop_attempts[error.error_class] = used + 1
+        self.retries += 1
+        delay: float = self.backoff_s(sum(shop_attempts.values()))
+        logger.info(f"Retrying {shop['shop_name']} ({error.error_class}) in {delay:.1f}s")
+        return time.monotonic() + delay
+
+    def summary(self) -> str:
+        by_class: Dict[str, int] = {}
+        for shop_attempts in self.attempts.values():
+            for error_class, count in shop_attempts.items():
+                by_class[error_class] = by_class.get(error_class, 0) + count
+        return f"{self.retries} retries {by_class}, {self.given_up} shops given up"
@@ -0,0 +1,131 @@
+import logging
+
+import os
+import time
+import zlib
+import json
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from typing import List, Dict, Any, Optional, Tuple
+
+from ParserV2 import Parser
+from PageCache import PageCache
+from ResultSink import NDJSONSink, compact_ndjson
+from CrawlJournal import CrawlJournal
+from RetryScheduler import RetryScheduler, DeadLetterQueue
+from LogConfig import configure_logging
+
+
+logger = logging.getLogger(__name__)
+
+
+def partition_shops(shop_data: List[Dict[str, str]], workers: int) -> List[List[Dict[str, str]]]:
+    """
+    Splits shops between workers by hash of the url, so the same shop always lands
+    in the same worker (and in the same per worker page cache) between runs
+    """
+    shards: List[List[Dict[str, str]]] = [[] for _ in range(workers)]
+    for shop in shop_data:
+        shards[zlib.crc32(shop["link"].encode("utf-8")) % workers].append(shop)
+    return shards
+
+
+def _worker_sink_path(worker_id: int) -> str:
+    return f"./result.worker-{worker_id}.ndjson"
+
+
+def _worker_dead_letter_path(worker_id: int) -> str:
+    return f"./dead_letter.worker-{worker_id}.json"
+
+
+async def _crawl_shard(worker_id: int, shops: List[Dict[str, str]], parser_options: Dict[str, Any], cache_dir: Optional[str], resume: bool) -> Dict[str, Any]:
+    page_cache: Optional[PageCache] = PageCache(os.path.join(cache_dir, f"worker-{worker_id}")) if cache_dir else None
+    # shops are partitioned by url hash, so the worker finds its own journal again on resume
+    journal: CrawlJournal = CrawlJournal(f"./crawl_journal.worker-{worker_id}.json", resume)
+
+    start: float = time.perf_counter()
+    async with Parser(page_cache=page_cache, **parser_options) as parser:
+        # every worker streams into its own part file, parent only compacts them
+        with NDJSONSink(_worker_sink_path(worker_id)) as sink:
+            retry: RetryScheduler = RetryScheduler(dead_letter=DeadLetterQueue(_worker_dead_letter_path(worker_id)))
+            await parser.get_all_shop_data(shops, sink, journal, retry)
+        requester = parser.requester
+        stats: Dict[str, Any] = {
+            "worker": worker_id,
+            "pid": os.getpid(),
+            "shops": len(shops),
+            "successful": requester.successful_requests,
+            "failed": requester.failed_requests,
+            "tiers": dict(requester.tier_counts),
+            "metrics": requester.metrics.snapshot(),
+            "dead_letter": retry.dead_letter.entries
+        }
+    elapsed: float = time.perf_counter() - start
+
+    stats["elapsed_s"] = round(elapsed, 1)
+    stats["shops_per_min"] = round(len(shops) / elapsed * 60, 1) if elapsed else 0.0
+    return stats
+
+
+def _run_worker(worker_id: int, shops: List[Dict[str, str]], parser_options: Dict[str, Any], cache_dir: Optional[str], resume: bool) -> Dict[str, Any]:
+    """Entry point of the worker process, every worker has its own loop, browser pool and rate limiting"""
+    # spawned process starts with unconfigured logging
+    configure_logging()
+    return asyncio.run(_crawl_shard(worker_id, shops, parser_options, cache_dir, resume))
+
+
+def run_sharded(workers: int, output_json: str, parser_options: Optional[Dict[str, Any]] = None, cache_dir: Optional[str] = "./.page_cache",
+                resume: bool = False, metrics_json: Optional[str] = None, dead_letter_json: Optional[str] = None,
+                shop_data: Optional[List[Dict[str, str]]] = None) -> int:
+    """
+    Fetches sidebar once (unless shop_data is given), crawls its shops in `workers` processes and merges their results into output_json.
+    With metrics_json the final metrics snapshot of every worker is saved there,
+    with dead_letter_json the given up shops of all workers are merged into one dead letter file
+    """
+    parser_options = parser_options or {}
+
+    # only plain request is needed for the sidebar, browsers are started inside workers
+    if shop_data is None:
+        parser: Parser = Parser(**parser_options)
+        try:
+            shop_data = parser.get_leftside_shop_list()
+        finally:
+            parser.close()
+    # worker id is the partition index even when some partitions are empty,
+    # per worker journal and page cache have to match the crc32 partition on resume
+    shards: List[Tuple[int, List[Dict[str, str]]]] = [
+        (worker_id, shard) for worker_id, shard in enumerate(partition_shops(shop_data, workers)) if shard
+    ]
+
+    logger.info(f"Found {len(shop_data)} shops, splitting them between {len(shards)} workers")
+
+    # spawn instead of fork: selenium/asyncio state of the parent should not leak into workers
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=len(shards), mp_context=context) as executor:
+        futures = [executor.submit(_run_worker, worker_id, shard, parser_options, cache_dir, resume) for worker_id, shard in shards]
+        outputs: List[Dict[str, Any]] = [future.result() for future in futures]
+
+    merged: int = compact_ndjson([_worker_sink_path(worker_id) for worker_id, _ in shards], output_json)
+
+    logger.info("--SHARDED CRAWL SUMMARY--")
+    for stats in outputs:
+        logger.info(
+            f"Worker {stats['worker']} (pid {stats['pid']}): {stats['successful']}/{stats['shops']} shops, "
+            f"{stats['failed']} failed, {stats['elapsed_s']}s, {stats['shops_per_min']} shops/min, tiers: {stats['tiers']}"
+        )
+    logger.info(f"Merged {merged} shops from {len(outputs)} workers")
+
+    if metrics_json:
+        with open(metrics_json, "w", encoding="utf-8") as file:
+            json.dump({f"worker-{stats['worker']}": stats["metrics"] for stats in outputs}, file, indent=4, ensure_ascii=False)
+
+    if dead_letter_json:
+        dead_letter: DeadLetterQueue = DeadLetterQueue(dead_letter_json)
+        for stats in outputs:
+            dead_letter.entries.update(stats["dead_letter"])
+            os.remove(_worker_dead_letter_path(stats["worker"]))
+        dead_letter.save()
+
+    return merged
@@ -0,0 +1,215 @@
+import logging
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import mimetypes
+import threading
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from typing import List, Dict, Tuple, Any, Optional
+
+from Metrics import Metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class ThumbnailStore:
+    """
+    Content addressed image store: every image is saved once under its sha256 hash
+    (objects/ab/ab12...jpg), no matter how many urls / shops point at it.
+    Index keeps per url hash, path and etag/last-modified for conditional refresh
+    """
+    def __init__(self, store_dir: str = "./thumbnails") -> None:
+        self.store_dir: str = store_dir
+        self.objects_dir: str = os.path.join(store_dir, "objects")
+        self.index_file: str = os.path.join(store_dir, "index.json")
+
+        self.__lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.__index: Dict[str, Dict[str, Any]] = self.__load_index()
+
+    def __load_index(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError:
+            logger.warning(f"Thumbnail index {self.index_file} is corrupted, starting with empty index")
+            return {}
+
+    def save(self) -> None:
+        """
+        Merges the index into the one on disk and writes it atomically, so workers of a sharded
+        crawl sharing one store don't drop each other's urls (a lost entry only costs a download)
+        """
+        with self.__lock:
+            merged: Dict[str, Dict[str, Any]] = {**self.__load_index(), **self.__index}
+            tmp_file: str = f"{self.index_file}.tmp.{os.getpid()}"
+            with open(tmp_file, "w", encoding="utf-8") as file:
+                json.dump(merged, file)
+            os.replace(tmp_file, self.index_file)
+
+    def entry(self, url: str) -> Optional[Dict[str, Any]]:
+        """Index entry of the url, None when it's unknown or its object is gone"""
+        with self.__lock:
+            entry: Optional[Dict[str, Any]] = self.__index.get(url)
+        if entry and os.path.exists(entry["path"]):
+            return entry
+        return None
+
+    def touch(self, url: str) -> Dict[str, Any]:
+        """Called on 304, the stored image is still current"""
+        with self.__lock:
+            entry: Dict[str, Any] = self.__index[url]
+            entry["fetched_at"] = time.time()
+            return entry
+
+    def put(self, url: str, data: bytes, content_type: Optional[str], etag: Optional[str] = None,
+            last_modified: Optional[str] = None) -> Dict[str, Any]:
+        """Stores the image (if its content isn't stored yet) and points the url at it, entry["new"] tells which one it was"""
+        content_hash: str = hashlib.sha256(data).hexdigest()
+        extension: str = ThumbnailStore.__extension(url, content_type)
+        path: str = os.path.join(self.objects_dir, content_hash[:2], f"{content_hash}{extension}")
+
+        with self.__lock:
+            new: bool = not os.path.exists(path)
+            if new:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path: str = f"{path}.tmp"
+                with open(tmp_path, "wb") as file:
+                    file.write(data)
+                os.replace(tmp_path, path)
+
+            entry: Dict[str, Any] = {
+                "hash": content_hash,
+                "path": path,
+                "size": len(data),
+                "etag": etag,
+                "last_modified": last_modified,
+                "fetched_at": time.time()
+            }
+            self.__index[url] = entry
+            return {**entry, "new": new}
+
+    @staticmethod
+    def __extension(url: str, content_type: Optional[str]) -> str:
+        if content_type:
+            extension: Optional[str] = mimetypes.guess_extension(content_type.split(";")[0].strip())
+            if extension:
+                return extension
+        return os.path.splitext(urlsplit(url).path)[1].lower() or ".img"
+
+
+class ThumbnailDownloader:
+    """
+    Thumbnail stage: downloads images of parsed brochures into ThumbnailStore and adds
+    thumbnail_path / thumbnail_hash to every brochure. Every url is requested at most once per run
+    (shops sharing an image wait for the same download), known urls are revalidated with
+    If-None-Match / If-Modified-Since once they are older than revalidate_after_s
+    """
+    def __init__(self, store: ThumbnailStore, base_url: str = "", max_concurrent: int = 16, per_host: int = 4,
+                 revalidate_after_s: float = 6 * 3600, timeout_s: float = 15, metrics: Optional[Metrics] = None) -> None:
+        self.store: ThumbnailStore = store
+        # thumbnails can be relative to the site
+        self.base_url: str = base_url
+        self.per_host: int = per_host
+        self.revalidate_after_s: float = revalidate_after_s
+        self.timeout_s: float = timeout_s
+        self.metrics: Metrics = metrics or Metrics()
+
+        # keep-alive connections, per_host of them for every host
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=per_host)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.__semaphore: asyncio.Semaphore = asyncio.Semaphore(max_concurrent)
+        self.__host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        # url -> download of this run, shared by all brochures with that url
+        self.__downloads: Dict[str, asyncio.Task] = {}
+
+        self.stats: Dict[str, int] = {"downloaded": 0, "deduplicated": 0, "revalidated": 0, "reused": 0, "failed": 0, "bytes": 0}
+
+    def start_run(self) -> None:
+        """Forgets downloads of the previous crawl (same process, e.g. CrawlDaemon), so their urls are checked again"""
+        self.__downloads.clear()
+
+    def close(self) -> None:
+        self.session.close()
+        self.store.save()
+
+    async def annotate(self, brochures: List[Dict[str, Any]], shop_name: str = "") -> List[Dict[str, Any]]:
+        """Adds thumbnail_path / thumbnail_hash (None when the image couldn't be fetched) to the brochures"""
+        urls: Dict[int, str] = {
+            i: urljoin(self.base_url, brochure["thumbnail"])
+            for i, brochure in enumerate(brochures)
+            if brochure.get("thumbnail") and brochure["thumbnail"] != "Not found"
+        }
+
+        with self.metrics.timer("thumbnails", shop_name or None):
+            for url in set(urls.values()):
+                if url not in self.__downloads:
+                    self.__downloads[url] = asyncio.create_task(self.__fetch(url))
+            entries: Dict[str, Optional[Dict[str, Any]]] = {
+                url: await self.__downloads[url] for url in set(urls.values())
+            }
+
+        for i, brochure in enumerate(brochures):
+            entry: Optional[Dict[str, Any]] = entries.get(urls[i]) if i in urls else None
+            brochure["thumbnail_path"] = entry["path"] if entry else None
+            brochure["thumbnail_hash"] = entry["hash"] if entry else None
+        return brochures
+
+    def __count(self, event: str, amount: int = 1) -> None:
+        self.stats[event] += amount
+        self.metrics.inc(f"thumbnails_{event}", amount)
+
+    async def __fetch(self, url: str) -> Optional[Dict[str, Any]]:
+        entry: Optional[Dict[str, Any]] = self.store.entry(url)
+        if entry and time.time() - entry["fetched_at"] < self.revalidate_after_s:
+            self.__count("reused")
+            return entry
+
+        host: str = urlsplit(url).netloc
+        host_semaphore: asyncio.Semaphore = self.__host_semaphores.setdefault(host, asyncio.Semaphore(self.per_host))
+        async with self.__semaphore, host_semaphore:
+            try:
+                entry, event, size = await asyncio.to_thread(self.__download, url, entry)
+            except Exception as e:
+                logger.warning(f"Thumbnail {url} couldn't be downloaded: {str(e)}")
+                self.__count("failed")
+                return None
+
+        self.__count(event)
+        self.__count("bytes", size)
+        return entry
+
+    def __download(self, url: str, entry: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], str, int]:
+        """Runs in a thread, returns (entry, counted event, downloaded bytes)"""
+        headers: Dict[str, str] = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = self.session.get(url, headers=headers, timeout=self.timeout_s)
+        if response.status_code == 304 and entry:
+            return self.store.touch(url), "revalidated", 0
+
+        response.raise_for_status()
+        stored: Dict[str, Any] = self.store.put(
+            url, response.content, response.headers.get("Content-Type"), response.headers.get("ETag"), response.headers.get("Last-Modified")
+        )
+        # same image under another url (or unchanged after a refetch) is not written again
+        return stored, "downloaded" if stored["new"] else "deduplicated", len(response.content)
+
+    def summary(self) -> str:
+        return ", ".join(f"{event}: {amount}" for event, amount in self.stats.items())
@@ -1,15 +1,365 @@
-from ParserV2 import Parser
-import asyncio
+"""
+Entry point, every subcommand imports only what it needs (selenium only comes in with crawl, asyncio not with export / stats):
 
+    python main.py crawl [--workers 4] [--incremental] ...    fetch all shops into result.json (also the default without subcommand)
+    python main.py parse-from-disk PAGES_DIR [--output FILE]  parse saved shop pages, no browser and no network
+    python main.py export [--input FILE] [--columnar FILE] [--sqlite DB]
+    python main.py stats [--input FILE]                       shops / brochures / validity of result.json or a columnar file
+"""
+import argparse
+import logging
+import os
+import sys
+import gzip
+import json
+import time
+from contextlib import nullcontext
+from typing import List, Dict, Any, Optional, Tuple, Callable, TYPE_CHECKING
 
-async def main():
-    async with Parser() as parser:
-        exists: bool = parser.check_output_file_exists()
-        if not exists:
+from LogConfig import configure_logging
+
+if TYPE_CHECKING:
+    from ParserV2 import Parser
+
+
+logger = logging.getLogger(__name__)
+
+DEAD_LETTER: str = "./dead_letter.json"
+FRONTIER_STATE: str = "./frontier.json"
+
+
+def browser_options(browsers: int, tabs: int) -> Dict[str, Any]:
+    """Pages in flight = browsers * tabs, concurrency limit has to let all of them run"""
+    return {"max_browsers": browsers, "tabs_per_browser": tabs, "max_concurrent": max(8, browsers * tabs)}
+
+
+def filter_proxy(enabled: bool, rules_file: Optional[str]):
+    """FilterProxy shared by all browsers (of all workers), nullcontext when it's disabled"""
+    if not enabled:
+        return nullcontext()
+    from FilterProxy import FilterProxy, FilterRules
+    return FilterProxy(FilterRules.load(rules_file) if rules_file else FilterRules())
+
+
+async def main(resume: bool, incremental: bool = False, force: bool = False, metrics_port: Optional[int] = None, metrics_json: Optional[str] = None,
+               replay: bool = False, parser_options: Optional[Dict[str, Any]] = None, columnar: Optional[str] = None,
+               sqlite: Optional[str] = None, all_categories: bool = False):
+    from ParserV2 import Parser
+    from PageCache import PageCache
+    from Metrics import MetricsServer, SnapshotWriter
+
+    async with Parser(page_cache=PageCache(), **(parser_options or {})) as parser:
+        metrics = parser.requester.metrics
+        with MetricsServer(metrics, metrics_port) if metrics_port else nullcontext():
+            async with SnapshotWriter(metrics, metrics_json) if metrics_json else nullcontext():
+                await crawl(parser, resume, incremental, force, replay, columnar, sqlite, all_categories)
+
+
+async def crawl(parser: "Parser", resume: bool, incremental: bool, force: bool, replay: bool, columnar: Optional[str] = None,
+                sqlite: Optional[str] = None, all_categories: bool = False):
+    from ResultSink import NDJSONSink
+    from CrawlJournal import CrawlJournal
+    from DeltaCrawl import BrochureIndex, diff_snapshots, write_delta
+    from RetryScheduler import RetryScheduler, DeadLetterQueue
+    from CrawlFrontier import CrawlFrontier
+
+    # previous snapshot has to be loaded before result.json gets truncated
+    previous: Optional[BrochureIndex] = BrochureIndex.load(parser.json_output) if incremental or replay or all_categories else None
+
+    # with all_categories shops of every category sidebar are crawled once, in freshness order
+    frontier: Optional[CrawlFrontier] = None
+    if all_categories:
+        frontier = parser.get_all_categories_shop_list(CrawlFrontier(FRONTIER_STATE))
+
+    exists: bool = parser.check_output_file_exists()
+    if not exists:
+        return
+    # shops are streamed to ndjson while crawling and compacted into result.json at the end,
+    # journal remembers finished shops so --resume fetches only the rest
+    journal: CrawlJournal = CrawlJournal("./crawl_journal.json", resume)
+    sink: NDJSONSink = NDJSONSink("./result.ndjson")
+
+    shop_data = None
+    if replay:
+        # only dead lettered shops are fetched, the rest of result.json is kept as it was
+        shop_data = DeadLetterQueue.load_shops(DEAD_LETTER)
+        replayed = {shop["shop_name"] for shop in shop_data}
+        for shop_name, brochures in previous.by_shop.items():
+            if shop_name not in replayed:
+                sink.append(shop_name, brochures)
+        logger.info(f"Replaying {len(shop_data)} dead lettered shops, {len(previous.by_shop) - len(replayed & previous.by_shop.keys())} shops kept")
+    elif incremental:
+        # shops with all brochures still valid are taken from the previous snapshot
+        shop_data, reused = previous.split_shops(frontier.ordered(previous) if frontier else parser.get_leftside_shop_list(), force)
+        for shop in reused:
+            sink.append(shop["shop_name"], previous.by_shop[shop["shop_name"]])
+        logger.info(f"Incremental crawl: {len(reused)} shops reused, {len(shop_data)} to fetch")
+    elif frontier:
+        shop_data = frontier.ordered(previous)
+
+    # shops failing after all retries are written to the dead letter file for --replay-dead-letter
+    retry: RetryScheduler = RetryScheduler(dead_letter=DeadLetterQueue(DEAD_LETTER))
+    await parser.get_all_shop_data(shop_data, sink, journal, retry)
+    sink.finalize(parser.json_output)
+    parser.requester.lazy_load.dump("./ready_times.json")
+
+    if incremental:
+        write_delta(diff_snapshots(previous, BrochureIndex.load(parser.json_output)), "./delta.json")
+    if frontier:
+        frontier.record_snapshot(BrochureIndex.load(parser.json_output))
+        frontier.save()
+    export(parser.json_output, columnar, sqlite)
+
+
+def export(json_output: str, columnar: Optional[str], sqlite: Optional[str]) -> None:
+    """Optional outputs next to result.json"""
+    if columnar:
+        from BrochureRecords import export_columnar
+        export_columnar(json_output, columnar)
+    if sqlite:
+        from BrochureStore import BrochureStore
+        with BrochureStore(sqlite) as store:
+            store.import_json(json_output)
+
+
+def main_sharded(workers: int, resume: bool, metrics_json: Optional[str] = None, parser_options: Optional[Dict[str, Any]] = None,
+                 columnar: Optional[str] = None, sqlite: Optional[str] = None, all_categories: bool = False):
+    from ParserV2 import Parser
+    from ShardedCrawl import run_sharded
+    from DeltaCrawl import BrochureIndex
+    from CrawlFrontier import CrawlFrontier
+
+    # workers have their own parsers, this one only checks the output and reads the category sidebars
+    parser: Parser = Parser(**(parser_options or {}))
+    try:
+        previous: Optional[BrochureIndex] = BrochureIndex.load(parser.json_output) if all_categories else None
+        if not parser.check_output_file_exists():
             return
-        result = await parser.get_all_shop_data()
-        parser.write_to_json(result)
+        frontier: Optional[CrawlFrontier] = parser.get_all_categories_shop_list(CrawlFrontier(FRONTIER_STATE)) if all_categories else None
+    finally:
+        parser.close()
+
+    run_sharded(workers, parser.json_output, parser_options, resume=resume, metrics_json=metrics_json, dead_letter_json=DEAD_LETTER,
+                shop_data=frontier.ordered(previous) if frontier else None)
+    if frontier:
+        frontier.record_snapshot(BrochureIndex.load(parser.json_output))
+        frontier.save()
+    export(parser.json_output, columnar, sqlite)
+
+
+def saved_pages(pages_dir: str) -> List[Tuple[str, str]]:
+    """
+    (shop name, file) of saved shop pages: a fixture corpus (manifest.json + pages/, see FixtureServer.py)
+    or a plain directory of <shop name>.html / <shop name>.html.gz files
+    """
+    from FixtureServer import FixtureCorpus
+
+    corpus: FixtureCorpus = FixtureCorpus(pages_dir)
+    if corpus.manifest:
+        return [
+            (entry["shop_name"], os.path.join(corpus.pages_dir, entry["file"]))
+            for entry in corpus.manifest.values() if entry.get("shop_name")
+        ]
+
+    pages: List[Tuple[str, str]] = []
+    for filename in sorted(os.listdir(pages_dir)):
+        for extension in (".html", ".html.gz"):
+            if filename.endswith(extension):
+                pages.append((filename[:-len(extension)], os.path.join(pages_dir, filename)))
+    return pages
+
+
+def read_page(path: str) -> str:
+    if path.endswith(".gz"):
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            return file.read()
+    with open(path, "r", encoding="utf-8") as file:
+        return file.read()
+
+
+async def parse_from_disk(pages_dir: str, output: str = "./result.json", parse_mode: str = "thread", parse_workers: int = 2,
+                          parser_backend: str = "html.parser", grid_only: bool = False) -> Dict[str, Any]:
+    """
+    parse_info over every saved page of pages_dir into output (result.json shape). The Parser never
+    creates its Requester, so neither a browser nor selenium is loaded
+    """
+    import asyncio
+    from ParserV2 import Parser
+    from ResultSink import NDJSONSink
+    from BrochureParsing import NoGridError
+
+    start: float = time.perf_counter()
+    pages: List[Tuple[str, str]] = saved_pages(pages_dir)
+    if not pages:
+        raise SystemExit(f"No saved pages (*.html, *.html.gz or fixture corpus) in {pages_dir}")
+
+    parser: Parser = Parser(parse_mode=parse_mode, parse_workers=parse_workers, parser_backend=parser_backend, parse_grid_only=grid_only)
+    # reading is cheap, a few pages ahead of the parse workers are enough
+    semaphore: asyncio.Semaphore = asyncio.Semaphore(max(1, parse_workers) * 2)
+
+    async def parse_page(shop_name: str, path: str) -> Tuple[str, Optional[List[Dict[str, Any]]]]:
+        async with semaphore:
+            html: str = await asyncio.to_thread(read_page, path)
+            try:
+                return shop_name, await parser.parse_info(html, shop_name)
+            except NoGridError as nge:
+                logger.warning(f"{shop_name} ({path}): {nge}")
+                return shop_name, None
+
+    sink: NDJSONSink = NDJSONSink(f"{output}.ndjson")
+    first_result_s: Optional[float] = None
+    failed: List[str] = []
+    try:
+        for result in asyncio.as_completed([parse_page(shop_name, path) for shop_name, path in pages]):
+            shop_name, brochures = await result
+            if brochures is None:
+                failed.append(shop_name)
+                continue
+            sink.append(shop_name, brochures)
+            if first_result_s is None:
+                first_result_s = time.perf_counter() - start
+    finally:
+        parser.close()
+    shops: int = sink.finalize(output)
+
+    return {
+        "pages": len(pages), "shops": shops, "failed": failed,
+        "first_result_ms": round(first_result_s * 1000, 1) if first_result_s is not None else None,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1), "output": output
+    }
+
+
+def stats(input_file: str, expiring_within_days: int = 2, top: int = 10) -> Dict[str, Any]:
+    """Summary of result.json (or a columnar file written by --columnar / export) without building a Parser"""
+    from datetime import date
+    from BrochureRecords import Brochure, ColumnarReader, compact_shop, NO_DATE
+
+    today: int = date.today().toordinal()
+    if input_file.endswith(".brch"):
+        with ColumnarReader(input_file) as reader:
+            records: List[Brochure] = list(reader)
+    else:
+        with open(input_file, "r", encoding="utf-8") as file:
+            records = [record for brochures in json.load(file) for record in compact_shop(brochures)]
+
+    per_shop: Dict[str, int] = {}
+    for record in records:
+        per_shop[record.shop_name] = per_shop.get(record.shop_name, 0) + 1
+
+    return {
+        "input": input_file,
+        "shops": len(per_shop),
+        "brochures": len(records),
+        "valid_today": sum(record.is_valid_on(date.today()) for record in records),
+        "expiring_soon": sum(today <= record.valid_to <= today + expiring_within_days for record in records if record.valid_to != NO_DATE),
+        "expired": sum(record.valid_to < today for record in records if record.valid_to != NO_DATE),
+        "without_dates": sum(record.valid_from == NO_DATE and record.valid_to == NO_DATE for record in records),
+        "top_shops": dict(sorted(per_shop.items(), key=lambda item: -item[1])[:top])
+    }
+
+
+def run_crawl(args: argparse.Namespace, error: Callable[[str], None]) -> None:
+    import asyncio
+
+    with filter_proxy(args.filter_proxy or bool(args.proxy_rules), args.proxy_rules) as proxy:
+        parser_options: Dict[str, Any] = browser_options(args.browsers, args.tabs)
+        if proxy:
+            parser_options["proxy"] = proxy.address
+        if args.thumbnails:
+            parser_options["thumbnail_dir"] = args.thumbnails
+        parser_options["min_browsers"] = min(args.warm_browsers, args.browsers)
+        parser_options["site_url"] = args.site_url
+        if args.no_browser:
+            parser_options["use_browser"] = False
+
+        if args.serve is not None:
+            if args.workers > 1 or args.incremental or args.replay_dead_letter or args.resume:
+                error("--serve runs a single worker full crawl, --workers/--incremental/--replay-dead-letter/--resume don't apply")
+            from CrawlDaemon import CrawlDaemon
+            asyncio.run(CrawlDaemon(parser_options, args.interval, args.serve, all_categories=args.all_categories).run())
+        elif args.workers > 1:
+            if args.incremental or args.replay_dead_letter:
+                error("--incremental and --replay-dead-letter are supported only with a single worker")
+            main_sharded(args.workers, args.resume, args.metrics_json, parser_options, args.columnar, args.sqlite, args.all_categories)
+        elif args.replay_dead_letter and (args.incremental or args.all_categories):
+            error("--incremental and --all-categories can't be combined with --replay-dead-letter")
+        else:
+            asyncio.run(main(args.resume, args.incremental, args.force, args.metrics_port, args.metrics_json, args.replay_dead_letter, parser_options,
+                             args.columnar, args.sqlite, args.all_categories))
+
+
+COMMANDS: Tuple[str, ...] = ("crawl", "parse-from-disk", "export", "stats")
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    arg_parser = argparse.ArgumentParser(description="prospektmaschine.de brochure crawler")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+
+    crawl_command = commands.add_parser("crawl", help="fetch all shops into result.json (default when no subcommand is given)")
+    crawl_command.add_argument("--workers", type=int, default=1, help="amount of crawler processes, every one has its own browser pool")
+    crawl_command.add_argument("--browsers", type=int, default=3, help="max Firefox instances per crawler process")
+    crawl_command.add_argument("--tabs", type=int, default=1, help="tabs per Firefox instance, more pages in flight for the same memory")
+    crawl_command.add_argument("--resume", action="store_true", help="skip shops finished by the previous (interrupted) run")
+    crawl_command.add_argument("--incremental", action="store_true", help="reuse shops whose brochures are all still valid and write delta.json against the previous result")
+    crawl_command.add_argument("--force", action="store_true", help="with --incremental: fetch every shop anyway, only the delta is computed")
+    crawl_command.add_argument("--metrics-port", type=int, default=None, help="serve stage histograms and counters in Prometheus format on this port")
+    crawl_command.add_argument("--metrics-json", default=None, help="write metrics snapshot into this file every 15s (with --workers: once per worker at the end)")
+    crawl_command.add_argument("--filter-proxy", action="store_true", help="route browser traffic through a local proxy that blocks trackers/fonts/media and caches static assets (https is intercepted with a local CA, needs openssl)")
+    crawl_command.add_argument("--proxy-rules", default=None, help="json file with deny_domains/allow_domains/deny_paths/deny_content_types for --filter-proxy")
+    crawl_command.add_argument("--thumbnails", default=None, metavar="DIR", help="download brochure thumbnails into this content addressed store and add thumbnail_path/thumbnail_hash")
+    crawl_command.add_argument("--columnar", default=None, metavar="FILE", help="also export the result as columnar binary file (see BrochureRecords.ColumnarReader), result.json is kept")
+    crawl_command.add_argument("--sqlite", default=None, metavar="DB", help="also upsert the result into this SQLite brochure store (see BrochureStore.py)")
+    crawl_command.add_argument("--all-categories", action="store_true", help="crawl shops of every category sidebar once, expiring brochures and new shops first")
+    crawl_command.add_argument("--serve", type=int, default=None, metavar="PORT", help="run as daemon: keep the browser pool open, re-crawl every --interval seconds and answer brochure queries on this port")
+    crawl_command.add_argument("--interval", type=float, default=3600, help="with --serve: seconds between crawls (POST /crawl starts one right away)")
+    crawl_command.add_argument("--warm-browsers", type=int, default=1, help="Firefox instances that stay open between crawls (and are started up front)")
+    crawl_command.add_argument("--replay-dead-letter", action="store_true", help=f"fetch only shops from {DEAD_LETTER} and merge them into the existing result")
+    crawl_command.add_argument("--site-url", default="https://www.prospektmaschine.de", help="crawl a mirror / local fixture server (see FixtureServer.py)")
+    crawl_command.add_argument("--no-browser", action="store_true", help="plain http only, pages that need javascript come back without brochures")
+
+    parse_command = commands.add_parser("parse-from-disk", help="parse saved shop pages, no browser and no network")
+    parse_command.add_argument("pages_dir", help="fixture corpus (manifest.json + pages/) or directory of <shop name>.html[.gz] files")
+    parse_command.add_argument("--output", default="./result.json")
+    parse_command.add_argument("--mode", choices=("thread", "process", "inline"), default="thread", help="where parse_info runs")
+    parse_command.add_argument("--workers", type=int, default=2, help="parse threads / processes")
+    parse_command.add_argument("--backend", default="html.parser", help="BrochureParsing backend (html.parser, lxml, selectolax)")
+    parse_command.add_argument("--grid-only", action="store_true", help="parse only the brochure grid of the page")
+
+    export_command = commands.add_parser("export", help="write an existing result.json into columnar / SQLite outputs")
+    export_command.add_argument("--input", default="./result.json")
+    export_command.add_argument("--columnar", default=None, metavar="FILE", help="columnar binary file (see BrochureRecords.ColumnarReader)")
+    export_command.add_argument("--sqlite", default=None, metavar="DB", help="upsert into this SQLite brochure store (see BrochureStore.py)")
+
+    stats_command = commands.add_parser("stats", help="shops, brochures and validity of a result")
+    stats_command.add_argument("--input", default="./result.json", help="result.json shaped file or .brch columnar file")
+    stats_command.add_argument("--expiring-within", type=int, default=2, metavar="DAYS")
+    stats_command.add_argument("--top", type=int, default=10, help="amount of shops with most brochures to list")
+
+    return arg_parser
+
+
+def cli(argv: Optional[List[str]] = None) -> None:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    # flags without subcommand keep working as before: python main.py --workers 4
+    if not argv or (argv[0] not in COMMANDS and argv[0] not in ("-h", "--help")):
+        argv.insert(0, "crawl")
+
+    arg_parser: argparse.ArgumentParser = build_arg_parser()
+    args: argparse.Namespace = arg_parser.parse_args(argv)
+
+    if args.command == "crawl":
+        run_crawl(args, arg_parser.error)
+    elif args.command == "parse-from-disk":
+        import asyncio
+        print(json.dumps(asyncio.run(parse_from_disk(args.pages_dir, args.output, args.mode, args.workers, args.backend, args.grid_only)), indent=4))
+    elif args.command == "export":
+        if not args.columnar and not args.sqlite:
+            arg_parser.error("export needs --columnar and/or --sqlite")
+        export(args.input, args.columnar, args.sqlite)
+    else:
+        print(json.dumps(stats(args.input, args.expiring_within, args.top), indent=4, ensure_ascii=False))
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    configure_logging()
+    cli()
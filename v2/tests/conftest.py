@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+
+# v2 modules import each other by flat name (scripts are run from inside v2)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def fixture_site(tmp_path):
+    """Serves {path: (shop_name or None, html)} with FixtureServer, returns the running server"""
+    from FixtureServer import FixtureCorpus, FixtureServer
+
+    servers = []
+
+    def serve(pages, **server_options):
+        corpus = FixtureCorpus(str(tmp_path / f"corpus-{len(servers)}"))
+        for path, (shop_name, html) in pages.items():
+            corpus.add(path, html, shop_name)
+        server = FixtureServer(corpus, **server_options).__enter__()
+        servers.append(server)
+        return server
+
+    yield serve
+    for server in servers:
+        server.__exit__(None, None, None)
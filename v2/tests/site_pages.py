@@ -0,0 +1,34 @@
+from typing import List, Dict, Optional, Tuple
+
+
+# minimal pages with the markup BrochureParsing and Parser.get_leftside_shop_list look for
+
+
+def card(title: Optional[str], brochure_id: int, dates: str = "03.03.2025 - 08.03.2025") -> str:
+    strong: str = f"<strong>{title}</strong>" if title is not None else ""
+    return f"""
+        <div class="brochure-thumb col-xs-6 col-sm-3" data-brochure-id="{brochure_id}">
+            <div class="img-container"><picture><img src="https://img.example/data/{brochure_id}/0.jpg?t=1"></picture></div>
+            <div class="letak-description"><p>{strong}</p><p><small class="hidden-sm">{dates}</small></p></div>
+        </div>"""
+
+
+def shop_page(titles: List[Optional[str]], grid_extra: str = "", grid_attributes: str = "", first_id: int = 1000) -> str:
+    cards: str = "".join(card(title, first_id + i) for i, title in enumerate(titles))
+    return f"""<html><body><div class="page-body">
+        <div class="letaky-grid" {grid_attributes}><div class="row">{cards}{grid_extra}</div></div>
+    </div></body></html>"""
+
+
+def sidebar_page(shops: Dict[str, str]) -> str:
+    """{shop_name: path}"""
+    items: str = "".join(f'<li><a href="{path}">{shop_name}</a></li>' for shop_name, path in shops.items())
+    return f'<html><body><div id="sidebar"><div class="box"><ul>{items}</ul></div></div></body></html>'
+
+
+def site(shops: Dict[str, Tuple[str, str]]) -> Dict[str, Tuple[Optional[str], str]]:
+    """{shop_name: (path, html)} -> pages for the fixture_site fixture, sidebar included"""
+    pages: Dict[str, Tuple[Optional[str], str]] = {"/hypermarkte/": (None, sidebar_page({name: path for name, (path, _) in shops.items()}))}
+    for shop_name, (path, html) in shops.items():
+        pages[path] = (shop_name, html)
+    return pages
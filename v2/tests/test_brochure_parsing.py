@@ -0,0 +1,43 @@
+import pytest
+
+from BrochureParsing import parse_brochures, NoGridError, IncompleteGridError
+from site_pages import shop_page
+
+
+def test_cards_are_parsed():
+    brochures = parse_brochures(shop_page(["Angebote", "Ostern"]), "Aldi")
+    assert [(b["title"], b["shop_name"], b["valid_from"], b["valid_to"]) for b in brochures] == [
+        ("Angebote", "Aldi", "03-03-2025", "03-08-2025"), ("Ostern", "Aldi", "03-03-2025", "03-08-2025")
+    ]
+    assert brochures[0]["thumbnail"] == "https://img.example/data/1000/0.jpg?t=1"
+
+
+@pytest.mark.parametrize("grid_only", [False, True])
+def test_page_without_grid(grid_only):
+    with pytest.raises(NoGridError):
+        parse_brochures("<html><body><div class='page-body'></div></body></html>", "Aldi", grid_only=grid_only)
+
+
+@pytest.mark.parametrize("grid_only", [False, True])
+@pytest.mark.parametrize("grid_extra, grid_attributes", [
+    ('<div class="intersect-lazy-load" data-offset="2"></div>', ""),
+    ('<button class="btn load-more-btn">Mehr</button>', ""),
+    ('<div class="brochure-thumb-placeholder"></div>', ""),
+    ("", 'data-total="5"'),
+])
+def test_truncated_grid_is_incomplete_only_when_required(grid_only, grid_extra, grid_attributes):
+    html = shop_page(["Angebote", "Ostern"], grid_extra, grid_attributes)
+    # the browser page is parsed as it is, static html must have the whole grid
+    assert len(parse_brochures(html, "Aldi", grid_only=grid_only)) == 2
+    with pytest.raises(IncompleteGridError):
+        parse_brochures(html, "Aldi", grid_only=grid_only, require_complete=True)
+
+
+def test_complete_and_empty_grids_pass():
+    assert len(parse_brochures(shop_page(["Angebote"], grid_attributes='data-total="1"'), "Aldi", require_complete=True)) == 1
+    assert parse_brochures(shop_page([]), "Aldi", require_complete=True) == []
+
+
+def test_incomplete_grid_is_a_grid_error():
+    # callers that only know NoGridError still treat the page as unusable
+    assert issubclass(IncompleteGridError, NoGridError)
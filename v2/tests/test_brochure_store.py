@@ -0,0 +1,77 @@
+import json
+from datetime import date
+
+import pytest
+
+from BrochureStore import BrochureStore, flatten_groups
+
+
+def brochure(shop_name, title, thumbnail, valid_from="03-03-2025", valid_to="03-08-2025"):
+    return {"title": title, "thumbnail": thumbnail, "shop_name": shop_name, "valid_from": valid_from,
+            "valid_to": valid_to, "parsed_time": "03-04-2025 10:00:00"}
+
+
+ALDI = [brochure("Aldi", "Wochenangebote", "https://img.example/aldi/1.jpg?v=1"),
+        brochure("Aldi", "Ostern", "https://img.example/aldi/2.jpg", "04-01-2025", "Not specified")]
+LIDL = [brochure("Lidl", "Angebote", "https://img.example/lidl/1.jpg", "Not found", "03-01-2025")]
+NETTO = [brochure("Netto", "Prospekt", "Not found", "Not found", "Not specified")]
+
+
+@pytest.fixture
+def store(tmp_path):
+    with BrochureStore(str(tmp_path / "brochures.db"), batch_size=2) as store:
+        yield store
+
+
+def write_json(path, data):
+    path.write_text(json.dumps(data), encoding="utf-8")
+    return str(path)
+
+
+def test_flatten_groups_accepts_both_shapes():
+    assert list(flatten_groups([ALDI, [], LIDL])) == [ALDI, [], LIDL]
+    assert list(flatten_groups([[ALDI, LIDL], [[], NETTO]])) == [ALDI, LIDL, [], NETTO]
+
+
+def test_import_v2_result_json(store, tmp_path):
+    assert store.import_json(write_json(tmp_path / "result.json", [ALDI, [], LIDL, NETTO])) == 3
+    assert store.shops() == {"Aldi": 2, "Lidl": 1, "Netto": 1}
+
+
+def test_import_v1_parsed_page_json(store, tmp_path):
+    # v1 writes groups of WRITE_GROUP_SIZE shops, failed shops are empty lists
+    assert store.import_json(write_json(tmp_path / "parsed_page.json", [[ALDI, [], LIDL], [NETTO]])) == 3
+    assert store.shops() == {"Aldi": 2, "Lidl": 1, "Netto": 1}
+    assert [b["title"] for b in store.by_shop("Aldi")] == ["Wochenangebote", "Ostern"]
+
+
+def test_upsert_keeps_one_row_per_brochure_and_drops_gone_ones(store):
+    store.import_shops([ALDI])
+    # same thumbnail path with another cache buster is the same brochure, "Ostern" is not in the snapshot anymore
+    updated = [dict(ALDI[0], title="Neue Angebote", thumbnail="https://img.example/aldi/1.jpg?v=2")]
+    store.import_shops([updated])
+
+    stored = store.by_shop("Aldi")
+    assert [(b["title"], b["thumbnail"]) for b in stored] == [("Neue Angebote", "https://img.example/aldi/1.jpg?v=2")]
+
+
+def test_append_is_buffered_until_batch_size(store):
+    store.append("Lidl", LIDL)
+    # queries flush pending shops first
+    assert store.shops() == {"Lidl": 1}
+
+
+def test_validity_queries_treat_missing_dates_as_open(store):
+    store.import_shops([ALDI, LIDL, NETTO])
+
+    assert {b["title"] for b in store.valid_on(date(2025, 3, 5))} == {"Wochenangebote", "Prospekt"}
+    assert {b["title"] for b in store.valid_on(date(2025, 2, 1))} == {"Angebote", "Prospekt"}
+    assert {b["title"] for b in store.valid_between(date(2025, 3, 1), date(2025, 4, 2), "Aldi")} == {"Wochenangebote", "Ostern"}
+    assert store.valid_on(date(2025, 4, 5), "Lidl") == []
+
+
+def test_round_trip_keeps_dates(store):
+    store.import_shops([ALDI])
+    first = store.by_shop("Aldi")[0]
+    assert (first["valid_from"], first["valid_to"], first["parsed_time"]) == ("03-03-2025", "03-08-2025", "03-04-2025 10:00:00")
+    assert store.by_shop("Aldi")[1]["valid_to"] == "Not specified"
@@ -0,0 +1,256 @@
+import asyncio
+import itertools
+
+import pytest
+
+import BrowserPool as browser_pool
+from BrowserPool import BrowserPool
+
+
+class FakeSwitchTo:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def new_window(self, kind):
+        self.driver.handles.append(f"{self.driver.name}-tab-{len(self.driver.handles)}")
+        self.driver.current = self.driver.handles[-1]
+
+    def window(self, handle):
+        self.driver.switches += 1
+        self.driver.current = handle
+
+
+class FakeDriver:
+    """Just enough of webdriver.Firefox for the pool: window handles, get and quit"""
+    ids = itertools.count()
+
+    def __init__(self):
+        self.name = f"driver-{next(FakeDriver.ids)}"
+        self.capabilities = {}
+        self.handles = [f"{self.name}-tab-0"]
+        self.current = self.handles[0]
+        self.switch_to = FakeSwitchTo(self)
+        self.switches = 0
+        self.visited = []
+        self.dead = False
+        self.quit_called = False
+
+    @property
+    def current_window_handle(self):
+        if self.dead:
+            raise ConnectionRefusedError("geckodriver is gone")
+        return self.current
+
+    def get(self, url):
+        self.visited.append((self.current, url))
+
+    def quit(self):
+        self.quit_called = True
+
+
+class FakePool(BrowserPool):
+    def __init__(self, fail_starts=0, **options):
+        super().__init__(["test-agent"], **options)
+        self.created = []
+        self.fail_starts = fail_starts
+
+    def _create_driver(self):
+        if self.fail_starts:
+            self.fail_starts -= 1
+            raise RuntimeError("Firefox could not start")
+        driver = FakeDriver()
+        self.created.append(driver)
+        return driver
+
+    @staticmethod
+    def _quit_driver(driver):
+        driver.quit()
+
+
+@pytest.fixture(autouse=True)
+def no_geckodriver_download(monkeypatch):
+    monkeypatch.setattr(browser_pool, "resolve_driver_path", lambda: "geckodriver")
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def settle(pool):
+    # background spawns/retirements run as tasks, give them a few loop turns
+    for _ in range(20):
+        await asyncio.sleep(0.01)
+
+
+def test_checked_in_driver_is_reused():
+    async def scenario():
+        pool = FakePool(min_size=1, max_size=2)
+        await pool.start()
+        async with pool.lease() as first:
+            pass
+        async with pool.lease() as second:
+            pass
+        await pool.close()
+        return pool, first, second
+
+    pool, first, second = run(scenario())
+    assert first.driver is second.driver
+    assert len(pool.created) == 1 and pool.checkouts == 2
+    assert pool.created[0].quit_called and pool.size == 0
+
+
+def test_driver_is_recycled_after_max_pages():
+    async def scenario():
+        pool = FakePool(min_size=1, max_size=1, max_pages=2)
+        await pool.start()
+        drivers = []
+        for _ in range(3):
+            async with pool.lease() as tab:
+                drivers.append(tab.driver)
+            await settle(pool)
+        await pool.close()
+        return pool, drivers
+
+    pool, drivers = run(scenario())
+    assert drivers[0] is drivers[1] and drivers[2] is not drivers[0]
+    assert drivers[0].quit_called and pool.recycled == 1
+    assert pool.metrics()["retired_driver_age_avg_s"] is not None
+
+
+def test_dead_driver_fails_probe_and_is_replaced():
+    async def scenario():
+        pool = FakePool(min_size=1, max_size=1, probe_timeout_s=1)
+        await pool.start()
+        pool.created[0].dead = True
+        async with pool.lease() as tab:
+            driver = tab.driver
+        await pool.close()
+        return pool, driver
+
+    pool, driver = run(scenario())
+    assert driver is pool.created[1]
+    assert pool.restarted == 1 and pool.created[0].quit_called
+
+
+def test_pool_grows_when_callers_wait():
+    async def scenario():
+        pool = FakePool(min_size=1, max_size=2, grow_after_wait_s=0.05)
+        await pool.start()
+        first = await pool.checkout()
+        # only browser is busy, the second caller waits and the pool grows
+        second = await asyncio.wait_for(pool.checkout(), timeout=2)
+        size = pool.size
+        await pool.checkin(first)
+        await pool.checkin(second)
+        await pool.close()
+        return pool, first, second, size
+
+    pool, first, second, size = run(scenario())
+    assert first.driver is not second.driver
+    assert size == 2 and pool.grown == 1
+    assert pool.metrics()["wait_max_s"] >= 0.05
+
+
+def test_idle_pool_shrinks_to_min_size():
+    async def scenario():
+        pool = FakePool(min_size=1, max_size=3, grow_after_wait_s=0.01)
+        await pool.start()
+        tabs = [await pool.checkout() for _ in range(3)]
+        for tab in tabs:
+            await pool.checkin(tab)
+        size_before = pool.size
+        retired = pool.shrink_idle()
+        await settle(pool)
+        open_drivers = [driver for driver in pool.created if not driver.quit_called]
+        async with pool.lease() as tab:
+            leased = tab.driver
+        await pool.close()
+        return pool, size_before, retired, open_drivers, leased
+
+    pool, size_before, retired, open_drivers, leased = run(scenario())
+    assert (size_before, retired, pool.shrunk) == (3, 2, 2)
+    # idle tabs of the retired browsers stay queued but are never handed out again
+    assert open_drivers == [leased]
+
+
+def test_start_fails_when_no_browser_starts():
+    pool = FakePool(fail_starts=5, min_size=2, max_size=2)
+    with pytest.raises(RuntimeError, match="None of the Firefox browsers"):
+        run(pool.start())
+
+
+def test_start_survives_some_failed_browsers():
+    async def scenario():
+        pool = FakePool(fail_starts=1, min_size=2, max_size=2)
+        await pool.start()
+        size = pool.size
+        await pool.close()
+        return size
+
+    assert run(scenario()) == 1
+
+
+def test_tabs_of_one_browser_are_leased_at_once():
+    async def scenario():
+        pool = FakePool(min_size=1, max_size=1, tabs_per_browser=3, grow_after_wait_s=0.05)
+        await pool.start()
+        tabs = [await pool.checkout() for _ in range(3)]
+        for tab in reversed(tabs):
+            tab.run(lambda driver, url=f"https://example.test/{tab.handle}": driver.get(url))
+        for tab in tabs:
+            await pool.checkin(tab)
+        await pool.close()
+        return pool, tabs
+
+    pool, tabs = run(scenario())
+    driver = pool.created[0]
+    assert len(pool.created) == 1 and pool.capacity == 3
+    assert len({tab.handle for tab in tabs}) == 3 and all(tab.driver is driver for tab in tabs)
+    # every command ran in its own window, then the tab was emptied for the next shop
+    for tab in tabs:
+        assert (tab.handle, f"https://example.test/{tab.handle}") in driver.visited
+        assert driver.visited[-3:].count((tab.handle, "about:blank")) == 1
+
+
+def test_tab_switches_window_only_when_needed():
+    async def scenario():
+        pool = FakePool(min_size=1, max_size=1, tabs_per_browser=2)
+        await pool.start()
+        first, second = await pool.checkout(), await pool.checkout()
+        driver = first.driver
+        switches = driver.switches
+        first.run(lambda d: d.get("https://example.test/a"))
+        first.run(lambda d: d.get("https://example.test/b"))
+        after_first = driver.switches - switches
+        second.run(lambda d: d.get("https://example.test/c"))
+        after_second = driver.switches - switches
+        await pool.checkin(first)
+        await pool.checkin(second)
+        await pool.close()
+        return after_first, after_second
+
+    # the session starts in the last opened tab, the first one is switched to once for both commands
+    assert run(scenario()) == (1, 2)
+
+
+def test_multi_tab_browser_is_recycled_after_its_last_tab_returns():
+    async def scenario():
+        pool = FakePool(min_size=1, max_size=1, tabs_per_browser=3, max_pages=2)
+        await pool.start()
+        tabs = [await pool.checkout() for _ in range(3)]
+        old = pool.created[0]
+        await pool.checkin(tabs[0])
+        await pool.checkin(tabs[1])
+        await settle(pool)
+        # max_pages reached, but one tab still loads a page
+        quit_while_in_use = old.quit_called
+        await pool.checkin(tabs[2])
+        await settle(pool)
+        async with pool.lease() as tab:
+            leased = tab.driver
+        await pool.close()
+        return pool, old, quit_while_in_use, leased
+
+    pool, old, quit_while_in_use, leased = run(scenario())
+    assert not quit_while_in_use and old.quit_called
+    assert pool.recycled == 1 and leased is pool.created[1]
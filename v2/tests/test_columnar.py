@@ -0,0 +1,66 @@
+import json
+from datetime import date
+
+import pytest
+
+from BrochureRecords import Brochure, ColumnarReader, write_columnar, export_columnar, date_to_ordinal, NO_DATE
+
+
+def brochure(shop_name, title, valid_from="03-03-2025", valid_to="03-08-2025", **extra):
+    return {
+        "title": title, "thumbnail": f"https://img.example/data/{title}/0.jpg", "shop_name": shop_name,
+        "valid_from": valid_from, "valid_to": valid_to, "parsed_time": "03-04-2025 10:00:00", **extra
+    }
+
+
+SHOPS = [
+    [brochure("Aldi", "Angebote"), brochure("Aldi", "Ostern", "Not found", "Not specified", thumbnail_hash="ab12")],
+    [],
+    [brochure("Müller", "Frühling", "03-10-2025", "03-15-2025")]
+]
+
+
+def test_round_trip_gives_back_result_json_dicts(tmp_path):
+    path = str(tmp_path / "result.brch")
+    assert write_columnar(SHOPS, path) == 3
+
+    with ColumnarReader(path) as reader:
+        assert len(reader) == 3 and reader.shop_names == ["Aldi", "Müller"]
+        assert [record.to_dict() for record in reader] == [shop_brochure for shop in SHOPS for shop_brochure in shop]
+
+
+def test_validity_and_shop_queries_touch_only_their_columns(tmp_path):
+    path = str(tmp_path / "result.brch")
+    write_columnar(SHOPS, path)
+
+    with ColumnarReader(path) as reader:
+        # the brochure without dates is valid on every day
+        assert reader.rows_valid_on(date(2025, 3, 5)) == [0, 1]
+        assert reader.rows_valid_on(date(2025, 3, 12)) == [1, 2]
+        assert reader.rows_of_shop("Müller") == [2] and reader.rows_of_shop("Lidl") == []
+        assert list(reader.column("valid_from")) == [date_to_ordinal("03-03-2025"), NO_DATE, date_to_ordinal("03-10-2025")]
+        with pytest.raises(KeyError):
+            reader.column("title")
+        with pytest.raises(IndexError):
+            reader[3]
+
+
+def test_export_of_empty_result(tmp_path):
+    (tmp_path / "result.json").write_text("[]", encoding="utf-8")
+    assert export_columnar(str(tmp_path / "result.json"), str(tmp_path / "result.brch")) == 0
+    with ColumnarReader(str(tmp_path / "result.brch")) as reader:
+        assert list(reader) == [] and reader.shop_names == []
+
+
+def test_other_files_are_rejected(tmp_path):
+    path = tmp_path / "result.json"
+    path.write_text(json.dumps(SHOPS) + " " * 64, encoding="utf-8")
+    with pytest.raises(ValueError, match="not a brochure columnar file"):
+        ColumnarReader(str(path))
+
+
+def test_record_dates():
+    record = Brochure.from_dict(brochure("Aldi", "Angebote"))
+    assert record.is_valid_on(date(2025, 3, 8)) and not record.is_valid_on(date(2025, 3, 9))
+    assert date_to_ordinal("31-12-2025") == NO_DATE and date_to_ordinal(None) == NO_DATE
+    assert Brochure.from_dict(brochure("Aldi", "Angebote", "Not found", "Not specified")).is_valid_on(date(2030, 1, 1))
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from datetime import date
+
+import pytest
+
+from CrawlDaemon import CrawlDaemon, BrochureCatalog
+from site_pages import shop_page, site
+
+
+def call(url, method="GET"):
+    request = urllib.request.Request(url, method=method, data=b"" if method == "POST" else None)
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as error:
+        return error.code, json.loads(error.read())
+
+
+def wait_until(condition, timeout_s=20):
+    deadline = time.monotonic() + timeout_s
+    while not condition():
+        assert time.monotonic() < deadline, "daemon didn't get there in time"
+        time.sleep(0.05)
+
+
+@contextmanager
+def running(daemon):
+    thread = threading.Thread(target=asyncio.run, args=(daemon.run(),), daemon=True)
+    thread.start()
+    try:
+        wait_until(lambda: daemon.crawls >= 1)
+        yield daemon.address
+    finally:
+        daemon.stop()
+        thread.join(10)
+    assert not thread.is_alive()
+
+
+@pytest.fixture
+def daemon_for(tmp_path, monkeypatch):
+    # result.json, result.ndjson and the page cache are written into the working directory
+    monkeypatch.chdir(tmp_path)
+
+    def create(base_url):
+        return CrawlDaemon({"site_url": base_url, "use_browser": False, "base_delay": 0.01, "parse_mode": "inline"}, port=0,
+                           dead_letter_json=str(tmp_path / "dead_letter.json"))
+    return create
+
+
+def test_catalog_is_queried_and_refreshed_on_trigger(fixture_site, daemon_for):
+    server = fixture_site(site({
+        "Aldi": ("/aldi/", shop_page(["Angebote", "Ostern"])),
+        "Lidl": ("/lidl/", shop_page(["Grillen"], first_id=2000)),
+    }))
+    daemon = daemon_for(server.base_url)
+
+    with running(daemon) as address:
+        assert call(f"{address}/shops") == (200, {"Aldi": 2, "Lidl": 1})
+        status, body = call(f"{address}/brochures?shop=aldi")
+        assert status == 200 and [b["title"] for b in body["brochures"]] == ["Angebote", "Ostern"]
+        # card dates of site_pages are 03.03.2025 - 08.03.2025
+        assert call(f"{address}/brochures?date=2025-03-05")[1]["count"] == 3
+        assert call(f"{address}/brochures?date=2025-04-01")[1]["count"] == 0
+        assert call(f"{address}/brochures?date=05.03.2025")[0] == 400
+        assert call(f"{address}/unknown")[0] == 404
+
+        status, body = call(f"{address}/status")
+        assert body["crawls"] == 1 and body["last_crawl"]["shops"] == 2 and body["last_crawl"]["error"] is None
+
+        server.corpus.add("/lidl/", shop_page(["Grillen", "Ostern"], first_id=2000), "Lidl")
+        assert call(f"{address}/crawl", "POST") == (202, {"queued": False, "started": True})
+        wait_until(lambda: daemon.crawls >= 2)
+        assert call(f"{address}/shops")[1] == {"Aldi": 2, "Lidl": 2}
+        assert call(f"{address}/other", "POST")[0] == 404
+
+
+def test_failed_crawl_keeps_serving_the_previous_result(fixture_site, daemon_for, tmp_path):
+    previous = [[{"title": "Angebote", "thumbnail": "Not found", "shop_name": "Aldi", "valid_from": "03-03-2025",
+                  "valid_to": "03-08-2025", "parsed_time": "03-03-2025 10:00:00"}]]
+    (tmp_path / "result.json").write_text(json.dumps(previous), encoding="utf-8")
+    # no sidebar on the site, the crawl can't even start
+    server = fixture_site({"/aldi/": ("Aldi", shop_page(["Ostern"]))})
+    daemon = daemon_for(server.base_url)
+
+    with running(daemon) as address:
+        status = call(f"{address}/status")[1]
+        assert "couldn't be fetched" in status["last_crawl"]["error"]
+        assert call(f"{address}/brochures")[1]["brochures"][0]["title"] == "Angebote"
+
+
+def test_catalog_without_result(tmp_path):
+    catalog = BrochureCatalog()
+    assert catalog.load(str(tmp_path / "result.json")) == 0
+    assert catalog.query() == [] and catalog.updated_at is None
+
+    (tmp_path / "result.json").write_text("[[", encoding="utf-8")
+    assert catalog.load(str(tmp_path / "result.json")) == 0
+    assert catalog.query(shop_name="Aldi", valid_on=date(2025, 3, 5)) == []
@@ -0,0 +1,125 @@
+import itertools
+from datetime import date
+
+import pytest
+
+import CrawlFrontier as crawl_frontier
+from CrawlFrontier import CrawlFrontier, discover_categories, normalize_link
+from DeltaCrawl import BrochureIndex
+from ParserV2 import Parser
+from site_pages import sidebar_page
+
+
+SITE = "https://www.prospektmaschine.de"
+
+
+def shop(name, path=None):
+    return {"shop_name": name, "link": f"{SITE}{path or '/' + name.lower() + '/'}"}
+
+
+def brochure(shop_name, title, valid_to="03-20-2025"):
+    return {"title": title, "thumbnail": f"https://img.example/{title}.jpg", "shop_name": shop_name, "valid_from": "03-03-2025", "valid_to": valid_to}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # every record() gets its own later timestamp
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(crawl_frontier.time, "time", lambda: float(next(ticks)))
+
+
+def test_shops_of_several_sidebars_are_deduplicated():
+    frontier = CrawlFrontier("unused.json")
+    frontier.add_category("hypermarkte", [shop("Aldi"), shop("Lidl")])
+    frontier.add_category("discounter", [shop("Aldi", "/aldi"), shop("Lidl", "/lidl/?ref=nav"), shop("Penny")])
+
+    assert [(s["shop_name"], s["categories"]) for s in frontier.shops.values()] == [
+        ("Aldi", ["hypermarkte", "discounter"]), ("Lidl", ["hypermarkte", "discounter"]), ("Penny", ["discounter"])
+    ]
+    assert frontier.duplicates == 2
+    assert normalize_link("https://WWW.prospektmaschine.de/aldi?x=1") == f"{SITE}/aldi/"
+
+
+def test_order_is_expiring_never_seen_changed_unchanged(tmp_path, clock):
+    state_file = str(tmp_path / "frontier.json")
+    first = CrawlFrontier(state_file)
+    first.add_category("hypermarkte", [shop("Unchanged"), shop("Changed"), shop("Expiring")])
+    first.record(first.shops[f"{SITE}/unchanged/"], [brochure("Unchanged", "Angebote")])
+    first.record(first.shops[f"{SITE}/changed/"], [brochure("Changed", "Angebote")])
+    first.record(first.shops[f"{SITE}/unchanged/"], [brochure("Unchanged", "Angebote")])
+    first.record(first.shops[f"{SITE}/changed/"], [brochure("Changed", "Ostern")])
+    first.save()
+
+    # history survives in the state file
+    frontier = CrawlFrontier(state_file, expiring_within_days=2)
+    frontier.add_category("hypermarkte", [shop("Unchanged"), shop("Changed"), shop("New"), shop("Expiring")])
+    previous = BrochureIndex([[brochure("Expiring", "Angebote", valid_to="03-06-2025")], [brochure("Changed", "Ostern")]])
+
+    ordered = frontier.ordered(previous, today=date(2025, 3, 5))
+    assert [s["shop_name"] for s in ordered] == ["Expiring", "New", "Changed", "Unchanged"]
+
+
+def test_record_snapshot_records_only_shops_with_brochures(tmp_path):
+    frontier = CrawlFrontier(str(tmp_path / "frontier.json"))
+    frontier.add_category("hypermarkte", [shop("Aldi"), shop("Lidl")])
+    assert frontier.record_snapshot(BrochureIndex([[brochure("Aldi", "Angebote")]])) == 1
+
+    frontier.save()
+    reloaded = CrawlFrontier(str(tmp_path / "frontier.json"))
+    reloaded.add_category("hypermarkte", [shop("Aldi"), shop("Lidl")])
+    assert [s["shop_name"] for s in reloaded.ordered()] == ["Lidl", "Aldi"]
+
+
+def test_corrupted_state_counts_every_shop_as_never_seen(tmp_path):
+    (tmp_path / "frontier.json").write_text("{", encoding="utf-8")
+    frontier = CrawlFrontier(str(tmp_path / "frontier.json"))
+    frontier.add_category("hypermarkte", [shop("Aldi")])
+    assert frontier.ordered()[0]["shop_name"] == "Aldi"
+
+
+NAV = """<ul class="nav">
+    <li class="has_child"><a class="is_category" href="/hypermarkte/">Hypermärkte</a></li>
+    <li class="has_child"><a class="is_category" href="/drogerien/">Drogerien</a></li>
+    <li class="has_child"><a class="is_category" href="/drogerien/">Drogerien</a></li>
+    <li class="has_child"><a class="is_category" href="/moebel/">Möbel</a></li>
+    <li><a href="/impressum/">Impressum</a></li>
+</ul>"""
+
+
+def category_page(shops):
+    return sidebar_page(shops).replace("<body>", f"<body>{NAV}")
+
+
+def test_discover_categories():
+    assert discover_categories(NAV, SITE) == [
+        {"category": "Hypermärkte", "link": f"{SITE}/hypermarkte/"},
+        {"category": "Drogerien", "link": f"{SITE}/drogerien/"},
+        {"category": "Möbel", "link": f"{SITE}/moebel/"}
+    ]
+
+
+def test_sidebars_of_all_categories_are_merged(fixture_site):
+    server = fixture_site({
+        "/hypermarkte/": (None, category_page({"Aldi": "/aldi/", "dm": "/dm/"})),
+        "/drogerien/": (None, category_page({"dm": "/dm/", "Rossmann": "/rossmann/"})),
+        # /moebel/ is missing, the other categories are still crawled
+    })
+    parser = Parser(site_url=server.base_url, use_browser=False, parse_mode="inline")
+    try:
+        frontier = parser.get_all_categories_shop_list(CrawlFrontier("unused.json"))
+    finally:
+        parser.close()
+
+    assert [(s["shop_name"], s["categories"]) for s in frontier.shops.values()] == [
+        ("Aldi", ["Hypermärkte"]), ("dm", ["Hypermärkte", "Drogerien"]), ("Rossmann", ["Drogerien"])
+    ]
+
+
+def test_missing_base_sidebar_is_an_error(fixture_site):
+    server = fixture_site({"/drogerien/": (None, category_page({"dm": "/dm/"}))})
+    parser = Parser(site_url=server.base_url, use_browser=False, parse_mode="inline")
+    try:
+        with pytest.raises(RuntimeError, match="couldn't be fetched"):
+            parser.get_all_categories_shop_list(CrawlFrontier("unused.json"))
+    finally:
+        parser.close()
@@ -0,0 +1,85 @@
+import json
+
+from CrawlJournal import CrawlJournal
+
+
+SHOPS = [{"shop_name": name, "link": f"https://www.prospektmaschine.de/{name.lower()}/"} for name in ("Aldi", "Lidl", "Penny")]
+BROCHURES = [{"title": "Angebote", "shop_name": "Aldi"}]
+
+
+def lines(path):
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+
+def test_finished_shops_are_appended_as_single_lines(tmp_path):
+    path = str(tmp_path / "journal.json")
+    journal = CrawlJournal(path)
+    assert journal.start(SHOPS) == SHOPS
+    assert len(lines(path)) == 3
+
+    journal.mark_done(SHOPS[0]["link"], "Aldi", BROCHURES)
+    journal.mark_failed(SHOPS[1]["link"], "Lidl", "timeout")
+    records = lines(path)
+    # one line per state change instead of rewriting the whole journal
+    assert len(records) == 5
+    assert (records[-2]["url"], records[-2]["state"]) == (SHOPS[0]["link"], "done")
+    assert (records[-1]["state"], records[-1]["error"]) == ("failed", "timeout")
+
+
+def test_resume_skips_done_shops_and_keeps_their_brochures(tmp_path):
+    path = str(tmp_path / "journal.json")
+    journal = CrawlJournal(path)
+    journal.start(SHOPS)
+    journal.mark_failed(SHOPS[0]["link"], "Aldi", "timeout")
+    journal.mark_done(SHOPS[0]["link"], "Aldi", BROCHURES)
+    journal.mark_failed(SHOPS[1]["link"], "Lidl", "timeout")
+
+    resumed = CrawlJournal(path, resume=True)
+    assert resumed.summary() == "pending: 1, done: 1, failed: 1"
+    assert resumed.start(SHOPS) == SHOPS[1:]
+    assert resumed.done_shops(SHOPS) == [("Aldi", BROCHURES)]
+    assert resumed.brochures(SHOPS[0]["link"]) == BROCHURES
+    # start() compacted the journal to one line per shop, attempts survive the compaction
+    records = {record["url"]: record for record in lines(path)}
+    assert len(lines(path)) == 3 and records[SHOPS[0]["link"]]["attempts"] == 2
+
+
+def test_line_cut_by_a_crash_is_skipped(tmp_path):
+    path = str(tmp_path / "journal.json")
+    journal = CrawlJournal(path)
+    journal.start(SHOPS)
+    journal.mark_done(SHOPS[0]["link"], "Aldi", BROCHURES)
+    with open(path, "a", encoding="utf-8") as file:
+        file.write('{"url": "https://www.prospektmaschine.de/lidl/", "state": "do')
+
+    resumed = CrawlJournal(path, resume=True)
+    assert resumed.is_done(SHOPS[0]["link"]) and not resumed.is_done(SHOPS[1]["link"])
+
+
+def test_journal_written_as_one_object_is_loaded(tmp_path):
+    path = tmp_path / "journal.json"
+    path.write_text(json.dumps({
+        SHOPS[0]["link"]: {"shop_name": "Aldi", "state": "done", "brochures": BROCHURES, "attempts": 1},
+        SHOPS[1]["link"]: {"shop_name": "Lidl", "state": "pending", "attempts": 0}
+    }), encoding="utf-8")
+
+    resumed = CrawlJournal(str(path), resume=True)
+    assert resumed.start(SHOPS) == SHOPS[1:]
+    assert all("url" in record for record in lines(path))
+
+
+def test_missing_journal_on_resume_starts_from_scratch(tmp_path):
+    journal = CrawlJournal(str(tmp_path / "missing.json"), resume=True)
+    assert journal.start(SHOPS) == SHOPS
+
+
+def test_without_resume_previous_lines_are_dropped(tmp_path):
+    path = str(tmp_path / "journal.json")
+    journal = CrawlJournal(path)
+    journal.start(SHOPS)
+    journal.mark_done(SHOPS[0]["link"], "Aldi", BROCHURES)
+
+    fresh = CrawlJournal(path)
+    fresh.mark_done(SHOPS[2]["link"], "Penny", [])
+    assert [record["shop_name"] for record in lines(path)] == ["Penny"]
@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+import pytest
+
+from CrawlPipeline import CrawlPipeline
+from RequestMaker import Requester
+from RetryScheduler import RetryScheduler, ShopFetchError, HTTP_ERROR
+
+
+def shops(*names):
+    return [{"shop_name": name, "link": f"https://www.prospektmaschine.de/{name.lower()}/"} for name in names]
+
+
+class FakeRequester(Requester):
+    """Requester without network: failures[shop_name] attempts fail, shops in escalate need the browser tier"""
+    def __init__(self, failures=None, escalate=(), fetch_delay_s=0.0):
+        super().__init__(use_browser=False)
+        self.failures = dict(failures or {})
+        self.escalate = set(escalate)
+        self.fetch_delay_s = fetch_delay_s
+        self.fetches = []
+
+    async def fetch_shop_page(self, shop_name, url, start_tier="cache"):
+        self.fetches.append((shop_name, start_tier))
+        await asyncio.sleep(self.fetch_delay_s)
+        if self.failures.get(shop_name):
+            self.failures[shop_name] -= 1
+            raise ShopFetchError(HTTP_ERROR, f"503 for {shop_name}")
+        return f"<html>{shop_name}</html>", start_tier
+
+    async def parse_shop_page(self, shop_name, url, html, tier, parse_shop_page_func):
+        if shop_name in self.escalate and tier != "browser":
+            return None
+        return await parse_shop_page_func(html, shop_name)
+
+
+async def parse(html, shop_name):
+    return [{"title": "Angebote", "shop_name": shop_name}]
+
+
+def crawl(requester, shop_data, on_result=None, timeout_s=10, **options):
+    results = []
+    options.setdefault("retry", RetryScheduler(base_delay_s=0))
+    pipeline = CrawlPipeline(requester, parse, **options)
+
+    def collect(shop, brochures, error):
+        results.append((shop["shop_name"], len(brochures), error.error_class if error else None))
+
+    asyncio.run(asyncio.wait_for(pipeline.run(shop_data, on_result or collect), timeout_s))
+    return pipeline, results
+
+
+def test_every_shop_is_written_once():
+    pipeline, results = crawl(FakeRequester(), shops("Aldi", "Lidl", "Penny"), fetch_workers=2)
+    assert sorted(results) == [("Aldi", 1, None), ("Lidl", 1, None), ("Penny", 1, None)]
+    assert pipeline.completed == 3 and len(pipeline.shop_timings) == 3
+
+
+def test_retries_come_after_every_first_attempt():
+    requester = FakeRequester(failures={"Aldi": 1})
+    names = ["Aldi", "Lidl", "Penny", "Netto", "Rewe"]
+    pipeline, results = crawl(requester, shops(*names), fetch_workers=1)
+
+    fetched = [shop_name for shop_name, _ in requester.fetches]
+    assert fetched == names + ["Aldi"]
+    assert ("Aldi", 1, None) in results and requester.metrics.counters["retry_http_error"] == 1
+
+
+def test_shop_out_of_budget_is_written_with_its_error():
+    requester = FakeRequester(failures={"Aldi": 5})
+    _, results = crawl(requester, shops("Aldi", "Lidl"), retry=RetryScheduler(budgets={HTTP_ERROR: 1}, base_delay_s=0))
+    assert sorted(results) == [("Aldi", 0, HTTP_ERROR), ("Lidl", 1, None)]
+    assert [tier for shop_name, tier in requester.fetches if shop_name == "Aldi"] == ["cache", "cache"]
+
+
+def test_page_that_needs_the_next_tier_is_escalated():
+    requester = FakeRequester(escalate={"Lidl"})
+    _, results = crawl(requester, shops("Aldi", "Lidl"))
+    assert sorted(results) == [("Aldi", 1, None), ("Lidl", 1, None)]
+    assert [tier for shop_name, tier in requester.fetches if shop_name == "Lidl"] == ["cache", "http", "browser"]
+
+
+def test_duplicate_links_are_fetched_once():
+    requester = FakeRequester()
+    _, results = crawl(requester, shops("Aldi", "Lidl") + shops("Aldi"))
+    assert sorted(results) == [("Aldi", 1, None), ("Lidl", 1, None)]
+    assert len(requester.fetches) == 2
+
+
+def test_failing_result_handler_ends_the_run():
+    def broken_sink(shop, brochures, error):
+        raise OSError("disk full")
+
+    # the other stages must not keep waiting on the writer's queue
+    with pytest.raises(OSError, match="disk full"):
+        crawl(FakeRequester(), shops(*[f"Shop{i}" for i in range(50)]), broken_sink, queue_size=2)
+
+
+def test_slow_writer_slows_down_fetching():
+    requester = FakeRequester()
+    written = []
+    gaps = []
+
+    def slow_sink(shop, brochures, error):
+        time.sleep(0.002)
+        written.append(shop["shop_name"])
+        gaps.append(len(requester.fetches) - len(written))
+
+    crawl(requester, shops(*[f"Shop{i}" for i in range(60)]), slow_sink, fetch_workers=2, parse_workers=1, queue_size=1)
+    assert len(written) == 60
+    # fetch workers + parse queue + parse worker + write queue + writer, the rest of the catalog waits in the frontier
+    assert max(gaps) <= 2 + 1 + 1 + 1 + 1
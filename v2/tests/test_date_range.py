@@ -0,0 +1,54 @@
+import time
+from datetime import date, datetime
+
+import pytest
+
+import DateRange
+from DateRange import parse_date_range, _parse_date_range
+
+
+# (card text, expected (valid_from, valid_to)) of formats seen on the site
+FIXTURES = [
+    ("03.03.2025 - 08.03.2025", (datetime(2025, 3, 3), datetime(2025, 3, 8))),
+    (" 03.03.2025 -08.03.2025 ", (datetime(2025, 3, 3), datetime(2025, 3, 8))),
+    ("03.03.2025 – 08.03.2025", (datetime(2025, 3, 3), datetime(2025, 3, 8))),
+    ("03.03.2025 bis 08.03.2025", (datetime(2025, 3, 3), datetime(2025, 3, 8))),
+    ("Mo. 03.03. - Sa. 08.03.2025", (datetime(2025, 3, 3), datetime(2025, 3, 8))),
+    ("Montag 03.03.25 - Samstag 08.03.25", (datetime(2025, 3, 3), datetime(2025, 3, 8))),
+    ("28.12. - 03.01.2026", (datetime(2025, 12, 28), datetime(2026, 1, 3))),
+    ("von Montag 03.03.2025", (datetime(2025, 3, 3), None)),
+    ("ab 03.03.2025", (datetime(2025, 3, 3), None)),
+    ("bis Samstag 08.03.2025", (None, datetime(2025, 3, 8))),
+    ("gültig bis 08.03.25", (None, datetime(2025, 3, 8))),
+    ("31.02.2025 - 08.03.2025", (None, None)),
+    ("Nicht angegeben", (None, None)),
+]
+
+
+@pytest.mark.parametrize("text, expected", FIXTURES)
+def test_formats(text, expected):
+    assert parse_date_range(text) == expected
+
+
+def test_dates_without_year_use_current_year():
+    assert parse_date_range("03.03. - 08.03.", current_year=2025) == (datetime(2025, 3, 3), datetime(2025, 3, 8))
+    assert parse_date_range("bis 08.03.", current_year=2025) == (None, datetime(2025, 3, 8))
+
+
+def test_year_change_is_not_memoized():
+    # long running daemon: the same text after new year gets the new year
+    assert parse_date_range("03.03.", current_year=2025) == (datetime(2025, 3, 3), None)
+    assert parse_date_range("03.03.", current_year=2026) == (datetime(2026, 3, 3), None)
+
+
+def test_results_are_memoized():
+    _parse_date_range.cache_clear()
+    parse_date_range("03.03.2025 - 08.03.2025")
+    parse_date_range("03.03.2025 - 08.03.2025")
+    assert _parse_date_range.cache_info().hits == 1
+
+
+def test_current_year_is_looked_up_again_after_new_year(monkeypatch):
+    # cached year ended a second ago
+    monkeypatch.setattr(DateRange, "_current", [2000, time.time() - 1])
+    assert parse_date_range("03.03.") == (datetime(date.today().year, 3, 3), None)
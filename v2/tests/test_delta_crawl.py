@@ -0,0 +1,78 @@
+import json
+from datetime import date
+
+from DeltaCrawl import BrochureIndex, brochure_key, diff_snapshots, write_delta
+
+
+def brochure(shop_name, title, brochure_id=None, valid_to="03-08-2025", cache_buster=1):
+    return {
+        "title": title,
+        "thumbnail": f"https://img.example/data/{brochure_id}/0.jpg?t={cache_buster}" if brochure_id else "Not found",
+        "shop_name": shop_name,
+        "valid_from": "03-03-2025",
+        "valid_to": valid_to,
+        "parsed_time": "03-04-2025 10:00:00"
+    }
+
+
+def test_key_ignores_cache_buster_and_title():
+    assert brochure_key(brochure("Aldi", "Angebote", 1, cache_buster=1)) == brochure_key(brochure("Aldi", "Ostern", 1, cache_buster=2))
+    assert brochure_key(brochure("Aldi", "Angebote", 1)) != brochure_key(brochure("Lidl", "Angebote", 1))
+
+
+def test_key_without_thumbnail_uses_title_and_dates():
+    assert brochure_key(brochure("Aldi", "Angebote")) == "Aldi|Angebote|03-03-2025|03-08-2025"
+    assert brochure_key(brochure("Aldi", "Angebote")) != brochure_key(brochure("Aldi", "Angebote", valid_to="03-09-2025"))
+
+
+def test_diff_finds_added_removed_and_changed():
+    previous = BrochureIndex([[brochure("Aldi", "Angebote", 1), brochure("Aldi", "Ostern", 2)], [brochure("Lidl", "Grillen", 3)]])
+    current = BrochureIndex([
+        [brochure("Aldi", "Angebote", 1, cache_buster=7), brochure("Aldi", "Ostern neu", 2)],
+        [brochure("Penny", "Angebote", 4)]
+    ])
+
+    delta = diff_snapshots(previous, current)
+    assert [b["title"] for b in delta["added"]] == ["Angebote"] and delta["added"][0]["shop_name"] == "Penny"
+    assert [b["title"] for b in delta["removed"]] == ["Grillen"]
+    # new cache buster and title both count as a change of the same brochure
+    assert [(change["before"]["title"], change["after"]["title"]) for change in delta["changed"]] == [("Angebote", "Angebote"), ("Ostern", "Ostern neu")]
+
+
+def test_same_snapshot_has_empty_delta():
+    shops = [[brochure("Aldi", "Angebote", 1)]]
+    assert diff_snapshots(BrochureIndex(shops), BrochureIndex(shops)) == {"added": [], "removed": [], "changed": []}
+
+
+def test_only_shops_with_all_brochures_still_valid_are_reused():
+    index = BrochureIndex([
+        [brochure("Aldi", "Angebote", 1, valid_to="03-08-2025")],
+        [brochure("Lidl", "Grillen", 2, valid_to="03-08-2025"), brochure("Lidl", "Ostern", 3, valid_to="03-01-2025")],
+        [brochure("Penny", "Angebote", 4, valid_to="Not specified")]
+    ])
+    shops = [{"shop_name": name, "link": f"/{name.lower()}/"} for name in ("Aldi", "Lidl", "Penny", "Netto")]
+
+    to_fetch, reused = index.split_shops(shops, today=date(2025, 3, 5))
+    assert [shop["shop_name"] for shop in reused] == ["Aldi"]
+    assert [shop["shop_name"] for shop in to_fetch] == ["Lidl", "Penny", "Netto"]
+    assert index.split_shops(shops, force=True, today=date(2025, 3, 5)) == (shops, [])
+    # on its last day the brochure is still valid, a day later it isn't
+    assert index.is_still_valid("Aldi", date(2025, 3, 8)) and not index.is_still_valid("Aldi", date(2025, 3, 9))
+
+
+def test_missing_or_broken_snapshot_loads_empty(tmp_path):
+    (tmp_path / "result.json").write_text("[[", encoding="utf-8")
+    assert BrochureIndex.load(str(tmp_path / "result.json")).by_key == {}
+    assert BrochureIndex.load(str(tmp_path / "missing.json")).by_key == {}
+
+
+def test_delta_round_trip(tmp_path):
+    shops = [[brochure("Aldi", "Angebote", 1)]]
+    (tmp_path / "result.json").write_text(json.dumps(shops), encoding="utf-8")
+    previous = BrochureIndex.load(str(tmp_path / "result.json"))
+    delta = diff_snapshots(previous, BrochureIndex([]))
+
+    write_delta(delta, str(tmp_path / "delta.json"))
+    written = json.loads((tmp_path / "delta.json").read_text(encoding="utf-8"))
+    assert written["removed"] == shops[0] and written["added"] == [] and "generated" in written
+    assert not (tmp_path / "delta.json.tmp").exists()
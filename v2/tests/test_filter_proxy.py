@@ -0,0 +1,108 @@
+import ssl
+import threading
+import http.client
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from FilterProxy import FilterProxy, FilterRules, CertificateAuthority
+
+
+pytestmark = pytest.mark.skipif(not CertificateAuthority.available(), reason="openssl is needed for TLS interception")
+
+RULES = FilterRules(deny_domains=("ads.example",), deny_paths=("/ads/",), deny_content_types=("font/",))
+ASSET = b"x" * 100000
+
+
+class Upstream(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    hits = 0
+
+    def do_GET(self):
+        Upstream.hits += 1
+        content_type = "font/woff2" if self.path.endswith(".woff2") else "application/javascript"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(ASSET)))
+        self.end_headers()
+        self.wfile.write(ASSET)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def upstream(tmp_path):
+    """https server with a certificate of its own CA (stands in for the real site)"""
+    authority = CertificateAuthority(str(tmp_path / "upstream_ca"))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Upstream)
+    server.socket = authority.context("127.0.0.1").wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    Upstream.hits = 0
+    yield server.server_address[1], ssl.create_default_context(cafile=authority.ca_cert)
+    server.shutdown()
+    server.server_close()
+
+
+def through_proxy(proxy, port, client_context, paths):
+    """GETs paths over one CONNECT tunnel like the browser does, returns (status, body size) of each"""
+    host, proxy_port = proxy.address.rsplit(":", 1)
+    connection = http.client.HTTPSConnection(host, int(proxy_port), context=client_context, timeout=10)
+    connection.set_tunnel("127.0.0.1", port)
+    results = []
+    for path in paths:
+        connection.request("GET", path)
+        response = connection.getresponse()
+        results.append((response.status, len(response.read())))
+    connection.close()
+    return results
+
+
+def test_https_is_intercepted_filtered_and_cached(upstream, tmp_path):
+    port, upstream_context = upstream
+    with FilterProxy(RULES, ca_dir=str(tmp_path / "proxy_ca"), upstream_ssl_context=upstream_context) as proxy:
+        # the browser side trusts the proxy CA (Firefox accepts it through accept_insecure_certs)
+        client_context = ssl.create_default_context(cafile=proxy.authority.ca_cert)
+        results = through_proxy(proxy, port, client_context, ["/app.js", "/app.js", "/font.woff2", "/ads/banner.js"])
+        report = proxy.report()
+
+    assert results == [(200, len(ASSET)), (200, len(ASSET)), (403, 0), (403, 0)]
+    # second app.js came from the cache, /ads/ never reached the upstream
+    assert Upstream.hits == 2
+    assert report["https_intercepted"] == 1 and report["https_tunnels"] == 0
+    assert report["blocked"] == {"deny_content_type": 1, "deny_path": 1}
+    assert report["blocked_before_download"] == 1
+    assert report["cache_hits"] == 1
+    assert report["mb_saved"] == round(len(ASSET) / (1024 * 1024), 2)
+    assert "note" not in report
+
+
+def test_upstream_certificate_is_verified(upstream, tmp_path):
+    port, _ = upstream
+    # default context doesn't trust the upstream CA, the proxy must refuse instead of passing the page on
+    with FilterProxy(RULES, ca_dir=str(tmp_path / "proxy_ca")) as proxy:
+        client_context = ssl.create_default_context(cafile=proxy.authority.ca_cert)
+        [(status, _)] = through_proxy(proxy, port, client_context, ["/app.js"])
+    assert status == 502
+    assert Upstream.hits == 0
+
+
+def test_blocked_host_is_denied_before_connecting(tmp_path):
+    with FilterProxy(RULES, ca_dir=str(tmp_path / "proxy_ca")) as proxy:
+        host, proxy_port = proxy.address.rsplit(":", 1)
+        connection = http.client.HTTPConnection(host, int(proxy_port), timeout=10)
+        connection.set_tunnel("tracker.ads.example", 443)
+        with pytest.raises(OSError, match="403"):
+            connection.connect()
+        assert proxy.report()["blocked"] == {"deny_domain": 1}
+
+
+def test_without_interception_tunnels_are_reported(upstream, tmp_path):
+    port, upstream_context = upstream
+    with FilterProxy(RULES, intercept_tls=False) as proxy:
+        assert proxy.authority is None
+        # the browser talks TLS with the upstream itself
+        assert through_proxy(proxy, port, upstream_context, ["/font.woff2"]) == [(200, len(ASSET))]
+    report = proxy.report()
+    assert report["https_tunnels"] == 1 and report["blocked"] == {}
+    assert "not intercepted" in report["note"]
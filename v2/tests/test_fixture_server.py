@@ -0,0 +1,79 @@
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from FixtureServer import FixtureCorpus, FixtureServer
+from Benchmark import run_benchmarks, flatten, percentile
+from site_pages import shop_page, site
+
+
+def fetch(url):
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status, response.read().decode("utf-8")
+    except urllib.error.HTTPError as error:
+        return error.code, None
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    corpus = FixtureCorpus(str(tmp_path / "fixtures"))
+    for path, (shop_name, html) in site({"Aldi": ("/aldi/", shop_page(["Angebote"])), "Lidl": ("/lidl/", shop_page(["Grillen", "Ostern"]))}).items():
+        corpus.add(f"https://www.prospektmaschine.de{path}", html, shop_name)
+    corpus.save()
+    return corpus
+
+
+def test_corpus_round_trip(corpus):
+    reloaded = FixtureCorpus(corpus.corpus_dir)
+    assert reloaded.shop_pages() == {"Aldi": "/aldi/", "Lidl": "/lidl/"}
+    assert reloaded.read("/aldi/") == shop_page(["Angebote"])
+    assert reloaded.read("/penny/") is None
+
+
+def test_server_replays_pages_and_404s_unknown_ones(corpus):
+    with FixtureServer(corpus) as server:
+        # query string is ignored like the cache buster of the real site
+        assert fetch(f"{server.base_url}/aldi/?page=1") == (200, shop_page(["Angebote"]))
+        assert fetch(f"{server.base_url}/penny/")[0] == 404
+        assert (server.requests_served, server.errors_injected) == (2, 0)
+
+
+def test_injected_errors_and_latency(corpus):
+    with FixtureServer(corpus, latency_ms=(50, 50), error_rate=1.0, error_status=429) as server:
+        start = time.perf_counter()
+        assert fetch(f"{server.base_url}/aldi/")[0] == 429
+        assert time.perf_counter() - start >= 0.05
+        assert server.errors_injected == 1
+
+
+def test_error_injection_is_reproducible_with_a_seed(corpus):
+    def statuses():
+        with FixtureServer(corpus, error_rate=0.5, seed=3) as server:
+            return [fetch(f"{server.base_url}/aldi/")[0] for _ in range(12)]
+
+    first = statuses()
+    assert first == statuses() and {200, 503} == set(first)
+
+
+def test_benchmark_run_against_the_corpus(corpus):
+    report = run_benchmarks(corpus.corpus_dir, [0, 0], 0.0, seed=1)
+
+    assert report["get_leftside_shop_list"]["shops"] == 2
+    full_run = report["get_all_shop_data"]
+    assert (full_run["shops"], full_run["successful"], full_run["failed"], full_run["brochures"]) == (2, 2, 0, 3)
+    assert report["parse_info"]["pages"] == 2 and report["parse_date"]["samples"] == 3
+    # every number of the report can be compared against a baseline
+    assert flatten(report)["get_all_shop_data.per_shop.runs"] == 2
+
+
+def test_benchmark_without_fixtures(tmp_path):
+    with pytest.raises(SystemExit, match="No fixtures"):
+        run_benchmarks(str(tmp_path / "empty"), [0, 0], 0.0, seed=1)
+
+
+def test_percentile():
+    assert percentile([], 0.95) == 0.0
+    assert percentile(list(range(100)), 0.95) == 95 and percentile([1.0], 0.95) == 1.0
@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+from LazyLoadDetector import LazyLoadDetector, POLL_SCRIPT
+
+
+class FakeDriver:
+    """execute_async_script result of LAZY_LOAD_SCRIPT, or the error it raises"""
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.script_timeout = None
+        self.arguments = None
+
+    def set_script_timeout(self, seconds):
+        self.script_timeout = seconds
+
+    def execute_async_script(self, script, *arguments):
+        self.arguments = arguments
+        if self.error:
+            raise self.error
+        return self.result
+
+
+def growing_grid(counts):
+    """execute_script of a tab whose card count follows counts, then stays at the last one"""
+    calls = []
+
+    async def execute_script(script):
+        assert script == POLL_SCRIPT
+        calls.append(script)
+        return counts[min(len(calls) - 1, len(counts) - 1)]
+
+    return execute_script, calls
+
+
+def test_wait_passes_quiet_period_and_cap_to_the_script():
+    driver = FakeDriver({"count": 12, "elapsed_ms": 900, "reason": "quiet"})
+    detector = LazyLoadDetector(quiet_period_s=0.5, hard_cap_s=4)
+
+    assert detector.wait(driver, "Aldi") == 12
+    assert driver.arguments == (500, 4000)
+    # selenium must not abort the script before its own cap
+    assert driver.script_timeout > 4
+    assert detector.ready_times["Aldi"]["reason"] == "quiet"
+
+
+def test_failed_script_counts_as_no_cards():
+    detector = LazyLoadDetector()
+    assert detector.wait(FakeDriver(error=RuntimeError("script timeout")), "Aldi") == 0
+    assert detector.ready_times["Aldi"]["reason"] == "error"
+
+
+def test_poll_resolves_when_count_stops_changing():
+    execute_script, calls = growing_grid([0, 4, 8, 8, 8, 8, 8])
+    detector = LazyLoadDetector(quiet_period_s=0.03, hard_cap_s=2)
+
+    assert asyncio.run(detector.poll(execute_script, "Aldi", interval_s=0.01)) == 8
+    assert detector.ready_times["Aldi"]["reason"] == "quiet"
+    assert len(calls) < 50
+
+
+def test_poll_keeps_waiting_for_first_cards_until_cap():
+    execute_script, _ = growing_grid([0])
+    detector = LazyLoadDetector(quiet_period_s=0.01, hard_cap_s=0.1)
+
+    assert asyncio.run(detector.poll(execute_script, "Aldi", interval_s=0.01)) == 0
+    assert detector.ready_times["Aldi"]["reason"] == "cap"
+
+
+def test_poll_error_keeps_last_count():
+    async def execute_script(script):
+        raise ConnectionError("tab closed")
+
+    detector = LazyLoadDetector()
+    assert asyncio.run(detector.poll(execute_script, "Aldi")) == 0
+    assert detector.ready_times["Aldi"]["reason"] == "error"
+
+
+def test_summary_and_dump(tmp_path):
+    detector = LazyLoadDetector(quiet_period_s=0.5, hard_cap_s=4)
+    assert detector.summary() == "no browser pages"
+
+    for i, reason in enumerate(["quiet", "quiet", "cap"]):
+        detector.record(f"shop-{i}", 10, i + 1.0, reason)
+    assert detector.summary() == "time-to-ready p50: 2.00s, p95: 3.00s, max: 3.00s, capped: 1/3"
+
+    detector.dump(str(tmp_path / "lazy.json"))
+    dumped = json.loads((tmp_path / "lazy.json").read_text(encoding="utf-8"))
+    assert dumped["hard_cap_s"] == 4 and dumped["shops"]["shop-2"]["reason"] == "cap"
@@ -0,0 +1,101 @@
+import gzip
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import main
+from BrochureStore import BrochureStore
+from FixtureServer import FixtureCorpus
+from site_pages import shop_page
+
+
+V2_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def pages_dir(tmp_path):
+    pages = tmp_path / "pages"
+    pages.mkdir()
+    (pages / "Aldi.html").write_text(shop_page(["Angebote", "Ostern"]), encoding="utf-8")
+    with gzip.open(pages / "Lidl.html.gz", "wt", encoding="utf-8") as file:
+        file.write(shop_page(["Grillen"], first_id=2000))
+    (pages / "Rewe.html").write_text("<html><body>Wartungsarbeiten</body></html>", encoding="utf-8")
+    (pages / "notes.txt").write_text("not a page", encoding="utf-8")
+    return pages
+
+
+def cli_json(capsys, *argv):
+    main.cli(list(argv))
+    return json.loads(capsys.readouterr().out)
+
+
+def test_parse_from_disk(pages_dir, tmp_path, capsys):
+    output = str(tmp_path / "result.json")
+    summary = cli_json(capsys, "parse-from-disk", str(pages_dir), "--output", output, "--mode", "inline")
+
+    assert (summary["pages"], summary["shops"], summary["failed"]) == (3, 2, ["Rewe"])
+    with open(output, encoding="utf-8") as file:
+        shops = json.load(file)
+    assert sorted(brochure["title"] for shop in shops for brochure in shop) == ["Angebote", "Grillen", "Ostern"]
+
+
+def test_parse_from_disk_reads_a_fixture_corpus(tmp_path, capsys):
+    corpus = FixtureCorpus(str(tmp_path / "fixtures"))
+    corpus.add("/hypermarkte/", "<html></html>")
+    corpus.add("/aldi/", shop_page(["Angebote"]), "Aldi")
+    corpus.save()
+
+    summary = cli_json(capsys, "parse-from-disk", corpus.corpus_dir, "--output", str(tmp_path / "result.json"), "--mode", "thread")
+    assert (summary["pages"], summary["shops"]) == (1, 1)
+
+
+def test_parse_from_disk_without_pages(tmp_path):
+    with pytest.raises(SystemExit, match="No saved pages"):
+        main.cli(["parse-from-disk", str(tmp_path)])
+
+
+def test_export_and_stats_of_both_formats(pages_dir, tmp_path, capsys):
+    result = str(tmp_path / "result.json")
+    columnar = str(tmp_path / "result.brch")
+    main.cli(["parse-from-disk", str(pages_dir), "--output", result, "--mode", "inline"])
+    capsys.readouterr()
+
+    main.cli(["export", "--input", result, "--columnar", columnar, "--sqlite", str(tmp_path / "brochures.db")])
+    with BrochureStore(str(tmp_path / "brochures.db")) as store:
+        assert store.shops() == {"Aldi": 2, "Lidl": 1}
+
+    from_json = cli_json(capsys, "stats", "--input", result)
+    from_columnar = cli_json(capsys, "stats", "--input", columnar)
+    assert (from_json["shops"], from_json["brochures"], from_json["top_shops"]) == (2, 3, {"Aldi": 2, "Lidl": 1})
+    assert {**from_columnar, "input": result} == from_json
+
+
+def test_export_needs_an_output(capsys):
+    with pytest.raises(SystemExit):
+        main.cli(["export"])
+    assert "export needs --columnar and/or --sqlite" in capsys.readouterr().err
+
+
+def test_flags_without_subcommand_are_a_crawl(capsys):
+    with pytest.raises(SystemExit):
+        main.cli(["--workers", "2", "--incremental"])
+    assert "supported only with a single worker" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize("command, heavy", [
+    ("stats", ("selenium", "webdriver_manager", "requests", "bs4", "asyncio")),
+    ("parse-from-disk", ("selenium", "webdriver_manager", "requests")),
+])
+def test_browser_free_commands_dont_import_the_crawler(pages_dir, tmp_path, command, heavy):
+    result = str(tmp_path / "result.json")
+    (tmp_path / "result.json").write_text("[]", encoding="utf-8")
+    argv = ["stats", "--input", result] if command == "stats" else ["parse-from-disk", str(pages_dir), "--output", result, "--mode", "inline"]
+    # a fresh interpreter, pytest itself has imported everything already
+    script = f"import sys, main\nmain.cli({argv!r})\nprint(sorted(name for name in {heavy!r} if name in sys.modules), file=sys.stderr)"
+
+    completed = subprocess.run([sys.executable, "-c", script], cwd=V2_DIR, capture_output=True, text=True, timeout=60)
+    assert completed.returncode == 0, completed.stderr
+    assert completed.stderr.strip().splitlines()[-1] == "[]"
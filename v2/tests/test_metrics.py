@@ -0,0 +1,57 @@
+import json
+
+from Metrics import Histogram, Metrics
+
+
+def test_histogram_buckets_and_totals():
+    histogram = Histogram(buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value)
+
+    # le buckets: 0.1 holds 0.05 and 0.1, +Inf holds 3
+    assert histogram.counts == [2, 1, 1]
+    snapshot = histogram.snapshot()
+    assert (snapshot["count"], snapshot["sum_s"], snapshot["max_s"]) == (4, 3.65, 3)
+
+
+def test_percentiles_follow_recent_values():
+    histogram = Histogram(keep_samples=100)
+    for _ in range(1000):
+        histogram.observe(0.01)
+    # a long running daemon gets slower, the percentiles must show it
+    for _ in range(100):
+        histogram.observe(5.0)
+
+    snapshot = histogram.snapshot()
+    assert snapshot["p50_s"] == 5.0 and snapshot["p95_s"] == 5.0
+    assert snapshot["count"] == 1100 and len(histogram.samples) == 100
+    # max is over all values, not only the kept ones
+    histogram.observe(0.01)
+    assert histogram.snapshot()["max_s"] == 5.0
+
+
+def test_empty_histogram():
+    assert Histogram().snapshot() == {"count": 0, "sum_s": 0.0, "avg_s": 0.0, "p50_s": 0.0, "p95_s": 0.0, "max_s": 0.0}
+
+
+def test_metrics_snapshot_and_prometheus():
+    metrics = Metrics()
+    metrics.observe("parse", 0.2, "Aldi")
+    metrics.observe("parse", 0.3, "Aldi")
+    with metrics.timer("write"):
+        pass
+    metrics.inc("tier_http")
+    metrics.inc("tier_http", 2)
+    metrics.gauge("pool_size", lambda: 3)
+    metrics.gauge("broken", lambda: 1 / 0)
+
+    snapshot = json.loads(json.dumps(metrics.snapshot()))
+    assert snapshot["stages"]["parse"]["count"] == 2
+    assert snapshot["shops"] == {"Aldi": {"parse": 0.5}}
+    assert snapshot["counters"] == {"tier_http": 3}
+    # a gauge that can't be read is left out instead of breaking the export
+    assert snapshot["gauges"] == {"pool_size": 3}
+
+    exported = metrics.to_prometheus()
+    assert 'crawler_stage_seconds_bucket{stage="parse",le="+Inf"} 2' in exported
+    assert "tier_http" in exported
@@ -0,0 +1,119 @@
+import os
+import time
+
+import pytest
+
+from PageCache import PageCache
+
+
+URL = "https://shop.example/aldi/"
+
+
+def page(seed, size=20000):
+    # random hex gzips to roughly half of the page size
+    return os.urandom(size // 2).hex() if seed is None else f"<html>{seed}</html>"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PageCache(str(tmp_path / "cache"))
+
+
+def objects(cache):
+    return sorted(os.listdir(cache.objects_dir))
+
+
+def test_fresh_browser_page_is_served(cache):
+    cache.store(URL, page("aldi"), "browser")
+    assert cache.get_fresh(URL) == page("aldi")
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_stale_or_http_pages_are_not_fresh(cache):
+    cache.store(URL, page("aldi"), "http", etag='"v1"')
+    assert cache.get_fresh(URL) is None
+
+    cache.store(URL, page("aldi"), "browser")
+    cache.browser_ttl_s = 0
+    time.sleep(0.01)
+    assert cache.get_fresh(URL) is None
+    # both lookups were of the same url in the same run
+    assert cache.misses == 1
+
+
+def test_conditional_headers_and_304(cache):
+    assert cache.conditional_headers(URL) == {}
+    cache.store(URL, page("aldi"), "http", etag='"v1"', last_modified="Mon, 03 Mar 2025 10:00:00 GMT")
+
+    assert cache.conditional_headers(URL) == {"If-None-Match": '"v1"', "If-Modified-Since": "Mon, 03 Mar 2025 10:00:00 GMT"}
+    assert cache.revalidated(URL) == page("aldi")
+    assert (cache.misses, cache.revalidations) == (0, 1)
+
+
+def test_second_304_of_a_retried_shop_is_not_subtracted_twice(cache):
+    cache.store(URL, page("aldi"), "http", etag='"v1"')
+    for _ in range(2):
+        cache.conditional_headers(URL)
+        assert cache.revalidated(URL) == page("aldi")
+    assert (cache.misses, cache.revalidations) == (0, 2)
+
+    # 304 without a preceding lookup (no miss counted) must not go below zero
+    assert cache.revalidated(URL) == page("aldi")
+    assert cache.misses == 0
+
+
+def test_misses_are_counted_again_in_the_next_run(cache):
+    cache.get_fresh(URL)
+    cache.get_fresh(URL)
+    cache.start_run()
+    cache.get_fresh(URL)
+    assert cache.misses == 2
+
+
+def test_same_body_is_stored_once_and_removed_with_its_last_url(cache):
+    cache.store(URL, page("same"), "browser")
+    cache.store("https://shop.example/lidl/", page("same"), "browser")
+    assert len(objects(cache)) == 1
+
+    cache.store(URL, page("other"), "browser")
+    assert len(objects(cache)) == 2
+    cache.store("https://shop.example/lidl/", page("other"), "browser")
+    assert len(objects(cache)) == 1
+
+
+def test_least_recently_used_urls_are_evicted(tmp_path):
+    cache = PageCache(str(tmp_path / "cache"), max_bytes=25000)
+    cache.store("https://shop.example/a/", page(None), "browser")
+    cache.store("https://shop.example/b/", page(None), "browser")
+    # a was used last, so b goes when c doesn't fit
+    assert cache.get_fresh("https://shop.example/a/")
+    cache.store("https://shop.example/c/", page(None), "browser")
+
+    # two ~11kB objects fit into max_bytes, the third one doesn't
+    assert cache.get_fresh("https://shop.example/b/") is None
+    assert cache.get_fresh("https://shop.example/a/")
+    assert cache.get_fresh("https://shop.example/c/")
+    assert len(objects(cache)) == 2
+
+
+def test_index_survives_restart(tmp_path):
+    cache = PageCache(str(tmp_path / "cache"))
+    cache.store(URL, page("aldi"), "browser")
+    cache.save()
+
+    reopened = PageCache(str(tmp_path / "cache"))
+    assert reopened.get_fresh(URL) == page("aldi")
+
+
+def test_corrupted_index_starts_empty(tmp_path):
+    cache = PageCache(str(tmp_path / "cache"))
+    with open(cache.index_file, "w", encoding="utf-8") as file:
+        file.write("{not json")
+    assert PageCache(str(tmp_path / "cache")).get_fresh(URL) is None
+
+
+def test_missing_object_is_a_miss(cache):
+    cache.store(URL, page("aldi"), "browser")
+    os.remove(os.path.join(cache.objects_dir, objects(cache)[0]))
+    assert cache.get_fresh(URL) is None
+    assert cache.revalidated(URL) is None
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from ParserV2 import Parser
+from BrochureParsing import parse_brochures, backends_agree, IncompleteGridError
+from site_pages import shop_page
+
+
+HTML = shop_page(["Angebote", "Ostern", None])
+
+
+def without_time(brochures):
+    return [{key: value for key, value in brochure.items() if key != "parsed_time"} for brochure in brochures]
+
+
+def parse(parse_mode, html=HTML, **options):
+    parser = Parser(parse_mode=parse_mode, parse_workers=1, **options)
+    try:
+        return asyncio.run(parser.parse_info(html, "Aldi", require_complete=True))
+    finally:
+        parser.close()
+
+
+@pytest.mark.parametrize("parse_mode", ["thread", "process"])
+def test_executor_parses_like_inline(parse_mode):
+    assert without_time(parse(parse_mode)) == without_time(parse("inline"))
+
+
+@pytest.mark.parametrize("parse_mode", ["inline", "thread", "process"])
+def test_parse_errors_come_back_from_the_executor(parse_mode):
+    with pytest.raises(IncompleteGridError):
+        parse(parse_mode, shop_page(["Angebote"], grid_attributes='data-total="3"'))
+
+
+def test_unknown_parse_mode():
+    with pytest.raises(ValueError, match="Unknown parse mode"):
+        Parser(parse_mode="fork")
+
+
+def test_grid_only_parses_like_the_whole_page():
+    assert backends_agree(HTML, "Aldi", "html.parser", grid_only=True)
+    assert parse_brochures(HTML, "Aldi", grid_only=True)[2]["title"] == "Not found"
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError, match="Unknown parser backend"):
+        parse_brochures(HTML, "Aldi", backend="regex")
+
+
+@pytest.mark.parametrize("backend, module", [("lxml", "lxml"), ("html5lib", "html5lib"), ("selectolax", "selectolax")])
+@pytest.mark.parametrize("grid_only", [False, True])
+def test_optional_backends_agree_with_html_parser(backend, module, grid_only):
+    pytest.importorskip(module)
+    assert backends_agree(HTML, "Aldi", backend, grid_only)
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from RateLimiter import HostLimiter, RateLimiter
+
+
+def limiter(**options):
+    defaults = {"rate_per_min": 60, "min_rate_per_min": 6, "max_rate_per_min": 120, "burst": 2,
+                "increase_per_min": 1, "decrease_factor": 0.5, "latency_alpha": 0.5}
+    return HostLimiter(**{**defaults, **options})
+
+
+def test_burst_then_wait_for_refill():
+    host = limiter(rate_per_min=60, burst=2)
+    assert host.try_take() == 0 and host.try_take() == 0
+    # one token per second at 60 pages/min
+    assert host.try_take() == pytest.approx(1.0, abs=0.05)
+
+
+def test_aimd_adds_on_success_and_halves_on_throttle():
+    host = limiter(rate_per_min=60)
+    host.on_success(0.2)
+    host.on_success(0.4)
+    assert host.rate_per_min == 62
+    assert host.avg_latency_s == pytest.approx(0.3)
+
+    host.on_throttle()
+    assert host.rate_per_min == 31 and host.throttles == 1
+    # saved up burst is dropped, the next request has to wait
+    assert host.try_take() > 0
+
+
+def test_rate_stays_between_min_and_max():
+    host = limiter(rate_per_min=10, min_rate_per_min=6, max_rate_per_min=11)
+    for _ in range(5):
+        host.on_throttle()
+    assert host.rate_per_min == 6
+    for _ in range(10):
+        host.on_success(0.1)
+    assert host.rate_per_min == 11
+
+
+def test_record_classifies_responses_per_host():
+    rate_limiter = RateLimiter(rate_per_min=60)
+    rate_limiter.record("https://a.example/x", 0.1, 200)
+    rate_limiter.record("https://a.example/y", 0.1, 429)
+    rate_limiter.record("https://a.example/z", 5.0, timeout=True)
+    rate_limiter.record("https://b.example/x", 0.1, 503)
+    rate_limiter.record("https://b.example/x", 0.1, 404)
+
+    assert rate_limiter.hosts["a.example"].throttles == 2
+    assert rate_limiter.hosts["b.example"].throttles == 1
+    assert rate_limiter.error_count == 3
+    assert "a.example" in rate_limiter.summary()
+
+
+def test_acquire_and_wait_pace_the_same_bucket():
+    rate_limiter = RateLimiter(rate_per_min=600, burst=1)
+    url = "https://a.example/"
+
+    start = time.perf_counter()
+    asyncio.run(rate_limiter.acquire(url))
+    rate_limiter.wait(url)
+    asyncio.run(rate_limiter.acquire(url))
+    # burst of 1 and 10 pages/s: three requests take at least 0.2s
+    assert time.perf_counter() - start >= 0.18
+
+
+def test_first_requests_from_many_threads_share_one_bucket():
+    rate_limiter = RateLimiter()
+    barrier = threading.Barrier(16)
+    seen = []
+
+    def first_request():
+        barrier.wait()
+        seen.append(rate_limiter.host("https://a.example/page"))
+
+    threads = [threading.Thread(target=first_request) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({id(host) for host in seen}) == 1
+    assert list(rate_limiter.hosts) == ["a.example"]
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from ParserV2 import Parser
+from RetryScheduler import ShopFetchError, HTTP_ERROR
+from site_pages import shop_page, site
+
+
+SHOPS = {
+    "Aldi": ("/aldi/", shop_page(["Angebote", "Ostern"])),
+    # first chunk only, the rest comes with the intersection observer
+    "Lidl": ("/lidl/", shop_page(["Angebote", "Ostern"], '<div class="intersect-lazy-load"></div>')),
+    "Penny": ("/penny/", shop_page(["Angebote"], grid_attributes='data-total="12"')),
+    "Netto": ("/netto/", shop_page([])),
+    "Rewe": ("/rewe/", "<html><body><div class='page-body'>Wartungsarbeiten</div></body></html>"),
+}
+
+
+@pytest.fixture
+def base_url(fixture_site):
+    return fixture_site(site(SHOPS)).base_url
+
+
+def shop_request(parser, shop_name):
+    url = f"{parser.site_url}{SHOPS[shop_name][0]}"
+    return asyncio.run(parser.requester.send_shop_request(shop_name, url, parser.parse_info, raise_errors=True))
+
+
+@pytest.fixture
+def static_parser(base_url):
+    parser = Parser(site_url=base_url, use_browser=False, base_delay=0.01, parse_mode="inline")
+    yield parser
+    parser.close()
+
+
+def test_complete_static_grid_is_served_by_http_tier(static_parser):
+    brochures, _ = shop_request(static_parser, "Aldi")
+    assert [b["title"] for b in brochures] == ["Angebote", "Ostern"]
+    assert static_parser.requester.tier_counts["http"] == 1
+
+
+@pytest.mark.parametrize("shop_name", ["Lidl", "Penny"])
+def test_truncated_static_grid_is_not_accepted(static_parser, shop_name):
+    # without browser the partial grid is an error, not a silently short shop
+    with pytest.raises(ShopFetchError) as error:
+        shop_request(static_parser, shop_name)
+    assert error.value.error_class == HTTP_ERROR
+    assert static_parser.requester.metrics.counters["http_tier_incomplete"] == 1
+
+
+def test_empty_grid_without_browser_is_a_valid_answer(static_parser):
+    assert shop_request(static_parser, "Netto") == ([], "Netto")
+    assert static_parser.requester.failed_requests == 0
+
+
+def test_page_without_grid_is_not_usable(static_parser):
+    with pytest.raises(ShopFetchError) as error:
+        shop_request(static_parser, "Rewe")
+    assert error.value.error_class == HTTP_ERROR
+
+
+@pytest.mark.parametrize("shop_name, expected", [("Aldi", 2), ("Lidl", None), ("Penny", None), ("Netto", None)])
+def test_browser_checks_truncated_and_empty_static_grids(base_url, shop_name, expected):
+    # Firefox is not started before __aenter__, parse_shop_page alone decides about the fallback
+    parser = Parser(site_url=base_url, base_delay=0.01, parse_mode="inline")
+    try:
+        html = parser.requester.send_request(f"{base_url}{SHOPS[shop_name][0]}")
+        brochures = asyncio.run(parser.requester.parse_shop_page(shop_name, "", html, "http", parser.parse_info))
+        assert (len(brochures) if brochures is not None else None) == expected
+    finally:
+        parser.close()
+
+
+def test_empty_shop_is_done_without_retries(base_url, tmp_path):
+    from CrawlJournal import CrawlJournal
+    from RetryScheduler import RetryScheduler
+
+    journal = CrawlJournal(str(tmp_path / "journal.json"))
+    retry = RetryScheduler(base_delay_s=0)
+    shops = [{"shop_name": name, "link": f"{base_url}{path}"} for name, (path, _) in SHOPS.items() if name in ("Aldi", "Netto")]
+
+    async def crawl():
+        async with Parser(site_url=base_url, use_browser=False, base_delay=0.01, parse_mode="inline") as parser:
+            return await parser.get_all_shop_data(shops, journal=journal, retry=retry)
+
+    assert [[b["title"] for b in brochures] for brochures in asyncio.run(crawl())] == [["Angebote", "Ostern"]]
+    assert journal.is_done(shops[1]["link"]) and journal.brochures(shops[1]["link"]) == []
+    assert (retry.retries, retry.given_up) == (0, 0)
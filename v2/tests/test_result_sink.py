@@ -0,0 +1,63 @@
+import json
+
+from ResultSink import NDJSONSink, read_ndjson, compact_ndjson
+
+
+def brochures(shop_name, *titles):
+    return [{"title": title, "shop_name": shop_name, "valid_from": "03-03-2025"} for title in titles]
+
+
+def test_finalize_writes_result_json_shape(tmp_path):
+    path = str(tmp_path / "result.ndjson")
+    with NDJSONSink(path, fsync_every=1) as sink:
+        sink.append("Aldi", brochures("Aldi", "Angebote", "Ostern"))
+        sink.append("Netto", [])
+        sink.append("Lidl", brochures("Lidl", "Grillen"))
+        written = sink.finalize(str(tmp_path / "result.json"))
+
+    text = (tmp_path / "result.json").read_text(encoding="utf-8")
+    # shops without brochures are left out, the file matches json.dump(..., indent=4)
+    assert written == 2
+    assert text == json.dumps([brochures("Aldi", "Angebote", "Ostern"), brochures("Lidl", "Grillen")], indent=4)
+    assert not (tmp_path / "result.ndjson").exists()
+
+
+def test_nothing_to_compact_gives_empty_list(tmp_path):
+    assert compact_ndjson([str(tmp_path / "missing.ndjson")], str(tmp_path / "result.json")) == 0
+    assert json.loads((tmp_path / "result.json").read_text(encoding="utf-8")) == []
+
+
+def test_line_cut_by_a_crash_is_skipped(tmp_path):
+    path = tmp_path / "result.ndjson"
+    with NDJSONSink(str(path)) as sink:
+        sink.append("Aldi", brochures("Aldi", "Angebote"))
+    with open(path, "a", encoding="utf-8") as file:
+        file.write('{"shop_name": "Lidl", "brochures": [{"title": "Gri')
+
+    assert [record["shop_name"] for record in read_ndjson(str(path))] == ["Aldi"]
+    assert compact_ndjson([str(path)], str(tmp_path / "result.json"), remove=False) == 1
+    assert path.exists()
+
+
+def test_resumed_sink_appends_after_previous_run(tmp_path):
+    path = str(tmp_path / "result.ndjson")
+    with NDJSONSink(path) as sink:
+        sink.append("Aldi", brochures("Aldi", "Angebote"))
+    with NDJSONSink(path, fresh=False) as sink:
+        sink.append("Lidl", brochures("Lidl", "Grillen"))
+    with NDJSONSink(str(tmp_path / "other.ndjson")) as sink:
+        sink.append("Penny", brochures("Penny", "Ostern"))
+
+    compact_ndjson([path, str(tmp_path / "other.ndjson")], str(tmp_path / "result.json"))
+    shops = json.loads((tmp_path / "result.json").read_text(encoding="utf-8"))
+    assert [shop[0]["shop_name"] for shop in shops] == ["Aldi", "Lidl", "Penny"]
+
+
+def test_non_ascii_titles(tmp_path):
+    path = str(tmp_path / "result.ndjson")
+    with NDJSONSink(path) as sink:
+        sink.append("Müller", brochures("Müller", "Frühling"))
+        sink.finalize(str(tmp_path / "result.json"), ensure_ascii=False)
+    assert "Frühling" in (tmp_path / "result.json").read_text(encoding="utf-8")
+    # closing twice (finalize + context manager) is harmless
+    sink.close()
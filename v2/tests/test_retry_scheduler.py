@@ -0,0 +1,106 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from BrochureParsing import NoGridError, IncompleteGridError
+from RetryScheduler import (
+    RetryScheduler, DeadLetterQueue, ShopFetchError, classify_error,
+    TIMEOUT, DRIVER_CRASH, EMPTY_GRID, HTTP_ERROR, NO_PAGE_BODY, OTHER
+)
+
+
+ALDI = {"shop_name": "Aldi", "link": "https://www.prospektmaschine.de/aldi/"}
+LIDL = {"shop_name": "Lidl", "link": "https://www.prospektmaschine.de/lidl/"}
+
+
+class ReadTimeout(Exception):
+    pass
+
+
+def test_classify_error():
+    from selenium.common.exceptions import WebDriverException
+
+    assert classify_error(ShopFetchError(NO_PAGE_BODY, "no body")) == NO_PAGE_BODY
+    assert classify_error(IncompleteGridError("only 2 of 12 cards")) == EMPTY_GRID
+    assert classify_error(asyncio.TimeoutError()) == TIMEOUT
+    # requests/selenium timeouts are recognized by name
+    assert classify_error(ReadTimeout()) == TIMEOUT
+    assert classify_error(WebDriverException("browser is gone")) == DRIVER_CRASH
+    assert classify_error(ConnectionRefusedError()) == DRIVER_CRASH
+    assert classify_error(KeyError("title")) == OTHER
+    assert classify_error(NoGridError()) == EMPTY_GRID
+
+
+def test_every_error_class_has_its_own_budget():
+    retry = RetryScheduler(budgets={HTTP_ERROR: 2}, base_delay_s=0, seed=1)
+
+    assert retry.schedule(ALDI, ShopFetchError(HTTP_ERROR, "503")) is not None
+    assert retry.schedule(ALDI, ShopFetchError(HTTP_ERROR, "503")) is not None
+    # a timeout still has its whole budget after the http errors
+    assert retry.schedule(ALDI, ShopFetchError(TIMEOUT, "read timeout")) is not None
+    assert retry.schedule(ALDI, ShopFetchError(HTTP_ERROR, "503")) is None
+    # budgets are per shop
+    assert retry.schedule(LIDL, ShopFetchError(HTTP_ERROR, "503")) is not None
+
+    assert (retry.retries, retry.given_up) == (4, 1)
+    assert retry.summary() == "4 retries {'http_error': 3, 'timeout': 1}, 1 shops given up"
+
+
+def test_backoff_grows_with_attempts_and_is_capped():
+    retry = RetryScheduler(base_delay_s=1, max_delay_s=5, seed=1)
+    for attempt in range(10):
+        assert 0 <= retry.backoff_s(attempt) <= min(5, 2 ** attempt)
+
+    now = time.monotonic()
+    assert now <= retry.schedule(ALDI, ShopFetchError(TIMEOUT, "timeout")) <= now + 2 + 0.1
+
+
+def test_same_seed_same_delays():
+    delays = [RetryScheduler(seed=7).backoff_s(attempt) for attempt in range(5)]
+    assert delays == [RetryScheduler(seed=7).backoff_s(attempt) for attempt in range(5)]
+
+
+def test_unknown_error_class_is_not_retried():
+    assert RetryScheduler().schedule(ALDI, ShopFetchError("banned", "403")) is None
+
+
+def test_given_up_shops_go_to_the_dead_letter_queue(tmp_path):
+    path = str(tmp_path / "dead_letter.json")
+    dead_letter = DeadLetterQueue(path)
+    retry = RetryScheduler(budgets={EMPTY_GRID: 1}, base_delay_s=0, dead_letter=dead_letter)
+
+    retry.schedule(ALDI, ShopFetchError(EMPTY_GRID, "no grid"))
+    assert not dead_letter.entries
+    assert retry.schedule(ALDI, ShopFetchError(EMPTY_GRID, "still no grid")) is None
+
+    entry = dead_letter.entries[ALDI["link"]]
+    assert (entry["error_class"], entry["attempts"], entry["error"]) == (EMPTY_GRID, 2, "still no grid")
+
+    dead_letter.save()
+    with open(path, encoding="utf-8") as file:
+        assert json.load(file)[0]["shop_name"] == "Aldi"
+    assert DeadLetterQueue.load_shops(path) == [ALDI]
+
+
+def test_replayed_dead_letter_is_overwritten(tmp_path):
+    path = str(tmp_path / "dead_letter.json")
+    first = DeadLetterQueue(path)
+    first.add(ALDI, TIMEOUT, 4, "timeout")
+    first.add(LIDL, TIMEOUT, 4, "timeout")
+    first.save()
+
+    # Aldi succeeded on replay, only Lidl is left in the file
+    replay = DeadLetterQueue(path)
+    replay.add(LIDL, HTTP_ERROR, 3, "503")
+    replay.save()
+    assert DeadLetterQueue.load_shops(path) == [LIDL]
+
+
+@pytest.mark.parametrize("content", [None, "[]"])
+def test_nothing_to_replay(tmp_path, content):
+    path = tmp_path / "dead_letter.json"
+    if content is not None:
+        path.write_text(content, encoding="utf-8")
+    assert DeadLetterQueue.load_shops(str(path)) == []
@@ -0,0 +1,70 @@
+import json
+import zlib
+
+import pytest
+
+from ShardedCrawl import partition_shops, run_sharded
+from site_pages import shop_page, site
+
+
+SHOP_DATA = [{"shop_name": f"Shop {i}", "link": f"https://www.prospektmaschine.de/shop-{i}/"} for i in range(40)]
+
+
+def test_partition_keeps_every_shop_once():
+    shards = partition_shops(SHOP_DATA, 4)
+    assert len(shards) == 4
+    assert sorted(shop["link"] for shard in shards for shop in shard) == sorted(shop["link"] for shop in SHOP_DATA)
+
+
+def test_partition_is_stable_between_runs_and_orders():
+    # resume and the per worker page cache depend on a shop landing in the same worker every time
+    shards = partition_shops(SHOP_DATA, 4)
+    again = partition_shops(list(reversed(SHOP_DATA)), 4)
+    assert [sorted(shop["link"] for shop in shard) for shard in shards] == [sorted(shop["link"] for shop in shard) for shard in again]
+    for worker_id, shard in enumerate(shards):
+        assert all(zlib.crc32(shop["link"].encode("utf-8")) % 4 == worker_id for shop in shard)
+
+
+def test_partition_with_more_workers_than_shops_leaves_empty_shards():
+    shards = partition_shops(SHOP_DATA[:2], 8)
+    assert len(shards) == 8 and sum(map(len, shards)) == 2
+
+
+SHOPS = {f"Shop {i}": (f"/shop-{i}/", shop_page([f"Prospekt {i}"], first_id=1000 + i * 10)) for i in range(6)}
+SHOPS["Empty"] = ("/empty/", shop_page([]))
+SHOPS["Broken"] = ("/broken/", "<html><body>Wartungsarbeiten</body></html>")
+
+
+@pytest.fixture
+def crawl(fixture_site, tmp_path, monkeypatch):
+    # workers write their part files, journals and dead letters into the working directory
+    monkeypatch.chdir(tmp_path)
+    base_url = fixture_site(site(SHOPS)).base_url
+    parser_options = {"site_url": base_url, "use_browser": False, "base_delay": 0.01, "parse_mode": "inline"}
+
+    def run(**options):
+        return run_sharded(3, "result.json", parser_options, cache_dir=None, dead_letter_json="dead_letter.json", **options)
+    return run
+
+
+def test_sharded_crawl_merges_worker_results(crawl, tmp_path):
+    merged = crawl(metrics_json="metrics.json")
+
+    with open(tmp_path / "result.json", encoding="utf-8") as file:
+        shops = json.load(file)
+    titles = sorted(brochure["title"] for shop in shops for brochure in shop)
+    assert merged == 6 and titles == sorted(f"Prospekt {i}" for i in range(6))
+    # part files are removed once merged
+    assert not list(tmp_path.glob("result.worker-*.ndjson"))
+
+    with open(tmp_path / "metrics.json", encoding="utf-8") as file:
+        assert set(json.load(file)) <= {f"worker-{i}" for i in range(3)}
+
+
+def test_given_up_shops_of_all_workers_are_merged_into_one_dead_letter(crawl, tmp_path):
+    crawl()
+
+    with open(tmp_path / "dead_letter.json", encoding="utf-8") as file:
+        dead_letter = json.load(file)
+    assert [entry["shop_name"] for entry in dead_letter] == ["Broken"]
+    assert not list(tmp_path.glob("dead_letter.worker-*.json"))
@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import os
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from ThumbnailStore import ThumbnailStore, ThumbnailDownloader
+
+
+IMAGES = {"/a.jpg": b"\xff\xd8jpeg a", "/copy-of-a.jpg": b"\xff\xd8jpeg a", "/b.png": b"\x89PNG b"}
+
+
+def etag(data):
+    return f'"{hashlib.md5(data).hexdigest()}"'
+
+
+class ImageServer:
+    """Serves IMAGES with etags and answers If-None-Match with 304, records every request"""
+    def __init__(self):
+        self.requests = []
+        self.images = dict(IMAGES)
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                data = server.images.get(self.path)
+                server.requests.append((self.path, self.headers.get("If-None-Match")))
+                if data is None:
+                    self.send_error(404)
+                    return
+                if self.headers.get("If-None-Match") == etag(data):
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png" if self.path.endswith(".png") else "image/jpeg")
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("ETag", etag(data))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def images():
+    server = ImageServer()
+    yield server
+    server.close()
+
+
+def brochures(*paths):
+    return [{"title": f"Prospekt {i}", "shop_name": "Aldi", "thumbnail": path} for i, path in enumerate(paths)]
+
+
+def annotate(downloader, *shops):
+    async def run():
+        return await asyncio.gather(*(downloader.annotate(shop, "Aldi") for shop in shops))
+    return asyncio.run(run())
+
+
+def test_same_image_is_downloaded_once_and_stored_once(tmp_path, images):
+    store = ThumbnailStore(str(tmp_path / "thumbnails"))
+    downloader = ThumbnailDownloader(store, images.base_url)
+
+    first, second = annotate(downloader, brochures("/a.jpg", "/b.png"), brochures("/a.jpg", "/copy-of-a.jpg"))
+    downloader.close()
+
+    # /a.jpg of both shops is one request, its copy under another url is one stored object
+    assert sorted(path for path, _ in images.requests) == ["/a.jpg", "/b.png", "/copy-of-a.jpg"]
+    assert first[0]["thumbnail_hash"] == second[1]["thumbnail_hash"] == second[0]["thumbnail_hash"]
+    assert first[1]["thumbnail_path"].endswith(".png") and os.path.exists(first[1]["thumbnail_path"])
+    assert (downloader.stats["downloaded"], downloader.stats["deduplicated"]) == (2, 1)
+
+
+def test_known_images_are_reused_or_revalidated(tmp_path, images):
+    store_dir = str(tmp_path / "thumbnails")
+    downloader = ThumbnailDownloader(ThumbnailStore(store_dir), images.base_url)
+    annotate(downloader, brochures("/a.jpg"))
+    downloader.close()
+
+    # the index is saved, a new run knows the image
+    fresh = ThumbnailDownloader(ThumbnailStore(store_dir), images.base_url)
+    annotate(fresh, brochures("/a.jpg"))
+    assert fresh.stats["reused"] == 1 and len(images.requests) == 1
+
+    stale = ThumbnailDownloader(ThumbnailStore(store_dir), images.base_url, revalidate_after_s=0)
+    annotated = annotate(stale, brochures("/a.jpg"))[0]
+    assert images.requests[-1] == ("/a.jpg", etag(IMAGES["/a.jpg"]))
+    assert stale.stats["revalidated"] == 1 and stale.stats["bytes"] == 0
+    assert annotated[0]["thumbnail_hash"]
+
+
+def test_changed_image_is_downloaded_again(tmp_path, images):
+    downloader = ThumbnailDownloader(ThumbnailStore(str(tmp_path / "thumbnails")), images.base_url, revalidate_after_s=0)
+    before = annotate(downloader, brochures("/b.png"))[0][0]["thumbnail_hash"]
+
+    images.images["/b.png"] = b"\x89PNG new b"
+    downloader.start_run()
+    after = annotate(downloader, brochures("/b.png"))[0][0]["thumbnail_hash"]
+    assert before != after and downloader.stats["downloaded"] == 2
+
+
+def test_failed_or_missing_thumbnails_leave_the_brochure_without_path(tmp_path, images):
+    downloader = ThumbnailDownloader(ThumbnailStore(str(tmp_path / "thumbnails")), images.base_url)
+    annotated = annotate(downloader, brochures("/gone.jpg", "Not found", "/a.jpg"))[0]
+
+    assert [brochure["thumbnail_path"] is None for brochure in annotated] == [True, True, False]
+    assert downloader.stats["failed"] == 1
+    assert "/gone.jpg" in [path for path, _ in images.requests]
+
+
+def test_corrupted_index_starts_empty(tmp_path):
+    store_dir = tmp_path / "thumbnails"
+    store_dir.mkdir()
+    (store_dir / "index.json").write_text("{", encoding="utf-8")
+    store = ThumbnailStore(str(store_dir))
+    assert store.entry("http://img.example/a.jpg") is None
+
+    entry = store.put("http://img.example/a.jpg", b"data", None)
+    assert entry["new"] and entry["path"].endswith(".jpg")
+    # an entry whose object was deleted is treated as unknown
+    os.remove(entry["path"])
+    assert store.entry("http://img.example/a.jpg") is None